@@ -0,0 +1,128 @@
+# accounts/authentication.py
+# 每個API都要驗證token，DRF原本每次都會join authtoken_token跟auth_user查一次
+# 這裡先查process內的LRU，再查Django cache，都沒有才查資料庫
+# LRU只在Django cache是共用的(Redis、檔案)時才開，不然撤銷token時其他worker的LRU清不掉
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+
+from health_cats.caching import cache_is_shared
+from health_cats.metrics import timed
+
+CACHE_PREFIX = 'auth-token'
+# 任何token被撤銷就+1，各process的LRU看到世代變了就整個清掉
+GENERATION_KEY = f'{CACHE_PREFIX}:generation'
+# 每隔幾秒才去共用快取看一次世代，LRU命中時不用每個request都連Redis；其他process撤銷的token最多晚這麼久失效
+GENERATION_CHECK_INTERVAL = 1.0
+
+
+class TokenCache:
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._generation = None
+        self._generation_checked = float('-inf')
+        self._lock = threading.Lock()
+        self.stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'evictions': 0}
+
+    def _shared_key(self, key):
+        return f'{CACHE_PREFIX}:{key}'
+
+    def _sync_generation(self, now):
+        # 讀共用快取不拿鎖，其他執行緒不用排隊等網路
+        if now < self._generation_checked + GENERATION_CHECK_INTERVAL:
+            return
+        generation = cache.get(GENERATION_KEY, 0)
+        with self._lock:
+            self._generation_checked = now
+            if generation != self._generation:
+                self._entries.clear()
+                self._generation = generation
+
+    def get(self, key):
+        now = time.monotonic()
+        if not cache_is_shared():
+            value = cache.get(self._shared_key(key))
+            with self._lock:
+                self.stats['shared_hits' if value is not None else 'misses'] += 1
+            return value
+        self._sync_generation(now)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.stats['local_hits'] += 1
+                return entry[1]
+            self._entries.pop(key, None)
+
+        value = cache.get(self._shared_key(key))
+        with self._lock:
+            if value is None:
+                self.stats['misses'] += 1
+                return None
+            self.stats['shared_hits'] += 1
+            self._store_local(key, value, now)
+        return value
+
+    def set(self, key, value):
+        cache.set(self._shared_key(key), value, self.ttl)
+        if cache_is_shared():
+            with self._lock:
+                self._store_local(key, value, time.monotonic())
+
+    def _store_local(self, key, value, now):
+        self._entries[key] = (now + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def evict(self, keys):
+        keys = list(keys)
+        if not keys:
+            return
+        cache.delete_many([self._shared_key(key) for key in keys])
+        try:
+            cache.incr(GENERATION_KEY)
+        except ValueError:
+            cache.add(GENERATION_KEY, 1, None)
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+            self.stats['evictions'] += len(keys)
+
+    def snapshot(self):
+        with self._lock:
+            return {**self.stats, 'size': len(self._entries), 'max_size': self.max_size, 'ttl': self.ttl}
+
+
+token_cache = TokenCache(
+    max_size=settings.AUTH_TOKEN_CACHE.get('MAX_SIZE', 10000),
+    ttl=settings.AUTH_TOKEN_CACHE.get('TTL', 300),
+)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    # 用法跟TokenAuthentication一樣(Authorization: Token xxx)
+    # token刪除、使用者停用時由accounts/signals.py立刻清掉快取
+
+    def authenticate(self, request):
+        with timed('auth'):
+            return super().authenticate(request)
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is None:
+            cached = super().authenticate_credentials(key)
+            token_cache.set(key, cached)
+        # LRU裡同一個User會給不同執行緒的request用，每個request拿一份自己的
+        user, token = (copy.copy(obj) for obj in cached)
+        token.user = user
+        return user, token
@@ -2,8 +2,9 @@
 
 from rest_framework import serializers
 from .models import Profile
+from health_cats.metrics import TimedSerializerMixin
 
-class ProfileSerializer(serializers.ModelSerializer):
+class ProfileSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     # 先把user欄位設為唯讀,考慮看看要不要直接用username做資料
     user = serializers.StringRelatedField(read_only=True)
 
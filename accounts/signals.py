@@ -0,0 +1,19 @@
+# accounts/signals.py
+
+from django.contrib.auth.models import User
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import token_cache
+
+
+@receiver([post_save, post_delete], sender=Token)
+def token_changed(sender, instance, **kwargs):
+    token_cache.evict([instance.key])
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, **kwargs):
+    # 快取裡存的是整個User，資料有改(停用、改密碼等)都要重新載入
+    token_cache.evict(Token.objects.filter(user=instance).values_list('key', flat=True))
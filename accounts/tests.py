@@ -1,3 +1,100 @@
-from django.test import TestCase
+import shutil
+import tempfile
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from .authentication import GENERATION_CHECK_INTERVAL, GENERATION_KEY, CachedTokenAuthentication, token_cache
+
+
+def use_shared_cache(test):
+    # 檔案快取是多個process共用的，process內的LRU才會開；測試結束刪掉快取目錄
+    location = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, location, ignore_errors=True)
+    settings_override = override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': location,
+    }})
+    settings_override.enable()
+    test.addCleanup(settings_override.disable)
+
+
+class CachedTokenAuthenticationTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='owner', password='pw')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def pet_type_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/pet-types/')
+        return response.status_code, [q['sql'] for q in ctx.captured_queries if 'authtoken_token' in q['sql']]
+
+    def test_second_request_skips_token_query(self):
+        self.assertEqual(len(self.pet_type_queries()[1]), 1)
+        self.assertEqual(self.pet_type_queries(), (200, []))
+
+    def test_deleted_token_evicted(self):
+        self.pet_type_queries()
+        self.token.delete()
+        self.assertEqual(self.pet_type_queries()[0], 401)
+
+    def test_deactivated_user_evicted(self):
+        self.pet_type_queries()
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.pet_type_queries()[0], 401)
+
+    def test_lru_bounded(self):
+        use_shared_cache(self)
+        original = token_cache.max_size
+        token_cache.max_size = 1
+        self.addCleanup(setattr, token_cache, 'max_size', original)
+        token_cache.set('a', 1)
+        token_cache.set('b', 2)
+        self.assertEqual(token_cache.snapshot()['size'], 1)
+
+    def test_shared_cache_evicts_revoked_token(self):
+        use_shared_cache(self)
+        self.pet_type_queries()
+        self.assertEqual(self.pet_type_queries(), (200, []))
+        self.assertGreater(token_cache.snapshot()['local_hits'], 0)
+        self.token.delete()
+        self.assertEqual(self.pet_type_queries()[0], 401)
+
+    def test_local_hit_checks_generation_once_per_interval(self):
+        use_shared_cache(self)
+        token_cache.set('k', 1)
+        token_cache.get('k')
+        with mock.patch('accounts.authentication.cache') as shared:
+            self.assertEqual(token_cache.get('k'), 1)
+        shared.get.assert_not_called()
+
+        # 其他process撤銷了token：過了間隔才看到新的世代，整個LRU清掉
+        cache.delete(token_cache._shared_key('k'))
+        cache.set(GENERATION_KEY, 99, None)
+        later = time.monotonic() + GENERATION_CHECK_INTERVAL + 1
+        with mock.patch('accounts.authentication.time.monotonic', return_value=later):
+            self.assertIsNone(token_cache.get('k'))
+
+    def test_no_local_lru_without_shared_cache(self):
+        size = token_cache.snapshot()['size']
+        token_cache.set('local-only', 1)
+        self.assertEqual(token_cache.snapshot()['size'], size)
+
+    def test_each_request_gets_its_own_user(self):
+        auth = CachedTokenAuthentication()
+        first, _ = auth.authenticate_credentials(self.token.key)
+        second, token = auth.authenticate_credentials(self.token.key)
+        self.assertEqual(first.pk, second.pk)
+        self.assertIsNot(first, second)
+        self.assertIs(token.user, second)
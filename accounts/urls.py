@@ -2,10 +2,11 @@
 
 from django.urls import path
 from rest_framework.authtoken.views import obtain_auth_token
-from .views import ProfileDetailView
+from .views import ProfileDetailView, AuthCacheStatsView
 
 urlpatterns = [
     # obtain_auth_token負責處理POST
     path('login/', obtain_auth_token, name='api-login'),
     path('profile/', ProfileDetailView.as_view(), name='api-profile'),
+    path('auth-cache-stats/', AuthCacheStatsView.as_view(), name='api-auth-cache-stats'),
 ]
\ No newline at end of file
@@ -1,6 +1,9 @@
 # accounts/views.py
 
 from rest_framework import generics, permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from .authentication import token_cache
 from .models import Profile
 from .serializers import ProfileSerializer
 
@@ -16,4 +19,14 @@ class ProfileDetailView(generics.RetrieveUpdateAPIView):
 
         # 嘗試取得Profile，如果不存在就create new Profile
         obj, created = Profile.objects.get_or_create(user=self.request.user)
-        return obj
\ No newline at end of file
+        return obj
+
+
+class AuthCacheStatsView(APIView):
+
+    # token驗證快取的命中統計，只給管理員看(數字是這個process的)
+
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(token_cache.snapshot())
@@ -0,0 +1,72 @@
+# benchmarks/wsgi_vs_asgi.py
+# 比較同步(WSGI)與async(ASGI)讀取API在多個同時連線下的吞吐量
+#
+# 先各開一個server(設定見README「部署: ASGI」)，例如:
+#   gunicorn health_cats.wsgi:application -w 4 -b 127.0.0.1:8000
+#   gunicorn health_cats.asgi:application -w 4 -k uvicorn_worker.UvicornWorker -b 127.0.0.1:8001
+# 再執行:
+#   python benchmarks/wsgi_vs_asgi.py --token <token> --pet 1 --clients 50 --requests 20
+
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+PATHS = [
+    'pets/',
+    'pets/{pet}/',
+    'pets/{pet}/weight-logs/',
+    'pets/{pet}/health-logs/',
+    'pets/{pet}/injection-logs/',
+]
+
+
+def run_client(base_url, token, pet, count):
+    session = requests.Session()
+    session.headers['Authorization'] = f'Token {token}'
+    latencies = []
+    errors = 0
+    for i in range(count):
+        url = base_url + PATHS[i % len(PATHS)].format(pet=pet)
+        start = time.perf_counter()
+        response = session.get(url)
+        latencies.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            errors += 1
+    return latencies, errors
+
+
+def bench(label, base_url, args):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as executor:
+        results = list(executor.map(
+            lambda _: run_client(base_url, args.token, args.pet, args.requests),
+            range(args.clients)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for client_latencies, _ in results for latency in client_latencies)
+    errors = sum(client_errors for _, client_errors in results)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f'{label:6} {len(latencies) / elapsed:8.1f} req/s   '
+          f'p50 {statistics.median(latencies) * 1000:7.1f} ms   p95 {p95 * 1000:7.1f} ms   errors {errors}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='比較WSGI與ASGI讀取API的吞吐量')
+    parser.add_argument('--wsgi', default='http://127.0.0.1:8000/api/', help='同步版API的base URL')
+    parser.add_argument('--asgi', default='http://127.0.0.1:8001/api/async/', help='async版API的base URL')
+    parser.add_argument('--token', required=True)
+    parser.add_argument('--pet', type=int, required=True, help='要測的寵物id(要屬於token的使用者)')
+    parser.add_argument('--clients', type=int, default=50, help='同時連線數')
+    parser.add_argument('--requests', type=int, default=20, help='每個連線送幾次')
+    args = parser.parse_args()
+
+    print(f'{args.clients} clients x {args.requests} requests')
+    bench('WSGI', args.wsgi, args)
+    bench('ASGI', args.asgi, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,12 @@
+# health_cats/caching.py
+# process內的快取(token LRU、物種目錄)要靠共用的Django cache通知失效
+# 設定成LocMemCache/DummyCache時每個worker各有一份，通知不到其他worker，就不要開process內的快取
+
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+
+def cache_is_shared():
+    # 每次都看目前的設定，override_settings(CACHES=...)也會跟著變
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
@@ -0,0 +1,117 @@
+# health_cats/db_router.py
+# 讀寫分離：pets、accounts的讀取走副本(settings.DATABASE_REPLICAS)，寫入一律走主庫
+# 使用者寫入後REPLICA_STICKY_SECONDS秒內的讀取都留在主庫，避免副本延遲讀不到自己剛寫的資料
+
+import hashlib
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+ROUTED_APP_LABELS = {'pets', 'accounts'}
+UNSAFE_METHODS = {'POST', 'PUT', 'PATCH', 'DELETE'}
+STICKY_CACHE_PREFIX = 'db-sticky'
+
+# 這個request是否要固定讀主庫(請求剛開始時由middleware決定，期間有寫入也會設成True)
+_pinned_to_primary = ContextVar('pinned_to_primary', default=False)
+# 連不上的副本先跳過一段時間 {alias: 可以再試的時間}
+_replica_down_until = {}
+
+
+def pin_to_primary():
+    _pinned_to_primary.set(True)
+
+
+def _replica_is_healthy(alias):
+    if _replica_down_until.get(alias, 0) > time.monotonic():
+        return False
+    try:
+        # 持久連線(CONN_MAX_AGE)已經開著的話不會再連一次
+        connections[alias].ensure_connection()
+    except DatabaseError:
+        _replica_down_until[alias] = time.monotonic() + getattr(settings, 'REPLICA_RETRY_SECONDS', 30)
+        return False
+    _replica_down_until.pop(alias, None)
+    return True
+
+
+class PrimaryReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label not in ROUTED_APP_LABELS or _pinned_to_primary.get():
+            return DEFAULT_DB_ALIAS
+        replicas = list(getattr(settings, 'DATABASE_REPLICAS', []))
+        random.shuffle(replicas)
+        for alias in replicas:
+            if _replica_is_healthy(alias):
+                return alias
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # 同一個request後面的讀取也要看得到這次寫入
+        pin_to_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # 副本跟主庫是同一份資料
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # 副本的schema由資料庫複寫同步，不在副本上跑migration
+        return db not in getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+class ReplicaStickinessMiddleware:
+    # 用Authorization header分辨同一個使用者(token)
+    # 寫入成功就在快取記一筆，期限內這個token的請求都讀主庫
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        key = self._sticky_key(request)
+        reset = _pinned_to_primary.set(bool(key and cache.get(key)))
+        try:
+            response = self.get_response(request)
+            if self._wrote(key, request, response):
+                cache.set(key, True, self._sticky_seconds())
+        finally:
+            _pinned_to_primary.reset(reset)
+        return response
+
+    async def __acall__(self, request):
+        # ASGI：快取用async API，不要在event loop上做blocking I/O
+        key = self._sticky_key(request)
+        reset = _pinned_to_primary.set(bool(key and await cache.aget(key)))
+        try:
+            response = await self.get_response(request)
+            if self._wrote(key, request, response):
+                await cache.aset(key, True, self._sticky_seconds())
+        finally:
+            _pinned_to_primary.reset(reset)
+        return response
+
+    @staticmethod
+    def _sticky_key(request):
+        authorization = request.headers.get('Authorization')
+        if not authorization:
+            return None
+        return f'{STICKY_CACHE_PREFIX}:{hashlib.sha256(authorization.encode()).hexdigest()}'
+
+    @staticmethod
+    def _wrote(key, request, response):
+        return key and request.method in UNSAFE_METHODS and response.status_code < 400
+
+    @staticmethod
+    def _sticky_seconds():
+        return getattr(settings, 'REPLICA_STICKY_SECONDS', 5)
@@ -0,0 +1,207 @@
+# health_cats/metrics.py
+# 每個request的效能紀錄：SQL次數與時間、token驗證、serializer、回應大小
+# 抽樣到的request會帶Server-Timing header，並依路由名稱(例如 pet-weight-logs-list)累積延遲直方圖，
+# 由 /metrics 輸出Prometheus文字格式(數字是每個process各自的)
+
+import hmac
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# 目前request的紀錄，沒被抽樣時是None，所有計時都直接略過
+_current = ContextVar('perf_record', default=None)
+
+
+class RequestRecord:
+
+    def __init__(self):
+        self.timings = {'db': 0.0, 'auth': 0.0, 'serialize': 0.0}
+        self.queries = 0
+        self._depth = {}
+
+    def enter(self, name):
+        self._depth[name] = self._depth.get(name, 0) + 1
+        return self._depth[name] == 1
+
+    def exit(self, name, elapsed, outermost):
+        self._depth[name] -= 1
+        if outermost:
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed
+
+
+@contextmanager
+def timed(name):
+    # 巢狀呼叫(例如serializer裡再包serializer)只算最外層
+    record = _current.get()
+    if record is None:
+        yield
+        return
+    outermost = record.enter(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record.exit(name, time.perf_counter() - start, outermost)
+
+
+class TimedSerializerMixin:
+    # 放在serializer的最前面，把to_representation的時間算進serialize
+
+    def to_representation(self, instance):
+        with timed('serialize'):
+            return super().to_representation(instance)
+
+
+def _query_timer(execute, sql, params, many, context):
+    record = _current.get()
+    if record is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        record.timings['db'] += time.perf_counter() - start
+        record.queries += 1
+
+
+@receiver(connection_created)
+def install_query_timer(sender, connection, **kwargs):
+    # 每條資料庫連線建立時裝一次，async view在別的執行緒跑ORM也算得到
+    if _query_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_query_timer)
+
+
+class RouteMetrics:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def observe(self, route, method, duration, record, size):
+        with self._lock:
+            stats = self._routes.setdefault((route, method), {
+                'buckets': [0] * len(LATENCY_BUCKETS), 'count': 0, 'sum': 0.0,
+                'db_seconds': 0.0, 'queries': 0, 'response_bytes': 0,
+            })
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if duration <= bound:
+                    stats['buckets'][i] += 1
+            stats['count'] += 1
+            stats['sum'] += duration
+            stats['db_seconds'] += record.timings['db']
+            stats['queries'] += record.queries
+            stats['response_bytes'] += size
+
+    def render(self):
+        lines = [
+            '# HELP health_cats_request_duration_seconds Sampled request latency by route.',
+            '# TYPE health_cats_request_duration_seconds histogram',
+        ]
+        with self._lock:
+            routes = sorted(self._routes.items())
+            for (route, method), stats in routes:
+                labels = f'route="{route}",method="{method}"'
+                for bound, count in zip(LATENCY_BUCKETS, stats['buckets']):
+                    lines.append(f'health_cats_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'health_cats_request_duration_seconds_bucket{{{labels},le="+Inf"}} {stats["count"]}')
+                lines.append(f'health_cats_request_duration_seconds_sum{{{labels}}} {stats["sum"]:.6f}')
+                lines.append(f'health_cats_request_duration_seconds_count{{{labels}}} {stats["count"]}')
+            for name, key, help_text in (
+                ('health_cats_db_seconds_total', 'db_seconds', 'Time spent in SQL for sampled requests.'),
+                ('health_cats_db_queries_total', 'queries', 'SQL queries issued by sampled requests.'),
+                ('health_cats_response_bytes_total', 'response_bytes', 'Response body bytes of sampled requests.'),
+            ):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} counter')
+                for (route, method), stats in routes:
+                    lines.append(f'{name}{{route="{route}",method="{method}"}} {stats[key]}')
+        return '\n'.join(lines) + '\n'
+
+
+route_metrics = RouteMetrics()
+
+
+class PerformanceMiddleware:
+    # 放在MIDDLEWARE最前面，total才包含其他middleware
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        # 這個module載入前就已經開好的連線也要補裝
+        for conn in connections.all(initialized_only=True):
+            if conn.connection is not None:
+                install_query_timer(None, conn)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self._sampled():
+            return self.get_response(request)
+        record = RequestRecord()
+        reset = _current.set(record)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(reset)
+        return self._finish(request, response, record, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        if not self._sampled():
+            return await self.get_response(request)
+        record = RequestRecord()
+        reset = _current.set(record)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(reset)
+        return self._finish(request, response, record, time.perf_counter() - start)
+
+    @staticmethod
+    def _sampled():
+        rate = getattr(settings, 'PERF_SAMPLE_RATE', 0)
+        return rate >= 1 or (rate > 0 and random.random() < rate)
+
+    @staticmethod
+    def _finish(request, response, record, duration):
+        size = 0 if response.streaming else len(response.content)
+        timings = record.timings
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={timings["db"] * 1000:.1f};desc="{record.queries} queries"',
+            f'auth;dur={timings["auth"] * 1000:.1f}',
+            f'serialize;dur={timings["serialize"] * 1000:.1f}',
+            f'total;dur={duration * 1000:.1f}',
+        ])
+        match = getattr(request, 'resolver_match', None)
+        route = (match.url_name or match.view_name) if match else 'unmatched'
+        if route != 'metrics':
+            route_metrics.observe(route, request.method, duration, record, size)
+        return response
+
+
+def metrics_view(request):
+    # 要帶 Authorization: Bearer <PERF_METRICS_TOKEN>；沒設token時只有DEBUG可以看
+    # (Nginx轉過來的request都是127.0.0.1，不能用來源IP判斷)
+    token = getattr(settings, 'PERF_METRICS_TOKEN', '')
+    if token:
+        allowed = hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    else:
+        allowed = settings.DEBUG
+    if not allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(route_metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -44,7 +46,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # 效能紀錄(Server-Timing、/metrics)，放最前面才量得到整個request
+    'health_cats.metrics.PerformanceMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    # 讀寫分離：寫入後短時間內讀主庫
+    'health_cats.db_router.ReplicaStickinessMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -78,13 +84,30 @@ WSGI_APPLICATION = 'health_cats.wsgi.application'
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
 # DEMO就先用sqlite3了
+# 持久連線，重用前先確認連線還活著
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# 讀取副本的alias(要另外加在DATABASES裡，正式機在local_settings.py設定)
+# pets、accounts的讀取會分散到這些副本，寫入與寫入後的讀取走default
+DATABASE_REPLICAS = []
+DATABASE_ROUTERS = ['health_cats.db_router.PrimaryReplicaRouter']
+# 使用者寫入後幾秒內的讀取固定走主庫
+REPLICA_STICKY_SECONDS = 5
+# 副本連不上時，隔幾秒再試
+REPLICA_RETRY_SECONDS = 30
+
+# 效能紀錄的抽樣比例(0~1)，0就完全不量
+PERF_SAMPLE_RATE = float(os.getenv('PERF_SAMPLE_RATE', '0.1'))
+# /metrics 的Bearer token，沒設只允許本機存取
+PERF_METRICS_TOKEN = os.getenv('PERF_METRICS_TOKEN', '')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -127,6 +150,17 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static_root')
 # 使用者上傳資料
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# 產生縮圖的背景執行緒數量，0表示在request裡直接做
+IMAGE_PIPELINE_WORKERS = 2
+
+# 健康日誌照片分段上傳，暫存目錄要跟MEDIA_ROOT在同一個磁碟才能直接搬檔
+CHUNKED_UPLOAD_DIR = os.path.join(BASE_DIR, 'upload_tmp')
+CHUNKED_UPLOAD_MAX_CHUNK_SIZE = 5 * 1024 * 1024
+# 一次上傳最多幾段、全部加起來最大幾bytes，避免一個client把硬碟塞滿
+CHUNKED_UPLOAD_MAX_CHUNKS = 100
+CHUNKED_UPLOAD_MAX_TOTAL_SIZE = 50 * 1024 * 1024
+# 超過這麼久(秒)沒有動靜的上傳由cleanup_upload_sessions清掉
+CHUNKED_UPLOAD_EXPIRY = 60 * 60 * 24
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
@@ -148,7 +182,7 @@ CORS_ALLOW_HEADERS = [
 REST_FRAMEWORK = {
     # 設定預設的驗證方式 -> Token
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'accounts.authentication.CachedTokenAuthentication',
     ],
     # 所有API都必須登入才能存取
     'DEFAULT_PERMISSION_CLASSES': [
@@ -156,7 +190,33 @@ REST_FRAMEWORK = {
     ]
 }
 
+# 快取要所有worker共用，token撤銷、物種目錄更新時其他worker才會立刻看到(health_cats/caching.py)
+# CACHE_BACKEND=redis(要設REDIS_URL)、file(DJANGO_CACHE_DIR)，沒設就是process內的locmem(開發、測試用)
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+if CACHE_BACKEND == 'redis':
+    if not os.environ.get('REDIS_URL'):
+        raise ImproperlyConfigured('CACHE_BACKEND=redis要設REDIS_URL')
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                          'LOCATION': os.environ['REDIS_URL']}}
+elif CACHE_BACKEND == 'file':
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                          'LOCATION': os.environ.get('DJANGO_CACHE_DIR', os.path.join(BASE_DIR, 'django_cache'))}}
+elif CACHE_BACKEND == 'locmem':
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+else:
+    raise ImproperlyConfigured(f'CACHE_BACKEND只能是redis、file或locmem，不是{CACHE_BACKEND!r}')
+
+# token驗證快取：process內LRU最多幾筆、多久(秒)後要重新查資料庫
+AUTH_TOKEN_CACHE = {
+    'MAX_SIZE': 10000,
+    'TTL': 300,
+}
+
 try:
     from .local_settings import *
 except ImportError:
     pass
+
+# 沒有local_settings.py時(本機開發、跑測試)給一個開發用的key，正式機DEBUG=False不會用到
+if not SECRET_KEY and DEBUG:
+    SECRET_KEY = 'django-insecure-local-development-only'
@@ -0,0 +1,117 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from rest_framework.authtoken.models import Token
+
+from pets.models import Pet
+
+from . import db_router, metrics
+from .db_router import PrimaryReplicaRouter, ReplicaStickinessMiddleware
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_STICKY_SECONDS=5)
+class PrimaryReplicaRouterTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.router = PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+        token = db_router._pinned_to_primary.set(False)
+        self.addCleanup(db_router._pinned_to_primary.reset, token)
+        patcher = mock.patch.object(db_router, '_replica_is_healthy', return_value=True)
+        self.healthy = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reads_go_to_replica_and_writes_to_primary(self):
+        self.assertEqual(self.router.db_for_read(Pet), 'replica')
+        self.assertEqual(self.router.db_for_read(User), 'default')
+        self.assertEqual(self.router.db_for_write(Pet), 'default')
+        # 同一個request寫入之後就讀主庫
+        self.assertEqual(self.router.db_for_read(Pet), 'default')
+
+    def test_unhealthy_replica_falls_back_to_primary(self):
+        self.healthy.return_value = False
+        self.assertEqual(self.router.db_for_read(Pet), 'default')
+
+    def test_no_migrations_on_replica(self):
+        self.assertFalse(self.router.allow_migrate('replica', 'pets'))
+        self.assertTrue(self.router.allow_migrate('default', 'pets'))
+
+    def test_reads_stick_to_primary_after_write(self):
+        seen = []
+
+        def view(request):
+            seen.append(self.router.db_for_read(Pet))
+            return HttpResponse(status=201 if request.method == 'POST' else 200)
+
+        middleware = ReplicaStickinessMiddleware(view)
+        headers = {'HTTP_AUTHORIZATION': 'Token abc'}
+        middleware(self.factory.get('/api/pets/', **headers))
+        middleware(self.factory.post('/api/pets/', **headers))
+        middleware(self.factory.get('/api/pets/', **headers))
+        middleware(self.factory.get('/api/pets/', HTTP_AUTHORIZATION='Token other'))
+        self.assertEqual(seen, ['replica', 'replica', 'default', 'replica'])
+
+    async def test_async_requests_use_async_cache(self):
+        seen = []
+
+        async def view(request):
+            seen.append(self.router.db_for_read(Pet))
+            return HttpResponse(status=201 if request.method == 'POST' else 200)
+
+        shared = mock.Mock()
+        shared.aget = mock.AsyncMock(side_effect=[None, None, True])
+        shared.aset = mock.AsyncMock()
+        middleware = ReplicaStickinessMiddleware(view)
+        headers = {'HTTP_AUTHORIZATION': 'Token abc'}
+        with mock.patch.object(db_router, 'cache', shared):
+            for request in (self.factory.get('/api/pets/', **headers), self.factory.post('/api/pets/', **headers),
+                            self.factory.get('/api/pets/', **headers)):
+                await middleware(request)
+        self.assertEqual(seen, ['replica', 'replica', 'default'])
+        self.assertEqual(shared.aset.await_count, 1)
+        # event loop上不能呼叫blocking的get/set
+        shared.get.assert_not_called()
+        shared.set.assert_not_called()
+
+
+@override_settings(PERF_SAMPLE_RATE=1, PERF_METRICS_TOKEN='')
+class PerformanceMiddlewareTests(TestCase):
+
+    def setUp(self):
+        metrics.route_metrics = metrics.RouteMetrics()
+        user = User.objects.create_user('perf', password='pw')
+        self.token = Token.objects.create(user=user)
+
+    def test_server_timing_and_route_histogram(self):
+        response = self.client.get('/api/pets/', HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(response.status_code, 200)
+        timing = response['Server-Timing']
+        for name in ('db;', 'auth;', 'serialize;', 'total;'):
+            self.assertIn(name, timing)
+        self.assertNotIn('desc="0 queries"', timing)
+
+        with self.settings(DEBUG=True):
+            body = self.client.get('/metrics').content.decode()
+        self.assertIn('health_cats_request_duration_seconds_count{route="pet-list",method="GET"} 1', body)
+        self.assertIn('health_cats_db_queries_total{route="pet-list",method="GET"}', body)
+
+    @override_settings(PERF_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_untouched(self):
+        response = self.client.get('/api/pets/', HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertNotIn('Server-Timing', response)
+
+    def test_metrics_endpoint_closed_without_token(self):
+        # Nginx轉過來的都是本機IP，沒設token不能因為是127.0.0.1就放行
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='127.0.0.1').status_code, 403)
+        with self.settings(DEBUG=True):
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    @override_settings(PERF_METRICS_TOKEN='secret')
+    def test_metrics_endpoint_requires_token_when_configured(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
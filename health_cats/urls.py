@@ -18,10 +18,14 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from health_cats.metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     path('api/accounts/', include('accounts.urls')),
+    # async版的讀取API，要用ASGI(uvicorn)跑才有效果
+    path('api/async/', include('pets.async_urls')),
     path('api/',include('pets.urls')),
 ]
 
@@ -1,7 +1,8 @@
 # pets/admin.py
 
 from django.contrib import admin
-from .models import Pet, PetType, PetSpecies, WeightLog, HealthLog, InjectionLog
+from .models import Pet, PetType, PetSpecies, WeightLog, HealthLog, InjectionLog, InjectionInterval, InjectionReminder, \
+    LogArchive, GrowthCurve
 
 # 註冊模型
 admin.site.register(PetType)
@@ -9,4 +10,21 @@ admin.site.register(PetSpecies)
 admin.site.register(Pet)
 admin.site.register(WeightLog)
 admin.site.register(HealthLog)
-admin.site.register(InjectionLog)
\ No newline at end of file
+admin.site.register(InjectionLog)
+admin.site.register(InjectionInterval)
+admin.site.register(InjectionReminder)
+
+
+@admin.register(LogArchive)
+class LogArchiveAdmin(admin.ModelAdmin):
+    # payload是壓縮過的二進位，不顯示
+    list_display = ('pet', 'kind', 'first_date', 'last_date', 'row_count', 'created_at')
+    exclude = ('payload',)
+
+
+@admin.register(GrowthCurve)
+class GrowthCurveAdmin(admin.ModelAdmin):
+    # 批次算出來的，不在後台改
+    list_display = ('species', 'age_months', 'pet_count', 'computed_at')
+    list_filter = ('species',)
+    readonly_fields = ('species', 'age_months', 'pet_count', 'quantiles', 'computed_at')
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 class PetsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'pets'
+
+    def ready(self):
+        # 註冊signals
+        from . import signals  # noqa: F401
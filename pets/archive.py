@@ -0,0 +1,311 @@
+# pets/archive.py
+# 冷資料封存：把舊日誌壓成每隻寵物一包包的LogArchive，熱資料表跟索引只留常用的
+# 封存/還原不經過signal(直接刪除/bulk_create)：
+#   - 每隻寵物最新的體重、每種施打類型最新的一筆、未結案的健康日誌都不封存，
+#     所以PetSummary跟提醒排程只看熱資料表就對了，不用改
+#   - 健康日誌的全文搜尋索引在這裡自己移除/補回，體重圖表的快取在這裡清掉
+# 巢狀日誌API的列表與單筆讀取會把封存的資料一起讀出來(ArchiveReadMixin)；
+# 體重圖表(series.py)、全文搜尋(search.py)、時間軸(timeline.py)、async版列表也會合併封存的資料
+
+import base64
+import hashlib
+import heapq
+import json
+import zlib
+from datetime import datetime, time, timezone as dt_timezone
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models.fields.files import FieldFile
+from django.db import connection, transaction
+from django.db.models import Q
+from django.http import Http404
+from rest_framework.exceptions import NotFound, ParseError
+from rest_framework.response import Response
+
+from .models import ChangeCounter, LogArchive, Pet, WeightLog, HealthLog, InjectionLog, InjectionReminder
+from .search import FTS_TABLE, fts_available
+from .series import invalidate_weight_series
+from .summaries import touch
+
+ARCHIVE_BATCH_SIZE = 1000
+
+# 類型 -> (model, 排序欄位, 每個分組最新一筆不封存的分組欄位；None表示不保留)
+ARCHIVE_KINDS = {
+    'weight': (WeightLog, 'recorded_at', ()),
+    'health': (HealthLog, 'created_at', None),
+    'injection': (InjectionLog, 'injection_date', ('injection_type',)),
+}
+
+
+def _day(value):
+    # 封存包的日期範圍：datetime一律用UTC日期
+    if isinstance(value, datetime):
+        return value.astimezone(dt_timezone.utc).date()
+    return value
+
+
+def _upper_bound(archive, date_field):
+    # 這一包裡所有紀錄的排序欄位都 <= 這個值
+    if date_field == 'created_at':
+        return datetime.combine(archive.last_date, time.max, tzinfo=dt_timezone.utc)
+    return archive.last_date
+
+
+def _plain(value):
+    # 檔案欄位只存路徑
+    return value.name if isinstance(value, FieldFile) else value
+
+
+class _ArchiveEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder會把時間截到毫秒，合併排序、還原都要原本的時間
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def pack(model, instances):
+    fields = model._meta.concrete_fields
+    lines = [json.dumps({f.attname: _plain(getattr(obj, f.attname)) for f in fields},
+                        cls=_ArchiveEncoder, ensure_ascii=False, sort_keys=True)
+             for obj in instances]
+    raw = '\n'.join(lines).encode()
+    return zlib.compress(raw), hashlib.sha256(raw).hexdigest()
+
+
+def unpack(archive, verify=False):
+    # 回傳未存檔的model instance list(有原本的pk)
+    model = ARCHIVE_KINDS[archive.kind][0]
+    raw = zlib.decompress(bytes(archive.payload))
+    if verify and hashlib.sha256(raw).hexdigest() != archive.checksum:
+        raise ValueError('checksum不符')
+    fields = {f.attname: f for f in model._meta.concrete_fields}
+    instances = []
+    for line in raw.decode().splitlines():
+        row = json.loads(line)
+        instances.append(model(**{name: fields[name].to_python(value) for name, value in row.items()}))
+    return instances
+
+
+def _kept_ids(model, date_field, pet_id, group_fields):
+    # 每個分組最新的一筆留在熱資料表
+    if group_fields is None:
+        return set()
+    logs = model.objects.filter(pet_id=pet_id).order_by(f'-{date_field}', '-id')
+    if not group_fields:
+        return set(logs.values_list('pk', flat=True)[:1])
+    kept = set()
+    for group in logs.values(*group_fields).distinct().order_by():
+        kept.update(logs.filter(**group).values_list('pk', flat=True)[:1])
+    return kept
+
+
+def archive_pet_logs(pet_id, kind, cutoff, batch_size=ARCHIVE_BATCH_SIZE):
+    # 把一隻寵物排序欄位早於cutoff的日誌封存，每batch_size筆一包，回傳封存筆數
+    model, date_field, group_fields = ARCHIVE_KINDS[kind]
+    logs = (model.objects.filter(pet_id=pet_id, **{f'{date_field}__lt': cutoff})
+            .exclude(pk__in=_kept_ids(model, date_field, pet_id, group_fields))
+            .order_by(date_field, 'id'))
+    if kind == 'health':
+        # 還在追蹤的、正在分段上傳照片的不封存
+        logs = logs.filter(case_closed=True, upload_sessions__isnull=True)
+
+    archived = 0
+    while True:
+        batch = list(logs[:batch_size])
+        if not batch:
+            break
+        payload, checksum = pack(model, batch)
+        ids = [log.pk for log in batch]
+        days = [_day(getattr(log, date_field)) for log in batch]
+        with transaction.atomic():
+            LogArchive.objects.create(
+                pet_id=pet_id, kind=kind, first_date=min(days), last_date=max(days),
+                min_log_id=min(ids), max_log_id=max(ids), row_count=len(batch),
+                payload=payload, checksum=checksum,
+            )
+            if kind == 'injection':
+                # 舊紀錄的提醒早就處理過了，跟著刪掉
+                InjectionReminder.objects.filter(injection_log_id__in=ids).delete()
+            if kind == 'health' and fts_available():
+                with connection.cursor() as cursor:
+                    cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({", ".join(["%s"] * len(ids))})', ids)
+            # 不跑post_delete：主頁統計、快取都不受影響(最新一筆沒有被封存)
+            model.objects.filter(pk__in=ids)._raw_delete(connection.alias)
+        archived += len(batch)
+    if archived:
+        touch(pet_id)
+        if kind == 'weight':
+            invalidate_weight_series(pet_id)
+    return archived
+
+
+def restore_pet_logs(pet_id, kind=None):
+    # 把封存的日誌放回熱資料表(保留原本的id)，回傳還原筆數
+    # 同步序號要換新的：已經同步過封存當時序號的App才拿得到這些紀錄
+    archives = LogArchive.objects.filter(pet_id=pet_id)
+    if kind:
+        archives = archives.filter(kind=kind)
+    owner_id = Pet.objects.filter(pk=pet_id).values_list('owner_id', flat=True).first()
+    restored = 0
+    for archive in archives.order_by('pk'):
+        model = ARCHIVE_KINDS[archive.kind][0]
+        instances = unpack(archive, verify=True)
+        with transaction.atomic():
+            change_seq = ChangeCounter.next(owner_id)
+            for log in instances:
+                log.change_seq = change_seq
+            model.objects.bulk_create(instances, batch_size=ARCHIVE_BATCH_SIZE)
+            if archive.kind == 'health' and fts_available():
+                with connection.cursor() as cursor:
+                    cursor.executemany(f'INSERT INTO {FTS_TABLE}(rowid, search_tokens) VALUES (%s, %s)',
+                                       [(log.pk, log.search_tokens) for log in instances])
+            archive.delete()
+        restored += len(instances)
+    if restored:
+        touch(pet_id)
+        invalidate_weight_series(pet_id)
+    return restored
+
+
+def verify_archive(archive):
+    # 回傳問題清單，空的表示沒問題
+    try:
+        instances = unpack(archive, verify=True)
+    except (ValueError, zlib.error) as exc:
+        return [str(exc)]
+    problems = []
+    if len(instances) != archive.row_count:
+        problems.append(f'筆數 {len(instances)} 跟紀錄的 {archive.row_count} 不符')
+    ids = [log.pk for log in instances]
+    if ids and (min(ids) != archive.min_log_id or max(ids) != archive.max_log_id):
+        problems.append('id範圍不符')
+    if any(log.pet_id != archive.pet_id for log in instances):
+        problems.append('包含其他寵物的紀錄')
+    model = ARCHIVE_KINDS[archive.kind][0]
+    duplicated = model.objects.filter(pk__in=ids).count()
+    if duplicated:
+        problems.append(f'{duplicated} 筆同時存在熱資料表')
+    return problems
+
+
+class _Newest:
+    # heapq是最小堆，反過來比，堆頂就是最新的一筆
+    __slots__ = ('key', 'log')
+
+    def __init__(self, key, log):
+        self.key, self.log = key, log
+
+    def __lt__(self, other):
+        return self.key > other.key
+
+
+def archived_logs(pet_id, kind, position=None):
+    # 依(排序欄位, id)由新到舊吐出封存的日誌；position=(值, id)時只吐比它舊的
+    # 封存包依日期範圍由新到舊解壓；後面的包都不可能比緩衝裡的新時，就先吐出去，不用全部解壓
+    date_field = ARCHIVE_KINDS[kind][1]
+    archives = LogArchive.objects.filter(pet_id=pet_id, kind=kind)
+    if position is not None:
+        archives = archives.filter(first_date__lte=_day(position[0]))
+    # payload用到才讀，翻頁讀到哪就解壓到哪
+    archives = archives.order_by('-last_date', '-pk').defer('payload')
+
+    buffer = []
+    for archive in archives:
+        bound = _upper_bound(archive, date_field)
+        while buffer and buffer[0].key[0] > bound:
+            yield heapq.heappop(buffer).log
+        for log in unpack(archive):
+            key = (getattr(log, date_field), log.pk)
+            if position is None or key < position:
+                heapq.heappush(buffer, _Newest(key, log))
+    while buffer:
+        yield heapq.heappop(buffer).log
+
+
+def archived_values(pet_id, kind, fields):
+    # 匯出用：一包一包由舊到新吐出dict(跟.values()一樣，檔案欄位是路徑字串)
+    date_field = ARCHIVE_KINDS[kind][1]
+    for archive in LogArchive.objects.filter(pet_id=pet_id, kind=kind).order_by('first_date', 'pk').defer('payload'):
+        for log in sorted(unpack(archive), key=lambda log: (getattr(log, date_field), log.pk)):
+            yield {name: _plain(getattr(log, name)) for name in fields}
+
+
+def find_archived(pet_id, kind, pk):
+    for archive in LogArchive.objects.filter(pet_id=pet_id, kind=kind, min_log_id__lte=pk, max_log_id__gte=pk):
+        for log in unpack(archive):
+            if log.pk == pk:
+                return log
+    return None
+
+
+def _encode_cursor(value, pk):
+    return base64.urlsafe_b64encode(f'{value.isoformat()}|{pk}'.encode()).decode()
+
+
+def _decode_cursor(cursor, field):
+    try:
+        value, pk = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit('|', 1)
+        return field.to_python(value), int(pk)
+    except Exception:
+        raise ParseError('cursor格式錯誤')
+
+
+class ArchiveReadMixin:
+    # 巢狀日誌ViewSet用：這隻寵物有封存資料時，列表改成熱資料+封存資料合併的keyset分頁，
+    # 單筆讀取找不到時再去封存包找；修改/刪除只對熱資料表(要改舊資料先 archive_logs --restore)
+    # 沒有封存資料的寵物完全走原本的CursorPagination
+    archive_kind = None
+
+    def _has_archives(self):
+        return LogArchive.objects.filter(pet_id=self.kwargs.get('pet_pk'), pet__owner=self.request.user,
+                                         kind=self.archive_kind).exists()
+
+    def list(self, request, *args, **kwargs):
+        if not self._has_archives():
+            return super().list(request, *args, **kwargs)
+        model, date_field, _ = ARCHIVE_KINDS[self.archive_kind]
+        paginator = self.paginator
+        page_size = paginator.get_page_size(request)
+
+        position = None
+        logs = self.get_queryset().order_by(f'-{date_field}', '-id')
+        cursor = request.query_params.get(paginator.cursor_query_param)
+        if cursor:
+            position = _decode_cursor(cursor, model._meta.get_field(date_field))
+            value, pk = position
+            logs = logs.filter(Q(**{f'{date_field}__lt': value}) | Q(**{date_field: value, 'id__lt': pk}))
+
+        hot = list(logs[:page_size + 1])
+        cold = list(islice(archived_logs(self.kwargs['pet_pk'], self.archive_kind, position), page_size + 1))
+        rows = list(islice(heapq.merge(hot, cold, key=lambda log: (getattr(log, date_field), log.pk), reverse=True),
+                           page_size + 1))
+        next_url = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            last = rows[-1]
+            params = request.query_params.copy()
+            params[paginator.cursor_query_param] = _encode_cursor(getattr(last, date_field), last.pk)
+            next_url = request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+        return Response({
+            'next': next_url,
+            'previous': None,
+            'results': self.get_serializer(rows, many=True).data,
+        })
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except (Http404, NotFound):
+            pass
+        if not request.user.pets.filter(pk=self.kwargs.get('pet_pk')).exists():
+            raise NotFound()
+        try:
+            pk = int(self.kwargs['pk'])
+        except ValueError:
+            raise NotFound()
+        log = find_archived(self.kwargs['pet_pk'], self.archive_kind, pk)
+        if log is None:
+            raise NotFound()
+        return Response(self.get_serializer(log).data)
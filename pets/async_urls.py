@@ -0,0 +1,17 @@
+# pets/async_urls.py
+# async版的讀取API: /api/async/...
+
+from django.urls import path
+
+from . import async_views
+
+urlpatterns = [
+    path('pets/', async_views.pet_list, name='async-pet-list'),
+    path('pets/<int:pk>/', async_views.pet_detail, name='async-pet-detail'),
+    path('pets/<int:pet_pk>/weight-logs/', async_views.log_list, {'kind': 'weight-logs'},
+         name='async-pet-weight-logs-list'),
+    path('pets/<int:pet_pk>/health-logs/', async_views.log_list, {'kind': 'health-logs'},
+         name='async-pet-health-logs-list'),
+    path('pets/<int:pet_pk>/injection-logs/', async_views.log_list, {'kind': 'injection-logs'},
+         name='async-pet-injection-logs-list'),
+]
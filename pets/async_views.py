@@ -0,0 +1,186 @@
+# pets/async_views.py
+# 讀取量大的API的async版本，網址在 /api/async/ 底下，回傳的欄位跟同步版(DRF)相同
+# 只有日誌列表next網址裡的cursor格式不一樣：async版的next要在async版翻頁，不能拿去同步版用
+# 用uvicorn(ASGI)跑的時候，慢的client不會一直佔住一個worker
+# DRF的view還不支援async，這裡用Django原生的async view + async ORM
+
+import base64
+import functools
+import heapq
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+from django.http import Http404, JsonResponse
+from django.utils.http import urlencode
+from rest_framework.exceptions import AuthenticationFailed
+
+from accounts.authentication import CachedTokenAuthentication
+from .archive import archived_logs
+from .models import LogArchive, Pet, PetSummary, WeightLog, HealthLog, InjectionLog
+from .pagination import LogCursorPagination
+from .serializers import PetSerializer, WeightLogSerializer, HealthLogSerializer, InjectionLogSerializer
+from .summaries import rebuild_summary
+
+RECENT_LOG_COUNT = 5
+
+# 巢狀日誌列表：(model, serializer, 排序欄位, 封存類型)，排序跟同步版的cursor分頁一樣是新的在前
+LOG_LISTS = {
+    'weight-logs': (WeightLog, WeightLogSerializer, 'recorded_at', 'weight'),
+    'health-logs': (HealthLog, HealthLogSerializer, 'created_at', 'health'),
+    'injection-logs': (InjectionLog, InjectionLogSerializer, 'injection_date', 'injection'),
+}
+
+_authenticator = CachedTokenAuthentication()
+
+
+class BadParameter(Exception):
+    # 參數格式錯誤(例如cursor) -> 400；只接這個，程式其他地方的ValueError照常當500
+    pass
+
+
+def _json(data, status=200, **kwargs):
+    return JsonResponse(data, status=status, safe=False, json_dumps_params={'ensure_ascii': False}, **kwargs)
+
+
+def async_api(view):
+    # 只接受GET，先做token驗證，再把常見的錯誤轉成跟DRF一樣的回應
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return _json({'detail': f'不允許的方法 "{request.method}"。'}, status=405)
+        try:
+            result = await sync_to_async(_authenticator.authenticate)(request)
+        except AuthenticationFailed as exc:
+            result = None
+            detail = str(exc.detail)
+        else:
+            detail = '未提供身份驗證憑證。'
+        if result is None:
+            return _json({'detail': detail}, status=401, headers={'WWW-Authenticate': 'Token'})
+        request.user = result[0]
+
+        try:
+            return await view(request, *args, **kwargs)
+        except Http404:
+            return _json({'detail': '找不到。'}, status=404)
+        except BadParameter:
+            return _json({'detail': '無效的參數。'}, status=400)
+    return wrapper
+
+
+async def _ensure_summaries(pets):
+    # 還沒有PetSummary的舊資料補建(一般不會發生)
+    for pet in pets:
+        try:
+            pet.summary
+        except PetSummary.DoesNotExist:
+            pet.summary = await sync_to_async(rebuild_summary)(pet.pk)
+
+
+def _pets(request):
+    return request.user.pets.select_related('owner', 'pet_type', 'pet_species', 'summary')
+
+
+@async_api
+async def pet_list(request):
+    pets = [pet async for pet in _pets(request).order_by('pk')]
+    await _ensure_summaries(pets)
+    return _json(PetSerializer(pets, many=True, context={'request': request}).data)
+
+
+def _archived_rows(pet_pk, archive_kind, position, count):
+    return list(islice(archived_logs(pet_pk, archive_kind, position), count))
+
+
+async def _log_rows(request, kind, pet_pk, count, position=None):
+    # 新的在前讀count筆，position=(日期, id)時從它後面開始；
+    # 這隻寵物有封存資料時跟封存的合併(跟同步版的ArchiveReadMixin一樣)
+    model, _, date_field, archive_kind = LOG_LISTS[kind]
+    logs = model.objects.filter(pet__pk=pet_pk, pet__owner=request.user).order_by(f'-{date_field}', '-id')
+    if position is not None:
+        value, pk = position
+        logs = logs.filter(Q(**{f'{date_field}__lt': value}) | Q(**{date_field: value, 'id__lt': pk}))
+    rows = [log async for log in logs[:count]]
+    if await LogArchive.objects.filter(pet_id=pet_pk, pet__owner=request.user, kind=archive_kind).aexists():
+        cold = await sync_to_async(_archived_rows)(pet_pk, archive_kind, position, count)
+        rows = list(islice(heapq.merge(rows, cold, key=lambda log: (getattr(log, date_field), log.pk),
+                                       reverse=True), count))
+    return rows
+
+
+async def _recent_logs(request, kind, pet_pk):
+    serializer_class = LOG_LISTS[kind][1]
+    rows = await _log_rows(request, kind, pet_pk, RECENT_LOG_COUNT)
+    return serializer_class(rows, many=True, context={'request': request}).data
+
+
+async def _get_pet(request, pk):
+    try:
+        return await _pets(request).aget(pk=pk)
+    except Pet.DoesNotExist:
+        raise Http404
+
+
+@async_api
+async def pet_detail(request, pk):
+    # ?expand=recent 會多帶三種日誌各最近5筆
+    # async ORM的查詢都在同一個thread-sensitive執行緒上跑，asyncio.gather也是一個接一個，所以直接依序await
+    pet = await _get_pet(request, pk)
+    recent = None
+    if request.GET.get('expand') == 'recent':
+        recent = [await _recent_logs(request, kind, pk) for kind in LOG_LISTS]
+
+    await _ensure_summaries([pet])
+    data = PetSerializer(pet, context={'request': request}).data
+    if recent is not None:
+        for kind, logs in zip(LOG_LISTS, recent):
+            data[f"recent_{kind.replace('-', '_')}"] = logs
+    return _json(data)
+
+
+def _page_size(request):
+    # 跟DRF的CursorPagination一樣：不是正整數就用預設值，太大就用上限
+    try:
+        page_size = int(request.GET[LogCursorPagination.page_size_query_param])
+    except (KeyError, ValueError):
+        return LogCursorPagination.page_size
+    if page_size < 1:
+        return LogCursorPagination.page_size
+    return min(page_size, LogCursorPagination.max_page_size)
+
+
+def _encode_cursor(value, pk):
+    return base64.urlsafe_b64encode(f'{value.isoformat()}|{pk}'.encode()).decode()
+
+
+def _decode_cursor(cursor, field):
+    # 格式不對會丟BadParameter -> 400
+    try:
+        value, pk = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit('|', 1)
+        return field.to_python(value), int(pk)
+    except Exception:
+        raise BadParameter('invalid cursor')
+
+
+@async_api
+async def log_list(request, pet_pk, kind):
+    # keyset分頁：cursor記住上一頁最後一筆的(日期, id)，用 ?cursor= 翻下一頁
+    # cursor是base64的「日期|id」，跟同步版DRF的cursor格式不同(見檔案開頭)
+    model, serializer_class, date_field, _ = LOG_LISTS[kind]
+    page_size = _page_size(request)
+    cursor = request.GET.get('cursor')
+    position = _decode_cursor(cursor, model._meta.get_field(date_field)) if cursor else None
+    rows = await _log_rows(request, kind, pet_pk, page_size + 1, position)
+    next_url = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        params = {**request.GET.dict(), 'cursor': _encode_cursor(getattr(last, date_field), last.pk)}
+        next_url = request.build_absolute_uri(f'{request.path}?{urlencode(params)}')
+
+    return _json({
+        'next': next_url,
+        'previous': None,
+        'results': serializer_class(rows, many=True, context={'request': request}).data,
+    })
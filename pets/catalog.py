@@ -0,0 +1,86 @@
+# pets/catalog.py
+# 物種/品種選單一個月才變一次，但每次開App都會抓
+# 快取分兩層：process內的dict + Django cache，用版本號一起失效；
+# process內的只在Django cache是共用的時候才用，而且最多放CATALOG_LOCAL_TTL秒
+# 回應帶strong ETag，客戶端用If-None-Match問，沒變就回304
+
+import hashlib
+import json
+import time
+
+from django.core.cache import cache
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from health_cats.caching import cache_is_shared
+
+from .models import PetType
+from .serializers import PetTypeSerializer
+
+VERSION_KEY = 'catalog:version'
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24
+CATALOG_LOCAL_TTL = 60
+
+_local_cache = {}
+
+
+def _current_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # 共用快取被清掉時不能從1重來，不然會撞到process內舊版本的資料
+        cache.add(VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, int(time.time() * 1000), None)
+
+
+def _build_types():
+    # 冷快取時一次prefetch全部品種，不會每個物種各查一次
+    types = PetType.objects.prefetch_related('species').order_by('pk')
+    return PetTypeSerializer(types, many=True).data
+
+
+def _build_entry(key):
+    types = _build_types()
+    if key == 'types':
+        data = types
+    else:
+        pet_type_pk = key.split(':', 1)[1]
+        data = next((t['species'] for t in types if str(t['id']) == pet_type_pk), [])
+    body = json.dumps(data, ensure_ascii=False, sort_keys=True).encode()
+    etag = '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+    return etag, json.loads(body)
+
+
+def get_catalog(key):
+    # key: 'types' 或 'species:<pet_type_pk>'，回傳 (etag, data)
+    version = _current_version()
+    shared = cache_is_shared()
+    local = _local_cache.get(key) if shared else None
+    if local and local[0] == version and local[1] > time.monotonic():
+        return local[2], local[3]
+
+    shared_key = f'catalog:{version}:{key}'
+    entry = cache.get(shared_key)
+    if entry is None:
+        entry = _build_entry(key)
+        cache.set(shared_key, entry, CATALOG_CACHE_TIMEOUT)
+    if shared:
+        _local_cache[key] = (version, time.monotonic() + CATALOG_LOCAL_TTL, *entry)
+    return entry
+
+
+def catalog_response(request, key):
+    etag, data = get_catalog(key)
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and (etag in parse_etags(if_none_match) or if_none_match.strip() == '*'):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(data, headers=headers)
@@ -0,0 +1,69 @@
+# pets/conditional.py
+# App回到前景時會重抓寵物列表跟日誌，大部分時候資料沒變
+# 用PetSummary.version(寵物或日誌有變動就+1)算ETag、updated_at當Last-Modified，
+# 在序列化之前先比對If-None-Match / If-Modified-Since，沒變就回304，只花一次走索引的查詢
+# 寵物列表用主人的同步序號(ChangeCounter，新增/修改/刪除都會+1，只會變大)，刪掉一隻再新增一隻也不會撞到
+# 年齡、逾期未施打是跟著日期變的，ETag也帶今天的日期
+
+import calendar
+import hashlib
+from datetime import datetime, time
+
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .models import ChangeCounter, PetSummary
+
+
+class ConditionalGetMixin:
+    # 寵物id在URL的哪個參數；沒有這個參數(寵物列表)就用主人所有寵物的版本合計
+    change_pet_kwarg = 'pet_pk'
+
+    def change_stamp(self):
+        # 回傳 (版本字串, 最後修改時間) 或 None(找不到寵物，交給原本的流程回404)
+        pet_pk = self.kwargs.get(self.change_pet_kwarg)
+        if pet_pk is None:
+            # 刪除不會留下updated_at，列表不給Last-Modified，只用ETag
+            seq = (ChangeCounter.objects.filter(owner_id=self.request.user.pk)
+                   .values_list('value', flat=True).first())
+            return f'owner:{seq or 0}', None
+        row = (PetSummary.objects.filter(pet__owner=self.request.user, pet_id=pet_pk)
+               .values_list('version', 'updated_at').first())
+        if row is None:
+            return None
+        return f'{pet_pk}:{row[0]}', row[1]
+
+    def conditional_response(self, request, build):
+        # build: 沒有304時才呼叫，產生完整回應
+        stamp = self.change_stamp()
+        if stamp is None:
+            return build()
+        version, changed = stamp
+        today = timezone.localdate()
+        # 同一份資料用不同的?fields=、格式、使用者、日期拿到的內容不同，ETag也要不同
+        variant = f'{version}|{request.user.pk}|{request.get_full_path()}|{request.accepted_media_type}|{today}'
+        etag = quote_etag(hashlib.sha256(variant.encode()).hexdigest()[:32])
+        last_modified = None
+        if changed:
+            # 過了午夜年齡可能就變了，Last-Modified至少是今天00:00
+            changed = max(changed, timezone.make_aware(datetime.combine(today, time.min)))
+            last_modified = calendar.timegm(changed.utctimetuple())
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = build()
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+            response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        parent = super().list
+        return self.conditional_response(request, lambda: parent(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        parent = super().retrieve
+        return self.conditional_response(request, lambda: parent(request, *args, **kwargs))
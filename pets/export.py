@@ -0,0 +1,76 @@
+# pets/export.py
+# 給獸醫的完整病歷匯出：體重、健康日誌、驅蟲紀錄一起串流輸出
+# 每種日誌都用 .values().iterator() 分批讀，記憶體用量跟資料筆數無關(封存的舊紀錄一次解壓一包)
+
+import csv
+import json
+from itertools import chain
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .archive import archived_values
+from .models import WeightLog, HealthLog, InjectionLog
+
+EXPORT_CHUNK_SIZE = 2000
+
+CSV_COLUMNS = [
+    'record_type', 'pet_id', 'pet_name', 'id', 'date',
+    'weight_kg',
+    'topic', 'content', 'action', 'case_closed', 'photo_records',
+    'injection_type', 'note', 'next_date',
+]
+
+
+def _rows(pet, kind, queryset, fields):
+    # 封存(pets/archive.py)的舊紀錄先，再接熱資料表
+    return chain(archived_values(pet.pk, kind, fields),
+                 queryset.values(*fields).iterator(chunk_size=EXPORT_CHUNK_SIZE))
+
+
+def iter_pet_history(pet):
+    # 依序吐出一隻寵物的所有紀錄，每筆都是dict
+    base = {'pet_id': pet.pk, 'pet_name': pet.name}
+
+    weight_logs = _rows(pet, 'weight', WeightLog.objects.filter(pet=pet).order_by('recorded_at', 'id'),
+                        ['id', 'recorded_at', 'weight_kg'])
+    for row in weight_logs:
+        yield {'record_type': 'weight', **base, 'id': row['id'], 'date': row['recorded_at'],
+               'weight_kg': row['weight_kg']}
+
+    health_logs = _rows(pet, 'health', HealthLog.objects.filter(pet=pet).order_by('created_at', 'id'),
+                        ['id', 'created_at', 'topic', 'content', 'action', 'case_closed', 'photo_records'])
+    for row in health_logs:
+        yield {'record_type': 'health', **base, 'id': row['id'], 'date': row['created_at'],
+               'topic': row['topic'], 'content': row['content'], 'action': row['action'],
+               'case_closed': row['case_closed'], 'photo_records': row['photo_records'] or ''}
+
+    injection_logs = _rows(pet, 'injection', InjectionLog.objects.filter(pet=pet).order_by('injection_date', 'id'),
+                           ['id', 'injection_date', 'injection_type', 'note', 'next_date'])
+    for row in injection_logs:
+        yield {'record_type': 'injection', **base, 'id': row['id'], 'date': row['injection_date'],
+               'injection_type': row['injection_type'], 'note': row['note'],
+               'next_date': row['next_date']}
+
+
+def iter_history(pets):
+    # pets是queryset，可以是單隻也可以是主人全部的寵物
+    for pet in pets.order_by('pk').only('pk', 'name').iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield from iter_pet_history(pet)
+
+
+def iter_ndjson(records):
+    for record in records:
+        yield json.dumps(record, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+class _Echo:
+    # csv.writer需要一個有write()的物件，直接把寫入的字串回傳出去
+    def write(self, value):
+        return value
+
+
+def iter_csv(records):
+    writer = csv.DictWriter(_Echo(), fieldnames=CSV_COLUMNS, restval='')
+    yield writer.writerow(dict(zip(CSV_COLUMNS, CSV_COLUMNS)))
+    for record in records:
+        yield writer.writerow(record)
@@ -0,0 +1,120 @@
+# pets/filters.py
+# 寵物列表的篩選與排序都在資料庫做，收容所、繁殖場這種上千隻寵物的帳號不用全部讀出來再用Python挑
+# 年齡換算成birth_day的範圍(可以走(owner, birth_day)索引)，其他計算欄位讀PetSummary
+#   /api/pets/?min_age=10&injection_overdue=true&ordering=-last_weight&page_size=50
+
+import math
+from datetime import date
+
+from django.db.models import F
+from django.utils import timezone
+from rest_framework.exceptions import ParseError
+from rest_framework.filters import BaseFilterBackend
+
+# 年齡參數的合理範圍(歲)
+MAX_AGE_YEARS = 100
+
+# ?ordering= 可用的名稱 -> 排序欄位；age越大生日越早
+ORDERING_FIELDS = {
+    'name': 'name',
+    'age': '-birth_day',
+    'birth_day': 'birth_day',
+    'created_at': 'created_at',
+    'last_weight': 'summary__last_weight_kg',
+    'next_injection': 'summary__next_injection_date',
+    'open_cases': 'summary__open_case_count',
+}
+
+
+def _years_before(today, years):
+    try:
+        return today.replace(year=today.year - years)
+    except ValueError:
+        # 2/29往回推到非閏年
+        return date(today.year - years, 2, 28)
+
+
+def _int_param(params, name):
+    try:
+        return int(params[name])
+    except ValueError:
+        raise ParseError(f'{name}必須是整數')
+
+
+def _age_param(params, name):
+    years = _int_param(params, name)
+    if not 0 <= years <= MAX_AGE_YEARS:
+        raise ParseError(f'{name}要在0到{MAX_AGE_YEARS}之間')
+    return years
+
+
+def _float_param(params, name):
+    try:
+        value = float(params[name])
+    except ValueError:
+        raise ParseError(f'{name}必須是數字')
+    # inf、nan轉不成DecimalField的值
+    if not math.isfinite(value):
+        raise ParseError(f'{name}必須是數字')
+    return value
+
+
+def _bool_param(params, name):
+    value = params[name].lower()
+    if value in ('1', 'true'):
+        return True
+    if value in ('0', 'false'):
+        return False
+    raise ParseError(f'{name}只能是true或false')
+
+
+class PetFilterBackend(BaseFilterBackend):
+    # min_age/max_age(歲)、injection_overdue、has_open_cases、min_weight/max_weight(kg)
+    # 只用在列表，單筆讀取/修改帶了這些參數也不影響
+
+    def filter_queryset(self, request, queryset, view):
+        if view.action != 'list':
+            return queryset
+        params = request.query_params
+        today = timezone.localdate()
+        if 'min_age' in params:
+            # 滿N歲 = 生日在N年前的今天(含)之前
+            queryset = queryset.filter(birth_day__lte=_years_before(today, _age_param(params, 'min_age')))
+        if 'max_age' in params:
+            # 還沒滿N+1歲
+            queryset = queryset.filter(birth_day__gt=_years_before(today, _age_param(params, 'max_age') + 1))
+        if 'injection_overdue' in params:
+            overdue = {'summary__next_injection_date__lt': today}
+            if _bool_param(params, 'injection_overdue'):
+                queryset = queryset.filter(**overdue)
+            else:
+                queryset = queryset.exclude(**overdue)
+        if 'has_open_cases' in params:
+            if _bool_param(params, 'has_open_cases'):
+                queryset = queryset.filter(summary__open_case_count__gt=0)
+            else:
+                queryset = queryset.exclude(summary__open_case_count__gt=0)
+        if 'min_weight' in params:
+            queryset = queryset.filter(summary__last_weight_kg__gte=_float_param(params, 'min_weight'))
+        if 'max_weight' in params:
+            queryset = queryset.filter(summary__last_weight_kg__lte=_float_param(params, 'max_weight'))
+        return queryset
+
+
+class PetOrderingBackend(BaseFilterBackend):
+    # ?ordering=-last_weight,name；沒有資料(沒量過體重等)的排最後，最後用id確保分頁穩定
+
+    def filter_queryset(self, request, queryset, view):
+        if view.action != 'list':
+            return queryset
+        ordering = []
+        for name in filter(None, request.query_params.get('ordering', '').split(',')):
+            descending = name.startswith('-')
+            field = ORDERING_FIELDS.get(name.lstrip('-'))
+            if field is None:
+                raise ParseError(f"ordering只支援{'、'.join(ORDERING_FIELDS)}")
+            if field.startswith('-'):
+                descending, field = not descending, field[1:]
+            expression = F(field)
+            ordering.append(expression.desc(nulls_last=True) if descending else expression.asc(nulls_last=True))
+        return queryset.order_by(*ordering, 'id')
@@ -0,0 +1,163 @@
+# pets/growth.py
+# 各品種的體重百分位曲線：「你的貓在3歲米克斯裡是第80百分位」
+# 批次算好存在GrowthCurve(一個品種一個年齡區間一列，存第0~100百分位的體重)，API只查一列再內插
+#   - 年齡區間：未滿一歲每個月一區，之後每年一區，MAX_AGE_YEARS歲以上併成一區
+#   - 每隻寵物在每個年齡區間只算一個樣本(區間內紀錄的中位數)，量很多次的寵物不會把曲線拉過去
+#   - 體重紀錄新增/修改/刪除、寵物改生日或品種時，把品種標成要重算(StaleGrowthCurve)，
+#     manage.py compute_growth_curves 只重算這些品種
+
+import statistics
+from bisect import bisect_left, bisect_right
+from itertools import groupby
+
+from django.db import transaction
+
+from .archive import archived_values
+from .models import GrowthCurve, LogArchive, Pet, StaleGrowthCurve, WeightLog
+
+MAX_AGE_YEARS = 20
+# 同一個年齡區間少於這麼多隻寵物就不算曲線
+MIN_PETS_PER_BUCKET = 10
+PET_BATCH_SIZE = 500
+
+
+def age_bucket(birth_day, on_date):
+    # 回傳年齡區間的起點(月)；量的日期在生日之前(資料有誤)回傳None
+    months = (on_date.year - birth_day.year) * 12 + on_date.month - birth_day.month - (on_date.day < birth_day.day)
+    if months < 0:
+        return None
+    if months < 12:
+        return months
+    return min(months // 12, MAX_AGE_YEARS) * 12
+
+
+def bucket_label(age_months):
+    if age_months < 12:
+        return f'{age_months}個月'
+    if age_months >= MAX_AGE_YEARS * 12:
+        return f'{MAX_AGE_YEARS}歲以上'
+    return f'{age_months // 12}歲'
+
+
+def mark_stale(*species_ids):
+    # 寫入路徑上只多一個INSERT，已經標過就什麼都不做(不會鎖住同一列)
+    species_ids = {pk for pk in species_ids if pk is not None}
+    if species_ids:
+        StaleGrowthCurve.objects.bulk_create([StaleGrowthCurve(species_id=pk) for pk in species_ids],
+                                             ignore_conflicts=True)
+
+
+def _pet_samples(pets):
+    # pets: [(pet_id, birth_day)]；回傳 {年齡區間: [每隻寵物的中位數體重]}
+    birth_days = dict(pets)
+    readings = {}
+    rows = (WeightLog.objects.filter(pet_id__in=birth_days).order_by('pet_id')
+            .values_list('pet_id', 'recorded_at', 'weight_kg').iterator(chunk_size=PET_BATCH_SIZE))
+    for pet_id, pet_rows in groupby(rows, key=lambda row: row[0]):
+        readings[pet_id] = [(recorded_at, weight_kg) for _, recorded_at, weight_kg in pet_rows]
+    # 封存的舊體重(幼貓時期的紀錄)也要算進去
+    archived = (LogArchive.objects.filter(pet_id__in=birth_days, kind='weight')
+                .values_list('pet_id', flat=True).distinct())
+    for pet_id in archived:
+        readings.setdefault(pet_id, []).extend(
+            (row['recorded_at'], row['weight_kg'])
+            for row in archived_values(pet_id, 'weight', ['recorded_at', 'weight_kg']))
+
+    samples = {}
+    for pet_id, pet_readings in readings.items():
+        by_bucket = {}
+        for recorded_at, weight_kg in pet_readings:
+            bucket = age_bucket(birth_days[pet_id], recorded_at)
+            if bucket is not None:
+                by_bucket.setdefault(bucket, []).append(float(weight_kg))
+        for bucket, weights in by_bucket.items():
+            samples.setdefault(bucket, []).append(statistics.median(weights))
+    return samples
+
+
+def species_samples(species_id, batch_size=PET_BATCH_SIZE):
+    # 一次讀一批寵物的體重，記憶體裡只留每隻寵物每個區間一個數字
+    samples = {}
+    pets = Pet.objects.filter(pet_species_id=species_id).order_by('pk').values_list('pk', 'birth_day')
+    last_pk = 0
+    while True:
+        batch = list(pets.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            return samples
+        for bucket, weights in _pet_samples(batch).items():
+            samples.setdefault(bucket, []).extend(weights)
+        last_pk = batch[-1][0]
+
+
+def percentile_points(weights):
+    # 第0~100百分位，樣本之間線性內插(跟numpy.percentile預設的算法一樣)
+    weights = sorted(weights)
+    cuts = statistics.quantiles(weights, n=100, method='inclusive')
+    return [round(value, 3) for value in (weights[0], *cuts, weights[-1])]
+
+
+def compute_species(species_id, batch_size=PET_BATCH_SIZE):
+    # 重算一個品種的所有年齡區間，回傳寫入幾個區間
+    curves = [
+        GrowthCurve(species_id=species_id, age_months=bucket, pet_count=len(weights),
+                    quantiles=percentile_points(weights))
+        for bucket, weights in sorted(species_samples(species_id, batch_size).items())
+        if len(weights) >= MIN_PETS_PER_BUCKET
+    ]
+    with transaction.atomic():
+        GrowthCurve.objects.filter(species_id=species_id).delete()
+        GrowthCurve.objects.bulk_create(curves)
+    return len(curves)
+
+
+def compute_stale(batch_size=PET_BATCH_SIZE):
+    # 重算被標記的品種，回傳 {品種id: 區間數}
+    # 先刪標記再算：算到一半又有新紀錄會重新標記，下次再算；算失敗就標回去
+    results = {}
+    for species_id in list(StaleGrowthCurve.objects.order_by('pk').values_list('pk', flat=True)):
+        StaleGrowthCurve.objects.filter(pk=species_id).delete()
+        try:
+            results[species_id] = compute_species(species_id, batch_size)
+        except Exception:
+            mark_stale(species_id)
+            raise
+    return results
+
+
+def percentile_of(quantiles, weight):
+    # 在第0~100百分位的體重之間內插，回傳0~100
+    if weight <= quantiles[0]:
+        return 0.0
+    if weight >= quantiles[-1]:
+        return 100.0
+    # 好幾個百分位同一個體重時取中間
+    low, high = bisect_left(quantiles, weight), bisect_right(quantiles, weight)
+    if low != high:
+        return round((low + high - 1) / 2, 1)
+    below, above = quantiles[low - 1], quantiles[low]
+    return round(low - 1 + (weight - below) / (above - below), 1)
+
+
+def pet_percentile(pet):
+    # pet要有summary(最新體重)；回傳API的內容
+    summary = pet.summary
+    result = {'species': pet.pet_species.name if pet.pet_species else None,
+              'weight_kg': summary.last_weight_kg, 'recorded_at': summary.last_weight_recorded_at,
+              'age_months': None, 'age_label': None, 'percentile': None, 'pet_count': 0, 'curve': None}
+    if pet.pet_species_id is None or summary.last_weight_kg is None:
+        return result
+    bucket = age_bucket(pet.birth_day, summary.last_weight_recorded_at)
+    if bucket is None:
+        return result
+    result.update(age_months=bucket, age_label=bucket_label(bucket))
+    # (species, age_months)唯一索引，查一列
+    curve = GrowthCurve.objects.filter(species_id=pet.pet_species_id, age_months=bucket).first()
+    if curve is None:
+        return result
+    quantiles = curve.quantiles
+    result.update(
+        percentile=percentile_of(quantiles, float(summary.last_weight_kg)),
+        pet_count=curve.pet_count,
+        curve={f'p{p}': quantiles[p] for p in (5, 25, 50, 75, 95)},
+    )
+    return result
@@ -0,0 +1,124 @@
+# pets/images.py
+# 照片縮圖：上傳後在背景執行緒產生縮圖與中尺寸WebP，列表只給小圖的網址
+# 依EXIF轉正，輸出檔不帶EXIF(拍攝地點等資訊不外流)
+
+import logging
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+from .models import ChangeCounter
+from .summaries import touch
+
+THUMBNAIL_SIZE = (256, 256)
+MEDIUM_MAX_SIZE = (1024, 1024)
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def variant_names(original_name):
+    # pet_photos/abc.jpg -> pet_photos/variants/abc_thumb.jpg, pet_photos/variants/abc_medium.webp
+    directory, filename = posixpath.split(original_name)
+    stem = posixpath.splitext(filename)[0]
+    return (posixpath.join(directory, 'variants', f'{stem}_thumb.jpg'),
+            posixpath.join(directory, 'variants', f'{stem}_medium.webp'))
+
+
+def render_variants(original):
+    with Image.open(original) as image:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+
+    thumbnail = ImageOps.fit(image, THUMBNAIL_SIZE, Image.Resampling.LANCZOS)
+    thumbnail_buffer = BytesIO()
+    thumbnail.save(thumbnail_buffer, 'JPEG', quality=80, optimize=True)
+
+    medium = image.copy()
+    medium.thumbnail(MEDIUM_MAX_SIZE, Image.Resampling.LANCZOS)
+    medium_buffer = BytesIO()
+    medium.save(medium_buffer, 'WEBP', quality=80)
+
+    return ContentFile(thumbnail_buffer.getvalue()), ContentFile(medium_buffer.getvalue())
+
+
+def generate_variants(model, pk, photo_field, thumbnail_field, medium_field):
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        return
+    original = getattr(instance, photo_field)
+    if not original:
+        model.objects.filter(pk=pk).update(**{thumbnail_field: None, medium_field: None})
+        _changed(instance)
+        return
+
+    storage = original.storage
+    thumbnail_name, medium_name = variant_names(original.name)
+    # 內容定址的原圖(pets/storage.py)內容不會變，同一張照片已經產生過的縮圖直接共用
+    shared = getattr(storage, 'immutable', False) and storage.exists(thumbnail_name) and storage.exists(medium_name)
+    if not shared:
+        with original.open('rb'):
+            thumbnail, medium = render_variants(original)
+        for name, content in ((thumbnail_name, thumbnail), (medium_name, medium)):
+            if storage.exists(name):
+                storage.delete(name)
+            storage.save(name, content)
+
+    # 只有原圖沒被換掉時才寫回，避免跟後來的上傳互相覆蓋
+    updated = model.objects.filter(pk=pk, **{photo_field: original.name}).update(
+        **{thumbnail_field: thumbnail_name, medium_field: medium_name})
+    if updated:
+        _changed(instance)
+
+
+def _changed(instance):
+    # 縮圖網址也在API回應裡；Pet自己就是寵物，日誌則是自己換同步序號、所屬寵物的版本跟著變
+    if hasattr(instance, 'pet_id'):
+        ChangeCounter.bump(type(instance).objects.filter(pk=instance.pk))
+    touch(getattr(instance, 'pet_id', instance.pk))
+
+
+def _run_in_worker(*args):
+    # submit回傳的future沒人看，例外要在這裡記下來，不然壞掉的照片、storage錯誤都不會有任何紀錄
+    try:
+        generate_variants(*args)
+    except Exception:
+        logger.exception('產生縮圖失敗: %s pk=%s', args[0].__name__, args[1])
+    finally:
+        # 背景執行緒自己開的資料庫連線要自己關
+        connection.close()
+
+
+def schedule_variants(instance, photo_field, thumbnail_field, medium_field):
+    # 原圖有變才排程，交易commit之後才開始，背景執行緒才讀得到新資料
+    original = getattr(instance, photo_field)
+    expected = variant_names(original.name)[0] if original else None
+    current = getattr(instance, thumbnail_field).name or None
+    if expected == current:
+        return
+
+    args = (type(instance), instance.pk, photo_field, thumbnail_field, medium_field)
+    workers = getattr(settings, 'IMAGE_PIPELINE_WORKERS', 2)
+    if workers <= 0:
+        # 設成0就在同一個request裡直接做(測試、除錯用)
+        transaction.on_commit(lambda: generate_variants(*args))
+        return
+
+    executor = _get_executor(workers)
+    transaction.on_commit(lambda: executor.submit(_run_in_worker, *args))
+
+
+def _get_executor(workers):
+    # 第一次用到才建，多個request同時進來也只建一個pool
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-pipeline')
+        return _executor
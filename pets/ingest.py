@@ -0,0 +1,93 @@
+# pets/ingest.py
+# 體重計批次上傳：逐筆驗證、去重，再分批bulk_create
+
+from datetime import date
+
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.exceptions import ParseError
+
+from .archive import archived_values
+from .models import ChangeCounter, LogArchive, WeightLog
+from .serializers import WeightLogSerializer
+from .growth import mark_stale
+from .series import invalidate_weight_series
+from .summaries import refresh_latest_weight, touch
+from .weight_trends import update_trends
+
+BULK_BATCH_SIZE = 500
+
+
+def ingest_weight_logs(pet, rows):
+    # rows可以是list或generator(NDJSON/CSV串流)，一批一批處理，記憶體只留一批
+    # 同一天(pet, recorded_at)已經有紀錄(包括封存的)就跳過；格式錯的記下行號，不影響其他筆
+    created = 0
+    earliest = None
+    duplicates = 0
+    errors = []
+    seen_dates = set()
+    batch = []
+
+    def existing_dates(logs):
+        return set(WeightLog.objects
+                   .filter(pet=pet, recorded_at__in=[log.recorded_at for log in logs])
+                   .values_list('recorded_at', flat=True))
+
+    def archived_dates(logs):
+        # 封存(pets/archive.py)的舊體重也算已經有紀錄，補傳舊資料不會跟封存的重複
+        dates = [log.recorded_at for log in logs]
+        if not LogArchive.objects.filter(pet=pet, kind='weight', first_date__lte=max(dates),
+                                         last_date__gte=min(dates)).exists():
+            return set()
+        return {row['recorded_at'] for row in archived_values(pet.pk, 'weight', ['recorded_at'])}
+
+    def flush():
+        nonlocal created, earliest, duplicates
+        existing = existing_dates(batch) | archived_dates(batch)
+        new_logs = [log for log in batch if log.recorded_at not in existing]
+        if new_logs:
+            with transaction.atomic():
+                # bulk_create不會呼叫save()，同步序號自己拿，整批用同一個
+                # 拿序號會鎖住主人的計數器到commit，同時上傳的request在這裡排隊；
+                # 鎖住之後再查一次，排在前面的request已經寫了同一天的就略過
+                change_seq = ChangeCounter.next(pet.owner_id)
+                existing = existing_dates(new_logs)
+                new_logs = [log for log in new_logs if log.recorded_at not in existing]
+                for log in new_logs:
+                    log.change_seq = change_seq
+                WeightLog.objects.bulk_create(new_logs, batch_size=BULK_BATCH_SIZE)
+        if new_logs:
+            earliest = min(earliest or date.max, *(log.recorded_at for log in new_logs))
+        created += len(new_logs)
+        duplicates += len(batch) - len(new_logs)
+        batch.clear()
+
+    for row_number, row in enumerate(rows, start=1):
+        if isinstance(row, ParseError):
+            errors.append({'row': row_number, 'errors': row.detail})
+            continue
+        serializer = WeightLogSerializer(data=row)
+        if not serializer.is_valid():
+            errors.append({'row': row_number, 'errors': serializer.errors})
+            continue
+
+        recorded_at = serializer.validated_data.get('recorded_at') or timezone.localdate()
+        if recorded_at in seen_dates:
+            duplicates += 1
+            continue
+        seen_dates.add(recorded_at)
+        batch.append(WeightLog(pet=pet, weight_kg=serializer.validated_data['weight_kg'], recorded_at=recorded_at))
+        if len(batch) >= BULK_BATCH_SIZE:
+            flush()
+
+    if batch:
+        flush()
+    if created:
+        # bulk_create不會觸發signals，自己清快取、從最早的一筆往後重算趨勢、更新主頁統計、標記品種曲線要重算
+        invalidate_weight_series(pet.pk)
+        update_trends(pet.pk, (earliest, 0))
+        refresh_latest_weight(pet.pk)
+        touch(pet.pk)
+        mark_stale(pet.pet_species_id)
+
+    return {'created': created, 'duplicates': duplicates, 'errors': errors}
@@ -0,0 +1,89 @@
+# pets/management/commands/archive_logs.py
+# 把舊日誌封存成壓縮包(LogArchive)，熱資料表只留常用的；API照樣讀得到(pets/archive.py)
+#   python manage.py archive_logs --older-than-days 730                 # 兩年前的紀錄
+#   python manage.py archive_logs --inactive-days 365                   # 一年沒登入的主人，所有舊紀錄
+#   python manage.py archive_logs --restore --pet 12 [--kind health]    # 放回熱資料表
+#   python manage.py archive_logs --verify                              # 檢查每一包的checksum、筆數
+
+from datetime import datetime, time, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+
+from pets.archive import ARCHIVE_BATCH_SIZE, ARCHIVE_KINDS, archive_pet_logs, restore_pet_logs, verify_archive
+from pets.models import LogArchive, Pet
+
+
+class Command(BaseCommand):
+    help = '封存/還原/檢查舊的體重、健康日誌、施打紀錄'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, help='封存幾天以前的紀錄')
+        parser.add_argument('--inactive-days', type=int, help='主人幾天沒登入就封存他寵物的所有紀錄')
+        parser.add_argument('--kind', choices=list(ARCHIVE_KINDS), help='只處理一種日誌')
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE, help='每一包最多幾筆')
+        parser.add_argument('--restore', action='store_true', help='把封存的紀錄放回熱資料表')
+        parser.add_argument('--pet', type=int, help='--restore時只還原這隻寵物')
+        parser.add_argument('--verify', action='store_true', help='只檢查封存包，有問題就失敗')
+
+    def handle(self, *args, **options):
+        kinds = [options['kind']] if options['kind'] else list(ARCHIVE_KINDS)
+        if options['verify']:
+            return self.verify(kinds)
+        if options['restore']:
+            return self.restore(options['pet'], options['kind'])
+        if options['older_than_days'] is None and options['inactive_days'] is None:
+            raise CommandError('請指定 --older-than-days 或 --inactive-days')
+
+        total = 0
+        now = timezone.now()
+        if options['older_than_days'] is not None:
+            cutoff = timezone.localdate() - timedelta(days=options['older_than_days'])
+            for kind in kinds:
+                total += self.archive(kind, cutoff, None, options['batch_size'])
+        if options['inactive_days'] is not None:
+            since = now - timedelta(days=options['inactive_days'])
+            inactive = User.objects.filter(Q(last_login__lt=since) | Q(last_login__isnull=True, date_joined__lt=since))
+            # 明天當cutoff = 全部(每組最新一筆、未結案的還是會留著)
+            cutoff = timezone.localdate() + timedelta(days=1)
+            for kind in kinds:
+                total += self.archive(kind, cutoff, inactive, options['batch_size'])
+        self.stdout.write(f'共封存 {total} 筆紀錄')
+
+    def archive(self, kind, cutoff, owners, batch_size):
+        model, date_field, _ = ARCHIVE_KINDS[kind]
+        if date_field == 'created_at':
+            cutoff = timezone.make_aware(datetime.combine(cutoff, time.min))
+        logs = model.objects.filter(**{f'{date_field}__lt': cutoff})
+        if owners is not None:
+            logs = logs.filter(pet__owner__in=owners)
+        pet_ids = logs.order_by('pet_id').values_list('pet_id', flat=True).distinct()
+        count = 0
+        for pet_id in pet_ids.iterator():
+            count += archive_pet_logs(pet_id, kind, cutoff, batch_size)
+        self.stdout.write(f'{kind}: 封存 {count} 筆')
+        return count
+
+    def restore(self, pet_id, kind):
+        pets = LogArchive.objects.order_by('pet_id').values_list('pet_id', flat=True).distinct()
+        if pet_id is not None:
+            if not Pet.objects.filter(pk=pet_id).exists():
+                raise CommandError(f'找不到寵物 {pet_id}')
+            pets = [pet_id]
+        total = sum(restore_pet_logs(pet, kind) for pet in pets)
+        self.stdout.write(f'共還原 {total} 筆紀錄')
+
+    def verify(self, kinds):
+        checked = 0
+        failures = []
+        for archive in LogArchive.objects.filter(kind__in=kinds).order_by('pk').iterator(chunk_size=100):
+            checked += 1
+            for problem in verify_archive(archive):
+                failures.append(f'封存包 {archive.pk} (寵物 {archive.pet_id} {archive.kind}): {problem}')
+        for failure in failures:
+            self.stderr.write(failure)
+        if failures:
+            raise CommandError(f'{checked} 包中有 {len(failures)} 個問題')
+        self.stdout.write(f'{checked} 包封存資料都正常')
@@ -0,0 +1,286 @@
+# pets/management/commands/benchmark_endpoints.py
+# 對pets/urls.py、accounts/urls.py的每個API(每個路由名稱+HTTP方法)量延遲p50/p95與SQL查詢數
+# 先用 seed_demo_data 產生資料，再:
+#   python manage.py benchmark_endpoints --update-baseline     # 建立/更新基準檔
+#   python manage.py benchmark_endpoints                       # 跟基準比較，退步就失敗(exit code 1)
+# 寫入類的API每次都在savepoint裡執行後rollback，不會改到資料；上傳的檔案寫在暫存目錄
+
+import io
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from PIL import Image
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, get_resolver, reverse
+from rest_framework.authtoken.models import Token
+
+from accounts.authentication import token_cache
+from pets.models import UploadSession
+from pets.uploads import write_chunk
+
+from .seed_demo_data import USERNAME_PREFIX
+
+DEFAULT_BASELINE = os.path.join(settings.BASE_DIR, 'benchmarks', 'endpoint_baseline.json')
+
+
+
+def tiny_png():
+    # 分段上傳用的小圖
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), 'orange').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+TINY_PNG = tiny_png()
+
+
+def start_upload(fixtures):
+    session = UploadSession.objects.create(health_log_id=fixtures['health'], filename='bench.png', total_chunks=1)
+    return {'upload_id': session.pk}
+
+
+def uploaded_chunk(fixtures):
+    kwargs = start_upload(fixtures)
+    write_chunk(UploadSession.objects.get(pk=kwargs['upload_id']), 0, io.BytesIO(TINY_PNG))
+    return kwargs
+
+
+def pet_data(fixtures):
+    return {'name': '壓測', 'gender': 'F', 'birth_day': '2020-01-01',
+            'pet_type_id': fixtures['pet_type'], 'pet_species_id': fixtures['species']}
+
+
+def login_data(fixtures):
+    return {'username': fixtures['username'], 'password': fixtures['password']}
+
+
+PET = {'pk': 'pet'}
+WEIGHT = {'pet_pk': 'pet', 'pk': 'weight'}
+HEALTH = {'pet_pk': 'pet', 'pk': 'health'}
+INJECTION = {'pet_pk': 'pet', 'pk': 'injection'}
+
+# (路由名稱, 方法, URL參數(值是fixture名稱), 其他選項)
+# data、prepare可以是函式，參數是fixture dict
+CASES = [
+    ('api-root', 'GET', {}, {}),
+    ('pet-list', 'GET', {}, {}),
+    ('pet-list', 'POST', {}, {'data': pet_data}),
+    ('pet-detail', 'GET', PET, {}),
+    ('pet-detail', 'PUT', PET, {'data': pet_data}),
+    ('pet-detail', 'PATCH', PET, {'data': {'memo': '壓測'}}),
+    ('pet-detail', 'DELETE', PET, {}),
+    ('pet-export', 'GET', PET, {'query': '?fmt=ndjson'}),
+    ('pet-export-all', 'GET', {}, {'query': '?fmt=csv'}),
+    ('pet-timeline', 'GET', PET, {}),
+    ('pet-growth-percentile', 'GET', PET, {}),
+    ('sync', 'GET', {}, {}),
+    ('pet-type-list', 'GET', {}, {}),
+    ('pet-type-detail', 'GET', {'pk': 'pet_type'}, {}),
+    ('pet-type-species-list', 'GET', {'pet_type_pk': 'pet_type'}, {}),
+    ('pet-type-species-detail', 'GET', {'pet_type_pk': 'pet_type', 'pk': 'species'}, {}),
+    ('pet-weight-logs-list', 'GET', {'pet_pk': 'pet'}, {}),
+    ('pet-weight-logs-list', 'POST', {'pet_pk': 'pet'}, {'data': {'weight_kg': '4.20', 'recorded_at': '2000-01-01'}}),
+    ('pet-weight-logs-detail', 'GET', WEIGHT, {}),
+    ('pet-weight-logs-detail', 'PUT', WEIGHT, {'data': {'weight_kg': '4.20', 'recorded_at': '2000-01-01'}}),
+    ('pet-weight-logs-detail', 'PATCH', WEIGHT, {'data': {'weight_kg': '4.30'}}),
+    ('pet-weight-logs-detail', 'DELETE', WEIGHT, {}),
+    ('pet-weight-logs-bulk', 'POST', {'pet_pk': 'pet'},
+     {'data': [{'weight_kg': '4.20', 'recorded_at': f'2000-01-{day:02d}'} for day in range(1, 29)]}),
+    ('pet-weight-logs-series', 'GET', {'pet_pk': 'pet'}, {'query': '?resolution=week&points=100'}),
+    ('pet-health-logs-list', 'GET', {'pet_pk': 'pet'}, {}),
+    ('pet-health-logs-list', 'POST', {'pet_pk': 'pet'}, {'data': {'topic': '壓測', 'content': '壓測內容', 'action_write': 'NORMAL'}}),
+    ('pet-health-logs-detail', 'GET', HEALTH, {}),
+    ('pet-health-logs-detail', 'PUT', HEALTH, {'data': {'topic': '壓測', 'content': '壓測內容', 'action_write': 'NORMAL'}}),
+    ('pet-health-logs-detail', 'PATCH', HEALTH, {'data': {'case_closed': True}}),
+    ('pet-health-logs-detail', 'DELETE', HEALTH, {}),
+    ('pet-health-logs-search', 'GET', {'pet_pk': 'pet'}, {'query': '?q=毛球'}),
+    ('pet-health-logs-start-photo-upload', 'POST', HEALTH, {'data': {'filename': 'bench.png', 'total_chunks': 1}}),
+    ('pet-health-logs-photo-upload', 'GET', HEALTH, {'prepare': start_upload}),
+    ('pet-health-logs-photo-upload', 'DELETE', HEALTH, {'prepare': start_upload}),
+    ('pet-health-logs-photo-upload-chunk', 'PUT', {**HEALTH, 'index': 'chunk'},
+     {'prepare': start_upload, 'body': TINY_PNG}),
+    ('pet-health-logs-complete-photo-upload', 'POST', HEALTH, {'prepare': uploaded_chunk}),
+    ('pet-injection-logs-list', 'GET', {'pet_pk': 'pet'}, {}),
+    ('pet-injection-logs-list', 'POST', {'pet_pk': 'pet'},
+     {'data': {'injection_type': '體內驅蟲', 'injection_date': '2000-01-01'}}),
+    ('pet-injection-logs-detail', 'GET', INJECTION, {}),
+    ('pet-injection-logs-detail', 'PUT', INJECTION,
+     {'data': {'injection_type': '體內驅蟲', 'injection_date': '2000-01-01'}}),
+    ('pet-injection-logs-detail', 'PATCH', INJECTION, {'data': {'note': '壓測'}}),
+    ('pet-injection-logs-detail', 'DELETE', INJECTION, {}),
+    ('api-login', 'POST', {}, {'data': login_data, 'anonymous': True}),
+    ('api-profile', 'GET', {}, {}),
+    ('api-profile', 'PUT', {}, {'data': {'owner_name': '壓測'}}),
+    ('api-profile', 'PATCH', {}, {'data': {'owner_address': '壓測'}}),
+    ('api-auth-cache-stats', 'GET', {}, {}),
+]
+
+
+def _patterns(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from _patterns(pattern.url_patterns)
+        else:
+            yield pattern
+
+
+def router_endpoints():
+    # 所有(路由名稱, 方法)，新增API卻沒加進CASES時讓壓測直接失敗
+    found = set()
+    for urlconf in ('pets.urls', 'accounts.urls'):
+        for pattern in _patterns(get_resolver(urlconf).url_patterns):
+            callback = pattern.callback
+            methods = getattr(callback, 'actions', None)
+            if methods is None:
+                methods = [m for m in callback.cls.http_method_names if hasattr(callback.cls, m)]
+            found.update((pattern.name, method.upper()) for method in methods if method not in ('head', 'options'))
+    return found
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+class Command(BaseCommand):
+    help = '量測所有API的延遲與SQL查詢數，並跟基準檔比較'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help=f'用哪個使用者的資料，預設是第一個 {USERNAME_PREFIX}*')
+        parser.add_argument('--password', default='bench-password', help='登入API用的密碼')
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+        parser.add_argument('--update-baseline', action='store_true', help='把這次結果寫成新的基準')
+        parser.add_argument('--tolerance', type=float, default=0.25, help='p95可以比基準慢多少比例')
+        parser.add_argument('--slack-ms', type=float, default=5.0, help='再加上固定的毫秒數，避免很快的API因為誤差誤判')
+
+    def handle(self, *args, **options):
+        missing = router_endpoints() - {(name, method) for name, method, _, _ in CASES}
+        if missing:
+            raise CommandError('以下API沒有壓測案例: ' + ', '.join(f'{m} {n}' for n, m in sorted(missing)))
+
+        with tempfile.TemporaryDirectory() as tmp, override_settings(
+                ALLOWED_HOSTS=['testserver'], MEDIA_ROOT=tmp, CHUNKED_UPLOAD_DIR=os.path.join(tmp, 'chunks'),
+                PERF_SAMPLE_RATE=0):
+            results = self.run_cases(options)
+
+        self.print_results(results)
+        if options['update_baseline']:
+            os.makedirs(os.path.dirname(options['baseline']) or '.', exist_ok=True)
+            with open(options['baseline'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+            self.stdout.write(f'已寫入基準檔 {options["baseline"]}')
+            return
+
+        if not os.path.exists(options['baseline']):
+            raise CommandError(f'找不到基準檔 {options["baseline"]}，先加 --update-baseline 執行一次')
+        with open(options['baseline'], encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = self.compare(results, baseline, options['tolerance'], options['slack_ms'])
+        if regressions:
+            raise CommandError('效能退步:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('沒有效能退步'))
+
+    def fixtures(self, username, password):
+        users = User.objects.filter(pets__isnull=False)
+        users = users.filter(username=username) if username else users.filter(username__startswith=USERNAME_PREFIX)
+        user = users.order_by('pk').first()
+        pet = user and user.pets.order_by('pk').first()
+        if pet is None or pet.pet_type_id is None or pet.pet_species_id is None:
+            raise CommandError('找不到有寵物的壓測帳號，先執行 seed_demo_data')
+        ids = {
+            'pet': pet.pk,
+            'pet_type': pet.pet_type_id,
+            'species': pet.pet_species_id,
+            'weight': pet.weight_logs.values_list('pk', flat=True).first(),
+            'health': pet.health_logs.values_list('pk', flat=True).first(),
+            'injection': pet.injection_logs.values_list('pk', flat=True).first(),
+            'chunk': 0,
+        }
+        if None in ids.values():
+            raise CommandError(f'{user.username} 的第一隻寵物要有體重、健康日誌、施打紀錄各一筆')
+        return user, {**ids, 'username': user.username, 'password': password}
+
+    def run_cases(self, options):
+        user, fixtures = self.fixtures(options['username'], options['password'])
+        token, _ = Token.objects.get_or_create(user=user)
+        client = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+        anonymous = Client()
+        results = {}
+        with transaction.atomic():
+            # 管理員才能看的API也要量，結束時整個rollback
+            user.is_staff = True
+            user.save(update_fields=['is_staff'])
+            try:
+                for name, method, url_kwargs, extra in CASES:
+                    latencies, queries = [], 0
+                    # 第一次是暖機(快取、連線)，不列入統計
+                    for i in range(options['iterations'] + 1):
+                        with transaction.atomic():
+                            elapsed, count = self.request(client, anonymous, name, method,
+                                                          url_kwargs, extra, fixtures)
+                            transaction.set_rollback(True)
+                        if i:
+                            latencies.append(elapsed)
+                            queries = max(queries, count)
+                    results[f'{method} {name}'] = {
+                        'p50_ms': round(statistics.median(latencies) * 1000, 2),
+                        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+                        'queries': queries,
+                    }
+            finally:
+                transaction.set_rollback(True)
+                token_cache.evict([token.key])
+        return results
+
+    def request(self, client, anonymous, name, method, url_kwargs, extra, fixtures):
+        kwargs = {key: fixtures[value] for key, value in url_kwargs.items()}
+        if 'prepare' in extra:
+            kwargs.update(extra['prepare'](fixtures))
+        path = reverse(name, kwargs=kwargs) + extra.get('query', '')
+        data = extra.get('data')
+        if callable(data):
+            data = data(fixtures)
+        if 'body' in extra:
+            request_kwargs = {'data': extra['body'], 'content_type': 'application/octet-stream'}
+        elif data is not None:
+            request_kwargs = {'data': data, 'content_type': 'application/json'}
+        else:
+            request_kwargs = {}
+
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            response = getattr(anonymous if extra.get('anonymous') else client, method.lower())(path, **request_kwargs)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - start
+        if response.status_code >= 400:
+            raise CommandError(f'{method} {path} 回傳 {response.status_code}: {response.content[:200]!r}')
+        return elapsed, len(captured)
+
+    def print_results(self, results):
+        self.stdout.write(f'{"endpoint":60} {"p50 ms":>8} {"p95 ms":>8} {"queries":>8}')
+        for key, result in results.items():
+            self.stdout.write(f'{key:60} {result["p50_ms"]:8.2f} {result["p95_ms"]:8.2f} {result["queries"]:8}')
+
+    @staticmethod
+    def compare(results, baseline, tolerance, slack_ms):
+        regressions = []
+        for key, result in results.items():
+            expected = baseline.get(key)
+            if expected is None:
+                continue
+            if result['queries'] > expected['queries']:
+                regressions.append(f'{key}: 查詢數 {expected["queries"]} -> {result["queries"]}')
+            limit = expected['p95_ms'] * (1 + tolerance) + slack_ms
+            if result['p95_ms'] > limit:
+                regressions.append(f'{key}: p95 {expected["p95_ms"]}ms -> {result["p95_ms"]}ms (上限 {limit:.2f}ms)')
+        return regressions
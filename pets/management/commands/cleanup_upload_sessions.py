@@ -0,0 +1,17 @@
+# pets/management/commands/cleanup_upload_sessions.py
+# 清掉放太久沒完成的分段上傳，建議用cron定期跑
+
+from django.core.management.base import BaseCommand
+
+from pets.uploads import discard, expired_sessions
+
+
+class Command(BaseCommand):
+    help = '刪除過期的照片分段上傳與暫存檔'
+
+    def handle(self, *args, **options):
+        count = 0
+        for session in expired_sessions().iterator():
+            discard(session)
+            count += 1
+        self.stdout.write(f'已清除 {count} 個上傳')
@@ -0,0 +1,30 @@
+# pets/management/commands/compute_growth_curves.py
+# 重算各品種的體重百分位曲線(pets/growth.py)，排程每天跑一次，只算有新資料的品種
+#   python manage.py compute_growth_curves
+#   python manage.py compute_growth_curves --all        # 升級後、調整年齡區間後全部重算
+#   python manage.py compute_growth_curves --species 3
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pets.growth import PET_BATCH_SIZE, compute_species, compute_stale, mark_stale
+from pets.models import Pet, PetSpecies
+
+
+class Command(BaseCommand):
+    help = '重算有新體重資料的品種的百分位曲線'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='所有有寵物的品種都重算')
+        parser.add_argument('--species', type=int, help='只重算這個品種(不管有沒有標記)')
+        parser.add_argument('--batch-size', type=int, default=PET_BATCH_SIZE, help='每次讀幾隻寵物的體重')
+
+    def handle(self, *args, **options):
+        if options['species'] is not None:
+            if not PetSpecies.objects.filter(pk=options['species']).exists():
+                raise CommandError(f"找不到品種 {options['species']}")
+            results = {options['species']: compute_species(options['species'], options['batch_size'])}
+        else:
+            if options['all']:
+                mark_stale(*Pet.objects.order_by().values_list('pet_species_id', flat=True).distinct())
+            results = compute_stale(options['batch_size'])
+        self.stdout.write(f'重算 {len(results)} 個品種，共 {sum(results.values())} 個年齡區間')
@@ -0,0 +1,88 @@
+# pets/management/commands/gc_media_blobs.py
+# 刪掉沒有人用的照片blob(pets/storage.py)跟它們的縮圖，建議用cron每天跑：
+#   python manage.py gc_media_blobs                 # 引用數0而且超過--grace-hours沒動的
+#   python manage.py gc_media_blobs --recount       # 先從寵物、健康日誌(含封存)重算引用數，在沒有人上傳的時段跑
+# 剛上傳還沒存進資料的blob引用數也是0，所以要等一段時間才刪
+
+import os
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from pets.archive import unpack
+from pets.images import variant_names
+from pets.models import HealthLog, LogArchive, MediaBlob, Pet
+from pets.storage import BLOB_DIR, blob_storage
+
+GC_BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = '刪除沒有引用的照片blob'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, default=24, help='引用數歸零後保留幾小時')
+        parser.add_argument('--recount', action='store_true', help='先重算所有blob的引用數')
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            self.stdout.write(f'修正 {self.recount()} 個blob的引用數')
+
+        storage = blob_storage()
+        cutoff = timezone.now() - timedelta(hours=options['grace_hours'])
+        unused = MediaBlob.objects.filter(ref_count__lte=0, updated_at__lt=cutoff)
+        removed = 0
+        freed = 0
+        last_digest = ''
+        while True:
+            batch = list(unused.filter(digest__gt=last_digest).order_by('digest')[:GC_BATCH_SIZE])
+            if not batch:
+                break
+            last_digest = batch[-1].digest
+            # 保險：引用數被並行修改弄錯時，熱資料表裡還有人用的不刪
+            names = [blob.name for blob in batch]
+            in_use = {*Pet.objects.filter(photo__in=names).values_list('photo', flat=True),
+                      *HealthLog.objects.filter(photo_records__in=names).values_list('photo_records', flat=True)}
+            for blob in batch:
+                if blob.name in in_use:
+                    continue
+                with transaction.atomic():
+                    # 條件式刪除：這段時間有人又上傳同一張照片(updated_at會更新)就不刪
+                    deleted, _ = unused.filter(pk=blob.pk).delete()
+                    if deleted:
+                        for name in (blob.name, *variant_names(blob.name)):
+                            storage.delete(name)
+                removed += deleted
+                freed += blob.size if deleted else 0
+
+        self.stdout.write(f'刪除 {removed} 個blob，釋放 {freed} bytes，清掉 {self.remove_partials(cutoff)} 個暫存檔')
+
+    def recount(self):
+        counts = Counter()
+        counts.update(Pet.objects.exclude(photo='').exclude(photo__isnull=True)
+                      .values_list('photo', flat=True).iterator())
+        counts.update(HealthLog.objects.exclude(photo_records='').exclude(photo_records__isnull=True)
+                      .values_list('photo_records', flat=True).iterator())
+        for archive in LogArchive.objects.filter(kind='health').iterator(chunk_size=100):
+            counts.update(log.photo_records.name for log in unpack(archive) if log.photo_records)
+        fixed = 0
+        for digest, name, ref_count in MediaBlob.objects.values_list('digest', 'name', 'ref_count').iterator():
+            if ref_count != counts[name]:
+                MediaBlob.objects.filter(pk=digest).update(ref_count=counts[name], updated_at=timezone.now())
+                fixed += 1
+        return fixed
+
+    def remove_partials(self, cutoff):
+        # 上傳到一半中斷留下的暫存檔
+        directory = blob_storage().path(BLOB_DIR)
+        if not os.path.isdir(directory):
+            return 0
+        removed = 0
+        for entry in os.scandir(directory):
+            if entry.name.endswith('.part') and entry.stat().st_mtime < cutoff.timestamp():
+                os.remove(entry.path)
+                removed += 1
+        return removed
@@ -0,0 +1,27 @@
+# pets/management/commands/generate_photo_variants.py
+# 補產生舊照片的縮圖: python manage.py generate_photo_variants
+
+from django.core.management.base import BaseCommand
+
+from pets.images import generate_variants
+from pets.models import Pet, HealthLog
+
+
+class Command(BaseCommand):
+    help = '為還沒有縮圖的寵物照片、健康日誌照片產生縮圖與WebP'
+
+    def handle(self, *args, **options):
+        targets = [
+            (Pet, 'photo'),
+            (HealthLog, 'photo_records'),
+        ]
+        for model, photo_field in targets:
+            pending = (model.objects
+                       .exclude(**{photo_field: ''}).exclude(**{f'{photo_field}__isnull': True})
+                       .filter(photo_thumbnail__isnull=True)
+                       .values_list('pk', flat=True))
+            count = 0
+            for pk in pending.iterator():
+                generate_variants(model, pk, photo_field, 'photo_thumbnail', 'photo_medium')
+                count += 1
+            self.stdout.write(f'{model.__name__}: {count} 筆')
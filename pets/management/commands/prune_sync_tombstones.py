@@ -0,0 +1,30 @@
+# pets/management/commands/prune_sync_tombstones.py
+# 清掉太舊的刪除墓碑(models.Tombstone)，排程每天跑：
+#   python manage.py prune_sync_tombstones --days 90
+# 清掉之後，cursor比清掉的序號舊的App拿到410，要重新完整同步
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from pets.models import ChangeCounter, Tombstone
+
+
+class Command(BaseCommand):
+    help = '清掉超過指定天數的同步刪除墓碑'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90, help='保留幾天內的墓碑')
+
+    def handle(self, *args, **options):
+        old = Tombstone.objects.filter(deleted_at__lt=timezone.now() - timedelta(days=options['days']))
+        with transaction.atomic():
+            pruned = old.order_by().values('owner_id').annotate(change_seq=Max('change_seq'))
+            for row in pruned:
+                ChangeCounter.objects.filter(owner_id=row['owner_id'], pruned_seq__lt=row['change_seq']).update(
+                    pruned_seq=row['change_seq'])
+            count, _ = old.delete()
+        self.stdout.write(f'清掉 {count} 筆墓碑')
@@ -0,0 +1,67 @@
+# pets/management/commands/rebuild_pet_summaries.py
+# 用日誌表重算PetSummary，分批處理；--check 只檢查不修
+#   python manage.py rebuild_pet_summaries --batch-size 1000
+#   python manage.py rebuild_pet_summaries --check
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pets.models import Pet, PetSummary
+from pets.summaries import touch
+
+SUMMARY_FIELDS = ['open_case_count', 'last_weight_kg', 'last_weight_recorded_at',
+                  'last_injection_date', 'next_injection_date',
+                  'weight_trend_kg', 'weight_rate_kg_per_week', 'weight_anomaly']
+
+
+class Command(BaseCommand):
+    help = '重建寵物主頁統計(PetSummary)並檢查是否跟日誌不一致'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--check', action='store_true', help='只回報不一致的數量，不寫入')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        checked = drifted = 0
+        last_pk = 0
+        while True:
+            # 用pk做keyset分批，每批一次查詢算出正確值
+            pets = list(Pet.objects.filter(pk__gt=last_pk).order_by('pk')
+                        .with_dashboard_fields()[:batch_size])
+            if not pets:
+                break
+            last_pk = pets[-1].pk
+            current = PetSummary.objects.in_bulk([pet.pk for pet in pets])
+
+            fixes = []
+            for pet in pets:
+                expected = self.expected_summary(pet)
+                actual = current.get(pet.pk)
+                if actual is None or any(getattr(actual, f) != getattr(expected, f) for f in SUMMARY_FIELDS):
+                    fixes.append(expected)
+            checked += len(pets)
+            drifted += len(fixes)
+            if fixes and not options['check']:
+                PetSummary.objects.bulk_create(fixes, update_conflicts=True, unique_fields=['pet'],
+                                               update_fields=SUMMARY_FIELDS)
+                # 版本、同步序號也要換，ETag變了App才會重新拿修正後的統計
+                touch(*(fix.pet_id for fix in fixes))
+
+        if options['check'] and drifted:
+            raise CommandError(f'{checked} 隻寵物中有 {drifted} 隻的統計不一致')
+        action = '檢查' if options['check'] else '修正'
+        self.stdout.write(f'共 {checked} 隻寵物，{action} {drifted} 隻')
+
+    @staticmethod
+    def expected_summary(pet):
+        return PetSummary(
+            pet_id=pet.pk,
+            open_case_count=pet.open_case_count,
+            last_weight_kg=pet.latest_weight_kg,
+            last_weight_recorded_at=pet.latest_weight_recorded_at,
+            last_injection_date=pet.latest_injection_date,
+            next_injection_date=pet.latest_next_injection_date,
+            weight_trend_kg=pet.latest_weight_trend_kg,
+            weight_rate_kg_per_week=pet.latest_weight_rate_kg_per_week,
+            weight_anomaly=pet.latest_weight_anomaly or '',
+        )
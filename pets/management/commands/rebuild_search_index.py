@@ -0,0 +1,37 @@
+# pets/management/commands/rebuild_search_index.py
+# 斷詞規則改了、或用bulk操作改過健康日誌之後，重建全文搜尋索引
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from pets.models import HealthLog
+from pets.search import FTS_TABLE, fts_available, index_tokens
+
+
+class Command(BaseCommand):
+    help = '重新斷詞並重建健康日誌全文搜尋索引'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        batch = []
+        count = 0
+        for log in HealthLog.objects.only('pk', 'topic', 'content').iterator(chunk_size=batch_size):
+            log.search_tokens = index_tokens(log.topic, log.content)
+            batch.append(log)
+            if len(batch) >= batch_size:
+                HealthLog.objects.bulk_update(batch, ['search_tokens'])
+                count += len(batch)
+                batch = []
+        if batch:
+            HealthLog.objects.bulk_update(batch, ['search_tokens'])
+            count += len(batch)
+
+        if fts_available():
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {FTS_TABLE}')
+                cursor.execute(f'INSERT INTO {FTS_TABLE}(rowid, search_tokens) '
+                               f'SELECT id, search_tokens FROM pets_healthlog')
+        self.stdout.write(f'已重建 {count} 筆健康日誌的索引')
@@ -0,0 +1,44 @@
+# pets/management/commands/recompute_weight_trends.py
+# 從頭重算每隻寵物的體重趨勢與異常標記(pets/weight_trends.py)，升級後或調整門檻後跑一次
+#   python manage.py recompute_weight_trends
+#   python manage.py recompute_weight_trends --pet 12
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pets.models import Pet, WeightLog
+from pets.weight_trends import update_trends
+
+
+class Command(BaseCommand):
+    help = '重算體重趨勢統計與異常標記'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pet', type=int, help='只重算這隻寵物')
+        parser.add_argument('--batch-size', type=int, default=1000, help='每次讀幾隻寵物的id')
+
+    def handle(self, *args, **options):
+        if options['pet'] is not None:
+            if not Pet.objects.filter(pk=options['pet']).exists():
+                raise CommandError(f"找不到寵物 {options['pet']}")
+            pet_ids = [options['pet']]
+        else:
+            pet_ids = self.pets_with_weights(options['batch_size'])
+
+        pets = changed = 0
+        for pet_id in pet_ids:
+            # 一隻一隻來，記憶體只放一隻的紀錄
+            changed += update_trends(pet_id)
+            pets += 1
+        self.stdout.write(f'{pets} 隻寵物，更新 {changed} 筆體重紀錄')
+
+    @staticmethod
+    def pets_with_weights(batch_size):
+        # 用pet_id做keyset分批
+        last_pk = 0
+        while True:
+            batch = list(WeightLog.objects.filter(pet_id__gt=last_pk).order_by('pet_id')
+                         .values_list('pet_id', flat=True).distinct()[:batch_size])
+            if not batch:
+                return
+            yield from batch
+            last_pk = batch[-1]
@@ -0,0 +1,43 @@
+# pets/management/commands/schedule_injection_reminders.py
+# 每天跑一次，替N天內到期/已逾期的施打紀錄建立提醒
+#   python manage.py schedule_injection_reminders --days 7 --chunk-size 1000
+# 同一天重跑會從上次中斷的寵物繼續；已完成的就直接結束
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from pets.models import ReminderRun
+from pets.reminders import run_reminders
+
+
+class Command(BaseCommand):
+    help = '依建議施打日產生施打提醒(可中斷續跑、重跑不重複)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help='幾天內到期的要提醒')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='每批處理幾隻寵物')
+        parser.add_argument('--max-chunks', type=int, default=None, help='這次最多處理幾批(分段執行用)')
+        parser.add_argument('--restart', action='store_true', help='今天已經跑完也重新從頭跑')
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        run, created = ReminderRun.objects.get_or_create(
+            run_date=today, defaults={'horizon': today + timedelta(days=options['days'])})
+        if options['restart'] and not created:
+            run.last_pet_id = 0
+            run.finished_at = None
+            run.horizon = today + timedelta(days=options['days'])
+            run.save()
+        elif run.finished_at:
+            self.stdout.write(f'{today} 已經跑完，建立了 {run.reminders_created} 筆提醒')
+            return
+
+        finished = run_reminders(run, options['chunk_size'], options['max_chunks'])
+        if finished:
+            run.finished_at = timezone.now()
+            run.save(update_fields=['finished_at'])
+            self.stdout.write(f'完成，建立了 {run.reminders_created} 筆提醒')
+        else:
+            self.stdout.write(f'處理到寵物 #{run.last_pet_id}，再執行一次會接著跑')
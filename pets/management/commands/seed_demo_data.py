@@ -0,0 +1,215 @@
+# pets/management/commands/seed_demo_data.py
+# 產生壓測用的假資料：N個使用者、每人M隻寵物，加上體重/健康/施打日誌，全部用bulk_create寫入
+#   python manage.py seed_demo_data --users 200 --pets 3 --weights 150 --health-logs 40 --injections 12
+# 使用者帳號是 bench_user_<n>，密碼用 --password 指定，token會一起建好
+# bulk_create不會跑save()跟signal，next_date、search_tokens在這裡算好，最後再重算體重趨勢、重建PetSummary、品種百分位曲線與全文搜尋索引
+
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from accounts.models import Profile
+from pets.ingest import BULK_BATCH_SIZE
+from pets.models import (
+    FoodBrandChoices, HealthAction, HealthLog, InjectionInterval, InjectionLog, Pet, PetGender,
+    PetSpecies, PetType, WeightLog, DEFAULT_INJECTION_INTERVAL_DAYS,
+)
+from pets.search import FTS_TABLE, fts_available, index_tokens
+
+USERNAME_PREFIX = 'bench_user_'
+
+# 資料庫沒有物種時才建立；後面的數字是成年體重(kg)的平均與標準差
+DEFAULT_CATALOG = {
+    '貓貓': {'米克斯': (4.5, 0.8), '英國短毛貓': (5.0, 0.9), '布偶貓': (6.0, 1.0)},
+    '狗狗': {'米克斯犬': (14.0, 5.0), '柴犬': (9.5, 1.5), '柯基': (12.0, 1.5)},
+}
+FALLBACK_WEIGHT = (5.0, 1.5)
+
+PET_NAMES = ['咪咪', '小黑', '橘子', '奶茶', '麻糬', '豆花', '布丁', '可樂', '饅頭', '阿福']
+
+# (處置, 主旨, 內容, 權重)：大部分是日常紀錄，少數需要就醫
+HEALTH_TEMPLATES = [
+    (HealthAction.NORMAL, '日常檢查', '精神食慾都正常，排便正常。', 6),
+    (HealthAction.NORMAL, '剪指甲', '順便檢查耳朵跟牙齒，沒有異狀。', 2),
+    (HealthAction.OBSERVATION, '吐毛球', '早上吐了一次毛球，之後正常進食。', 3),
+    (HealthAction.OBSERVATION, '食慾變差', '今天乾糧只吃一半，明天再觀察。', 2),
+    (HealthAction.OBSERVATION, '軟便', '換飼料後軟便，先減少份量。', 2),
+    (HealthAction.SEE_DOCTOR, '嘔吐就醫', '一天吐了三次，帶去醫院打止吐針。', 1),
+    (HealthAction.SEE_DOCTOR, '皮膚紅腫', '後腿一直舔，獸醫說是黴菌感染，開了藥膏。', 1),
+]
+
+# 沒有設定InjectionInterval時用的類型與間隔
+DEFAULT_INJECTIONS = {'三合一疫苗': 365, '狂犬病疫苗': 365, '體內驅蟲': 30, '體外驅蟲': 30}
+
+
+class Command(BaseCommand):
+    help = '產生壓測用的使用者、寵物與日誌假資料'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--pets', type=int, default=2, help='每個使用者平均幾隻寵物')
+        parser.add_argument('--weights', type=int, default=100, help='每隻寵物平均幾筆體重')
+        parser.add_argument('--health-logs', type=int, default=30, help='每隻寵物平均幾筆健康日誌')
+        parser.add_argument('--injections', type=int, default=10, help='每隻寵物平均幾筆施打紀錄')
+        parser.add_argument('--password', default='bench-password')
+        parser.add_argument('--seed', type=int, default=0, help='亂數種子，同樣的參數會產生同樣的資料')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.today = timezone.localdate()
+        species = self.species_weights()
+        injection_days = dict(InjectionInterval.objects.values_list('injection_type', 'interval_days'))
+        self.injection_days = injection_days or DEFAULT_INJECTIONS
+        # 記住目前最大的id，最後只把新的健康日誌放進全文搜尋索引
+        last_health_log = HealthLog.objects.aggregate(last=Max('pk'))['last'] or 0
+
+        with transaction.atomic():
+            users = self.create_users(options['users'], options['password'])
+            pets = self.create_pets(users, options['pets'], species)
+            counts = self.create_logs(pets, species, options)
+
+        self.stdout.write('重建主頁統計...')
+        call_command('recompute_weight_trends', stdout=self.stdout)
+        call_command('rebuild_pet_summaries', stdout=self.stdout)
+        call_command('compute_growth_curves', '--all', stdout=self.stdout)
+        if fts_available():
+            with connection.cursor() as cursor:
+                cursor.execute(f'INSERT INTO {FTS_TABLE}(rowid, search_tokens) '
+                               f'SELECT id, search_tokens FROM pets_healthlog WHERE id > %s',
+                               [last_health_log])
+        self.stdout.write(self.style.SUCCESS(
+            f'建立 {len(users)} 個使用者、{len(pets)} 隻寵物、{counts[0]} 筆體重、'
+            f'{counts[1]} 筆健康日誌、{counts[2]} 筆施打紀錄'))
+
+    def around(self, mean):
+        # 每隻寵物的筆數在平均值的0.5~1.5倍之間
+        return self.rng.randint(mean // 2, mean + mean // 2) if mean else 0
+
+    def species_weights(self):
+        if not PetSpecies.objects.exists():
+            for type_name, breeds in DEFAULT_CATALOG.items():
+                pet_type, _ = PetType.objects.get_or_create(name=type_name)
+                for name in breeds:
+                    PetSpecies.objects.get_or_create(name=name, defaults={'pet_type': pet_type})
+        known = {name: weight for breeds in DEFAULT_CATALOG.values() for name, weight in breeds.items()}
+        return {species: known.get(species.name, FALLBACK_WEIGHT)
+                for species in PetSpecies.objects.select_related('pet_type')}
+
+    def create_users(self, count, password):
+        # 密碼雜湊很慢，所有假帳號共用同一個
+        password = make_password(password)
+        start = User.objects.filter(username__startswith=USERNAME_PREFIX).count()
+        users = User.objects.bulk_create([
+            User(username=f'{USERNAME_PREFIX}{start + i}', password=password)
+            for i in range(count)
+        ], batch_size=BULK_BATCH_SIZE)
+        Profile.objects.bulk_create([Profile(user=user, owner_name=user.username) for user in users],
+                                    batch_size=BULK_BATCH_SIZE)
+        Token.objects.bulk_create([Token(user=user, key=Token.generate_key()) for user in users],
+                                  batch_size=BULK_BATCH_SIZE)
+        return users
+
+    def create_pets(self, users, per_user, species):
+        rng = self.rng
+        choices = list(species)
+        pets = []
+        for user in users:
+            for _ in range(max(1, self.around(per_user))):
+                pet_species = rng.choice(choices)
+                pets.append(Pet(
+                    owner=user,
+                    name=rng.choice(PET_NAMES),
+                    pet_type=pet_species.pet_type,
+                    pet_species=pet_species,
+                    gender=rng.choice([PetGender.MALE, PetGender.FEMALE]),
+                    sterilised=rng.random() < 0.7,
+                    birth_day=self.today - timedelta(days=rng.randint(60, 15 * 365)),
+                    favorite_food=rng.choice(['', *FoodBrandChoices.values]),
+                ))
+        return Pet.objects.bulk_create(pets, batch_size=BULK_BATCH_SIZE)
+
+    def create_logs(self, pets, species, options):
+        totals = [0, 0, 0]
+        # 一次處理一批寵物，記憶體只留一批的日誌
+        for start in range(0, len(pets), 100):
+            weights, health_logs, created_at, injections = [], [], [], []
+            for pet in pets[start:start + 100]:
+                weights += self.weight_logs(pet, species[pet.pet_species], options['weights'])
+                for log, created in self.health_logs(pet, options['health_logs']):
+                    health_logs.append(log)
+                    created_at.append(created)
+                injections += self.injection_logs(pet, options['injections'])
+
+            WeightLog.objects.bulk_create(weights, batch_size=BULK_BATCH_SIZE)
+            InjectionLog.objects.bulk_create(injections, batch_size=BULK_BATCH_SIZE)
+            HealthLog.objects.bulk_create(health_logs, batch_size=BULK_BATCH_SIZE)
+            # created_at是auto_now_add，bulk_create時一定會被蓋成現在，寫入後再改回去
+            for log, created in zip(health_logs, created_at):
+                log.created_at = created
+            HealthLog.objects.bulk_update(health_logs, ['created_at'], batch_size=BULK_BATCH_SIZE)
+
+            totals[0] += len(weights)
+            totals[1] += len(health_logs)
+            totals[2] += len(injections)
+        return totals
+
+    def history_days(self, pet):
+        return max(1, (self.today - pet.birth_day).days)
+
+    def weight_logs(self, pet, weight, mean_count):
+        # 從今天往回，每3~10天量一次，體重在成年體重附近隨機漂移
+        rng = self.rng
+        mean, sd = weight
+        kg = max(0.5, rng.gauss(mean, sd))
+        day = self.today - timedelta(days=rng.randint(0, 3))
+        logs = []
+        for _ in range(self.around(mean_count)):
+            if day < pet.birth_day:
+                break
+            logs.append(WeightLog(pet=pet, weight_kg=Decimal(f'{kg:.2f}'), recorded_at=day))
+            kg = max(0.5, kg + rng.gauss(0, mean * 0.01))
+            day -= timedelta(days=rng.randint(3, 10))
+        return logs
+
+    def health_logs(self, pet, mean_count):
+        rng = self.rng
+        weights = [template[3] for template in HEALTH_TEMPLATES]
+        span = self.history_days(pet)
+        for _ in range(self.around(mean_count)):
+            action, topic, content, _weight = rng.choices(HEALTH_TEMPLATES, weights)[0]
+            created = timezone.now() - timedelta(days=rng.randint(0, span), minutes=rng.randint(0, 1440))
+            # 最近30天的就醫/觀察紀錄比較可能還沒結案
+            recent = (timezone.now() - created).days < 30
+            log = HealthLog(
+                pet=pet, topic=topic, content=content, action=action,
+                case_closed=action == HealthAction.NORMAL or not recent or rng.random() < 0.5,
+                search_tokens=index_tokens(topic, content),
+            )
+            yield log, created
+
+    def injection_logs(self, pet, mean_count):
+        # 筆數平均分給每種疫苗/驅蟲，照間隔往回排，偶爾晚打幾天
+        rng = self.rng
+        count = self.around(mean_count)
+        types = list(self.injection_days.items())
+        logs = []
+        for i, (injection_type, interval) in enumerate(types):
+            interval = interval or DEFAULT_INJECTION_INTERVAL_DAYS
+            day = self.today - timedelta(days=rng.randint(0, interval))
+            for _ in range(count // len(types) + (i < count % len(types))):
+                if day < pet.birth_day:
+                    break
+                log = InjectionLog(pet=pet, injection_type=injection_type, injection_date=day)
+                log.next_date = log.compute_next_date(interval_days=interval)
+                logs.append(log)
+                day -= timedelta(days=interval + rng.randint(0, 14))
+        return logs
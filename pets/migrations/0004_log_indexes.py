@@ -0,0 +1,29 @@
+# Generated by Django 5.2.3 on 2026-10-17 17:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pets', '0003_pet_sterilised'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='healthlog',
+            index=models.Index(fields=['pet', 'created_at', 'id'], name='healthlog_pet_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='healthlog',
+            index=models.Index(condition=models.Q(('case_closed', False)), fields=['pet'], name='healthlog_pet_open_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='injectionlog',
+            index=models.Index(fields=['pet', 'injection_date', 'id'], name='injectionlog_pet_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='weightlog',
+            index=models.Index(fields=['pet', 'recorded_at', 'id'], name='weightlog_pet_recorded_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.3 on 2026-10-17 17:33
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pets', '0005_photo_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255)),
+                ('total_chunks', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('health_log', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to='pets.healthlog')),
+            ],
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.3 on 2026-10-17 17:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pets', '0006_uploadsession'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PetSummary',
+            fields=[
+                ('pet', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='pets.pet')),
+                ('open_case_count', models.PositiveIntegerField(default=0)),
+                ('last_weight_kg', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('last_weight_recorded_at', models.DateField(blank=True, null=True)),
+                ('last_injection_date', models.DateField(blank=True, null=True)),
+                ('next_injection_date', models.DateField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 5.2.3 on 2026-10-17 17:38
+
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_next_date(apps, schema_editor):
+    # 舊資料都是用固定30天算的，照原本的規則補上
+    InjectionLog = apps.get_model('pets', 'InjectionLog')
+    batch = []
+    for log in InjectionLog.objects.filter(next_date__isnull=True).only('pk', 'injection_date').iterator(chunk_size=2000):
+        log.next_date = log.injection_date + timedelta(days=30)
+        batch.append(log)
+        if len(batch) >= 2000:
+            InjectionLog.objects.bulk_update(batch, ['next_date'])
+            batch = []
+    if batch:
+        InjectionLog.objects.bulk_update(batch, ['next_date'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pets', '0007_petsummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InjectionInterval',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('injection_type', models.CharField(max_length=100, unique=True)),
+                ('interval_days', models.PositiveIntegerField(verbose_name='間隔天數')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='InjectionReminder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('due_date', models.DateField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ReminderRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('run_date', models.DateField(unique=True)),
+                ('horizon', models.DateField()),
+                ('last_pet_id', models.BigIntegerField(default=0)),
+                ('reminders_created', models.PositiveIntegerField(default=0)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='injectionlog',
+            name='next_date',
+            field=models.DateField(blank=True, editable=False, null=True, verbose_name='建議下次施打日'),
+        ),
+        migrations.RunPython(backfill_next_date, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='injectionlog',
+            index=models.Index(fields=['pet', 'injection_type', 'injection_date'], name='injectionlog_pet_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='injectionlog',
+            index=models.Index(fields=['next_date'], name='injectionlog_next_date_idx'),
+        ),
+        migrations.AddField(
+            model_name='injectionreminder',
+            name='injection_log',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='reminder', to='pets.injectionlog'),
+        ),
+        migrations.AddField(
+            model_name='injectionreminder',
+            name='pet',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='injection_reminders', to='pets.pet'),
+        ),
+        migrations.AddIndex(
+            model_name='injectionreminder',
+            index=models.Index(fields=['pet', 'due_date'], name='reminder_pet_due_idx'),
+        ),
+    ]
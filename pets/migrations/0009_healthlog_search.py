@@ -0,0 +1,76 @@
+# Generated by Django 5.2.3 on 2026-10-17 17:40
+
+import re
+
+from django.db import OperationalError, migrations, models
+
+# 建立這個migration時pets/search.py的斷詞規則，複製一份固定在這裡：之後改斷詞規則不會影響舊的migration
+# (改了規則要用 manage.py rebuild_search_index 重建)
+_CJK = r'\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af'
+_CJK_RUN = re.compile(rf'[{_CJK}]+')
+_TOKEN_RUN = re.compile(rf'[{_CJK}]+|[0-9a-z\u00c0-\u024f]+')
+
+
+def index_tokens(*texts):
+    tokens = []
+    for text in texts:
+        for run in _TOKEN_RUN.findall((text or '').lower()):
+            if _CJK_RUN.fullmatch(run):
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+                tokens.extend(run)
+            else:
+                tokens.append(run)
+    return ' '.join(dict.fromkeys(tokens))
+
+
+def backfill_search_tokens(apps, schema_editor):
+    HealthLog = apps.get_model('pets', 'HealthLog')
+    batch = []
+    for log in HealthLog.objects.only('pk', 'topic', 'content').iterator(chunk_size=2000):
+        log.search_tokens = index_tokens(log.topic, log.content)
+        batch.append(log)
+        if len(batch) >= 2000:
+            HealthLog.objects.bulk_update(batch, ['search_tokens'])
+            batch = []
+    if batch:
+        HealthLog.objects.bulk_update(batch, ['search_tokens'])
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        try:
+            schema_editor.execute('CREATE VIRTUAL TABLE pets_healthlog_fts USING fts5(search_tokens)')
+        except OperationalError:
+            # 這個SQLite沒編進FTS5，搜尋會退回LIKE
+            return
+        schema_editor.execute('INSERT INTO pets_healthlog_fts(rowid, search_tokens) '
+                              'SELECT id, search_tokens FROM pets_healthlog')
+    elif vendor == 'postgresql':
+        schema_editor.execute("CREATE INDEX pets_healthlog_search_gin ON pets_healthlog "
+                              "USING GIN (to_tsvector('simple', search_tokens))")
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS pets_healthlog_fts')
+    elif vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS pets_healthlog_search_gin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pets', '0008_injection_next_date_reminders'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='healthlog',
+            name='search_tokens',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.RunPython(backfill_search_tokens, migrations.RunPython.noop),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-17 17:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pets', '0009_healthlog_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='petsummary',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.3 on 2026-10-17 17:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pets', '0010_petsummary_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pet',
+            index=models.Index(fields=['owner', 'birth_day'], name='pet_owner_birth_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pet',
+            index=models.Index(fields=['owner', 'name'], name='pet_owner_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='petsummary',
+            index=models.Index(fields=['next_injection_date'], name='petsummary_next_inj_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.3 on 2026-10-17 18:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pets', '0011_pet_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LogArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('weight', '體重'), ('health', '健康日誌'), ('injection', '施打紀錄')], max_length=10)),
+                ('first_date', models.DateField()),
+                ('last_date', models.DateField()),
+                ('min_log_id', models.BigIntegerField()),
+                ('max_log_id', models.BigIntegerField()),
+                ('row_count', models.PositiveIntegerField()),
+                ('payload', models.BinaryField()),
+                ('checksum', models.CharField(max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('pet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='log_archives', to='pets.pet')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['pet', 'kind', 'last_date'], name='logarchive_pet_kind_idx')],
+            },
+        ),
+    ]
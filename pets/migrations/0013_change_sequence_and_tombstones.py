@@ -0,0 +1,79 @@
+# Generated by Django 5.2.3 on 2026-10-17 18:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pets', '0012_logarchive'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeCounter',
+            fields=[
+                ('owner_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('value', models.PositiveBigIntegerField(default=0)),
+                ('pruned_seq', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owner_id', models.BigIntegerField()),
+                ('kind', models.CharField(choices=[('pet', '寵物'), ('weight', '體重'), ('health', '健康日誌'), ('injection', '施打紀錄')], max_length=10)),
+                ('object_id', models.BigIntegerField()),
+                ('pet_id', models.BigIntegerField()),
+                ('change_seq', models.PositiveBigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='healthlog',
+            name='change_seq',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='injectionlog',
+            name='change_seq',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='pet',
+            name='change_seq',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='weightlog',
+            name='change_seq',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='healthlog',
+            index=models.Index(fields=['pet', 'change_seq', 'id'], name='healthlog_pet_change_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='injectionlog',
+            index=models.Index(fields=['pet', 'change_seq', 'id'], name='injectionlog_pet_change_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pet',
+            index=models.Index(fields=['owner', 'change_seq', 'id'], name='pet_owner_change_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='weightlog',
+            index=models.Index(fields=['pet', 'change_seq', 'id'], name='weightlog_pet_change_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['owner_id', 'change_seq', 'id'], name='tombstone_owner_change_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['deleted_at'], name='tombstone_deleted_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.3 on 2026-10-17 18:15
+
+import pets.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pets', '0013_change_sequence_and_tombstones'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='healthlog',
+            name='photo_records',
+            field=models.ImageField(blank=True, null=True, storage=pets.storage.blob_storage, upload_to='health_log_photos/'),
+        ),
+        migrations.AlterField(
+            model_name='pet',
+            name='photo',
+            field=models.ImageField(blank=True, null=True, storage=pets.storage.blob_storage, upload_to='pet_photos/'),
+        ),
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('size', models.PositiveBigIntegerField()),
+                ('ref_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('ref_count__lte', 0)), fields=['updated_at'], name='mediablob_unused_idx')],
+            },
+        ),
+    ]
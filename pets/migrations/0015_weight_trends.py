@@ -0,0 +1,58 @@
+# Generated by Django 5.2.3 on 2026-10-17 18:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pets', '0014_content_addressed_media'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='petsummary',
+            name='weight_anomaly',
+            field=models.CharField(blank=True, choices=[('', '正常'), ('RAPID_LOSS', '體重快速下降'), ('RAPID_GAIN', '體重快速上升'), ('OUTLIER', '跟趨勢差很多')], default='', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='petsummary',
+            name='weight_rate_kg_per_week',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='petsummary',
+            name='weight_trend_kg',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='weightlog',
+            name='anomaly',
+            field=models.CharField(blank=True, choices=[('', '正常'), ('RAPID_LOSS', '體重快速下降'), ('RAPID_GAIN', '體重快速上升'), ('OUTLIER', '跟趨勢差很多')], default='', editable=False, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='weightlog',
+            name='anomaly_score',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='weightlog',
+            name='rate_kg_per_week',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='weightlog',
+            name='reading_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='weightlog',
+            name='trend_kg',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='weightlog',
+            name='trend_variance',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.3 on 2026-10-17 18:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pets', '0015_weight_trends'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StaleGrowthCurve',
+            fields=[
+                ('species', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='pets.petspecies')),
+                ('marked_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='GrowthCurve',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('age_months', models.PositiveSmallIntegerField()),
+                ('pet_count', models.PositiveIntegerField()),
+                ('quantiles', models.JSONField()),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('species', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='growth_curves', to='pets.petspecies')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('species', 'age_months'), name='growthcurve_species_age_uniq')],
+            },
+        ),
+    ]
@@ -1,8 +1,14 @@
 # pets/models.py
-from django.db import models
+import uuid
+
+from django.db import models, router, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
+from .search import index_tokens
+from .storage import blob_storage
 from django.utils import timezone
-from datetime import timedelta
+from datetime import datetime, timedelta
 
 # 定義選項
 class PetGender(models.TextChoices):
@@ -15,6 +21,13 @@ class HealthAction(models.TextChoices):
     OBSERVATION = 'OBSERVATE', '觀察'
     NORMAL = 'NORMAL', '正常'
 
+# 體重異常(pets/weight_trends.py判斷)
+class WeightAnomaly(models.TextChoices):
+    NONE = '', '正常'
+    RAPID_LOSS = 'RAPID_LOSS', '體重快速下降'
+    RAPID_GAIN = 'RAPID_GAIN', '體重快速上升'
+    OUTLIER = 'OUTLIER', '跟趨勢差很多'
+
 # 食物品牌考慮之後建一個完整模型，先簡單做
 class FoodBrandChoices(models.TextChoices):
     ROYAL_CANIN = 'RC', '皇家'
@@ -38,8 +51,90 @@ class PetSpecies(models.Model):
     def __str__(self):
         return self.name
 
+class PetQuerySet(models.QuerySet):
+
+    def with_dashboard_fields(self):
+        # 主頁需要的計算欄位改在資料庫端用子查詢算好，列表不再每隻寵物各查一次
+        open_cases = (HealthLog.objects
+                      .filter(pet=OuterRef('pk'), case_closed=False)
+                      .order_by()
+                      .values('pet')
+                      .annotate(count=Count('pk'))
+                      .values('count'))
+        latest_injection = (InjectionLog.objects
+                            .filter(pet=OuterRef('pk'))
+                            .order_by('-injection_date', '-pk'))
+        latest_weight = (WeightLog.objects
+                         .filter(pet=OuterRef('pk'))
+                         .order_by('-recorded_at', '-pk'))
+        return self.annotate(
+            open_case_count=Coalesce(Subquery(open_cases), Value(0)),
+            latest_injection_date=Subquery(latest_injection.values('injection_date')[:1]),
+            latest_next_injection_date=Subquery(latest_injection.values('next_date')[:1]),
+            latest_weight_kg=Subquery(latest_weight.values('weight_kg')[:1]),
+            latest_weight_recorded_at=Subquery(latest_weight.values('recorded_at')[:1]),
+            latest_weight_trend_kg=Subquery(latest_weight.values('trend_kg')[:1]),
+            latest_weight_rate_kg_per_week=Subquery(latest_weight.values('rate_kg_per_week')[:1]),
+            latest_weight_anomaly=Subquery(latest_weight.values('anomaly')[:1]),
+        )
+
+
+# 離線同步(pets/sync.py)用的序號，每個主人各自遞增
+# 寫入時在同一個transaction裡把計數器+1，commit之前同一個主人的其他寫入要等，序號的順序就是commit的順序
+# 主人存整數不用ForeignKey：刪帳號連帶刪除寵物時還是會走到這裡
+class ChangeCounter(models.Model):
+    owner_id = models.BigIntegerField(primary_key=True)
+    value = models.PositiveBigIntegerField(default=0)
+    # 序號在這之前的墓碑已經清掉了(prune_sync_tombstones)，比這個舊的cursor要整個重新同步
+    pruned_seq = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.owner_id}: {self.value}"
+
+    @classmethod
+    def next(cls, owner_id):
+        # 一定要在transaction裡呼叫，計數器會鎖到commit為止
+        if not cls.objects.filter(owner_id=owner_id).update(value=F('value') + 1):
+            cls.objects.get_or_create(owner_id=owner_id)
+            cls.objects.filter(owner_id=owner_id).update(value=F('value') + 1)
+        return cls.objects.filter(owner_id=owner_id).values_list('value', flat=True).get()
+
+    @classmethod
+    def bump(cls, queryset):
+        # .update()、bulk_update改過的紀錄換上新的序號，每個主人拿一個
+        owner_field = 'owner_id' if queryset.model is Pet else 'pet__owner_id'
+        by_owner = {}
+        for owner_id, pk in queryset.values_list(owner_field, 'pk'):
+            by_owner.setdefault(owner_id, []).append(pk)
+        for owner_id, pks in by_owner.items():
+            with transaction.atomic():
+                change_seq = cls.next(owner_id)
+                queryset.model.objects.filter(pk__in=pks).update(change_seq=change_seq)
+
+
+class ChangeTrackedModel(models.Model):
+    # 每次save()都換上主人的下一個序號，同步API用(change_seq, id)找出變動過的紀錄
+    change_seq = models.PositiveBigIntegerField(default=0, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def change_owner_id(self):
+        return self.pet.owner_id
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        # 拿序號跟寫入要在同一個transaction，post_save裡的更新也用同一個序號
+        with transaction.atomic(using=using):
+            self.change_seq = ChangeCounter.next(self.change_owner_id())
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'change_seq'}
+            super().save(*args, **kwargs)
+
+
 # 主模型
-class Pet(models.Model):
+class Pet(ChangeTrackedModel):
 
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='pets')
     name = models.CharField(max_length=100)
@@ -49,7 +144,11 @@ class Pet(models.Model):
     # 0702新增：絕育選項
     sterilised = models.BooleanField(default=False,verbose_name='已絕育')
 
-    photo = models.ImageField(upload_to='pet_photos/', blank=True, null=True)
+    # 內容定址存放(pets/storage.py)，同一張照片只存一份
+    photo = models.ImageField(upload_to='pet_photos/', storage=blob_storage, blank=True, null=True)
+    # 縮圖由pets/images.py在背景產生
+    photo_thumbnail = models.ImageField(blank=True, null=True, editable=False)
+    photo_medium = models.ImageField(blank=True, null=True, editable=False)
     birth_day = models.DateField()
     favorite_food = models.CharField(max_length=10, choices=FoodBrandChoices.choices, blank=True)
     memo = models.TextField(blank=True, verbose_name="備註")
@@ -57,6 +156,31 @@ class Pet(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = PetQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # 列表用年齡(生日)、名字篩選排序，都是在同一個主人底下
+            models.Index(fields=['owner', 'birth_day'], name='pet_owner_birth_idx'),
+            models.Index(fields=['owner', 'name'], name='pet_owner_name_idx'),
+            # 同步API：這個主人序號之後變動過的寵物
+            models.Index(fields=['owner', 'change_seq', 'id'], name='pet_owner_change_idx'),
+        ]
+
+    def change_owner_id(self):
+        return self.owner_id
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # 記住讀出來時的照片，換照片時才知道舊的blob要減引用數
+        instance = super().from_db(db, field_names, values)
+        if 'photo' in field_names:
+            instance._loaded_photo = instance.photo.name or None
+        # 改品種或生日時，兩邊品種的百分位曲線都要重算(pets/growth.py)
+        if 'pet_species_id' in field_names and 'birth_day' in field_names:
+            instance._loaded_growth = (instance.pet_species_id, instance.birth_day)
+        return instance
+
     @property
     def age(self):
         today = timezone.now().date()
@@ -68,46 +192,326 @@ class Pet(models.Model):
         return f"{self.name} ({self.owner.username})"
 
 
-class InjectionLog(models.Model):
+# 主頁用的統計，日誌新增/修改/刪除時由pets/summaries.py同步更新
+# 讀取時只要join這一張表；如果跟日誌對不起來，用 manage.py rebuild_pet_summaries 重建
+class PetSummary(models.Model):
+    pet = models.OneToOneField(Pet, on_delete=models.CASCADE, primary_key=True, related_name='summary')
+    open_case_count = models.PositiveIntegerField(default=0)
+    last_weight_kg = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    last_weight_recorded_at = models.DateField(null=True, blank=True)
+    last_injection_date = models.DateField(null=True, blank=True)
+    next_injection_date = models.DateField(null=True, blank=True)
+    # 寵物或任何一筆日誌有變動就+1(pets/summaries.py的touch)，API的ETag/Last-Modified用
+    version = models.PositiveBigIntegerField(default=0)
+    # 最新一筆體重紀錄的趨勢統計(pets/weight_trends.py)
+    weight_trend_kg = models.FloatField(null=True, blank=True)
+    weight_rate_kg_per_week = models.FloatField(null=True, blank=True)
+    weight_anomaly = models.CharField(max_length=10, choices=WeightAnomaly.choices, blank=True, default='')
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # 逾期未施打的篩選
+            models.Index(fields=['next_injection_date'], name='petsummary_next_inj_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.pet_id} summary"
+
+
+# 沒有設定間隔的施打類型，預設30天
+DEFAULT_INJECTION_INTERVAL_DAYS = 30
+
+
+# 各種疫苗/驅蟲的建議間隔(例如 三合一 365天、體內驅蟲 30天)
+class InjectionInterval(models.Model):
+    injection_type = models.CharField(max_length=100, unique=True)
+    interval_days = models.PositiveIntegerField(verbose_name="間隔天數")
+
+    def __str__(self):
+        return f"{self.injection_type} ({self.interval_days}天)"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # 記住原本的類型名稱，改名時舊名稱的紀錄也要重算(會變回預設間隔)
+        instance = super().from_db(db, field_names, values)
+        if 'injection_type' in field_names:
+            instance._loaded_injection_type = instance.injection_type
+        return instance
+
+    @classmethod
+    def days_for(cls, injection_type):
+        interval = cls.objects.filter(injection_type=injection_type).values_list('interval_days', flat=True).first()
+        return interval if interval is not None else DEFAULT_INJECTION_INTERVAL_DAYS
+
+
+class InjectionLog(ChangeTrackedModel):
     pet = models.ForeignKey(Pet, on_delete=models.CASCADE, related_name='injection_logs')
     injection_type = models.CharField(max_length=100)  # 體內驅蟲、三合一...etc
     note = models.TextField(blank=True)
     injection_date = models.DateField(default=timezone.now, verbose_name="施打日期")
+    # 建議下次施打日，存檔時依InjectionInterval算好存起來，才能用SQL查哪些到期
+    next_date = models.DateField(null=True, blank=True, editable=False, verbose_name="建議下次施打日")
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # 分頁排序、最近一筆施打紀錄都走這個索引
+            models.Index(fields=['pet', 'injection_date', 'id'], name='injectionlog_pet_date_idx'),
+            # 同類型最新一筆(提醒排程判斷是否已經補打)
+            models.Index(fields=['pet', 'injection_type', 'injection_date'], name='injectionlog_pet_type_idx'),
+            # 到期/逾期查詢
+            models.Index(fields=['next_date'], name='injectionlog_next_date_idx'),
+            models.Index(fields=['pet', 'change_seq', 'id'], name='injectionlog_pet_change_idx'),
+        ]
+
     def __str__(self):
         return f"{self.pet.name} - {self.injection_type}"
 
-    @property
-    def next_date(self):
-        # 根據注射日、自動計算建議施打日期
-        if self.injection_date:
-            return self.injection_date + timedelta(days=30) # 假設一年一次
-        return None
+    def save(self, *args, **kwargs):
+        # 根據注射日、施打類型自動計算建議施打日期
+        self.next_date = self.compute_next_date()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'next_date'}
+        super().save(*args, **kwargs)
+
+    def compute_next_date(self, interval_days=None):
+        injection_date = self.injection_date
+        if not injection_date:
+            return None
+        if isinstance(injection_date, datetime):
+            # 預設值timezone.now是datetime，換成當地日期
+            injection_date = timezone.localtime(injection_date).date()
+        if interval_days is None:
+            interval_days = InjectionInterval.days_for(self.injection_type)
+        return injection_date + timedelta(days=interval_days)
+
+
+# 排程產生的施打提醒，每筆施打紀錄最多一筆提醒(重跑不會重複)
+class InjectionReminder(models.Model):
+    pet = models.ForeignKey(Pet, on_delete=models.CASCADE, related_name='injection_reminders')
+    injection_log = models.OneToOneField(InjectionLog, on_delete=models.CASCADE, related_name='reminder')
+    due_date = models.DateField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['pet', 'due_date'], name='reminder_pet_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.injection_log} due {self.due_date}"
+
 
+# 提醒排程每天一筆，記錄處理到哪隻寵物，中斷後可以接著跑
+class ReminderRun(models.Model):
+    run_date = models.DateField(unique=True)
+    horizon = models.DateField()
+    last_pet_id = models.BigIntegerField(default=0)
+    reminders_created = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
 
-class HealthLog(models.Model):
+    def __str__(self):
+        return f"{self.run_date} (pet > {self.last_pet_id})"
+
+
+class HealthLog(ChangeTrackedModel):
     pet = models.ForeignKey(Pet, on_delete=models.CASCADE, related_name='health_logs')
     topic = models.CharField(max_length=200)
     content = models.TextField()
-    photo_records = models.ImageField(upload_to='health_log_photos/', blank=True, null=True)
+    photo_records = models.ImageField(upload_to='health_log_photos/', storage=blob_storage, blank=True, null=True)
+    photo_thumbnail = models.ImageField(blank=True, null=True, editable=False)
+    photo_medium = models.ImageField(blank=True, null=True, editable=False)
     action = models.CharField(max_length=20, choices=HealthAction.choices)
     case_closed = models.BooleanField(default=False, verbose_name="是否結案")
+    # 全文搜尋用的斷詞結果(pets/search.py)，存檔時自動更新
+    search_tokens = models.TextField(blank=True, editable=False)
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['pet', 'created_at', 'id'], name='healthlog_pet_created_idx'),
+            # 只索引未結案的日誌，算待追蹤數量時不用掃已結案的
+            models.Index(fields=['pet'], condition=models.Q(case_closed=False), name='healthlog_pet_open_idx'),
+            models.Index(fields=['pet', 'change_seq', 'id'], name='healthlog_pet_change_idx'),
+        ]
+
     def __str__(self):
         # __str__ 必須回傳一個字串
         return f"{self.topic} ({self.get_action_display()})"
 
-class WeightLog(models.Model):
+    def save(self, *args, **kwargs):
+        self.search_tokens = index_tokens(self.topic, self.content)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'search_tokens'}
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # 記住從資料庫讀出來時的狀態，存檔時才知道待追蹤數量要加還是減
+        instance = super().from_db(db, field_names, values)
+        if 'case_closed' in field_names and 'pet_id' in field_names:
+            instance._loaded_state = (instance.pet_id, instance.case_closed)
+        if 'photo_records' in field_names:
+            instance._loaded_photo = instance.photo_records.name or None
+        return instance
+
+# 健康日誌照片的分段上傳，分段檔案放在settings.CHUNKED_UPLOAD_DIR/<id>/
+class UploadSession(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    health_log = models.ForeignKey(HealthLog, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    total_chunks = models.PositiveIntegerField()
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.total_chunks} chunks)"
+
+
+class WeightLog(ChangeTrackedModel):
     pet = models.ForeignKey(Pet, on_delete=models.CASCADE, related_name='weight_logs')
     weight_kg = models.DecimalField(max_digits=5, decimal_places=2)
     recorded_at = models.DateField(default=timezone.now) # 記錄日期，不用created_at因為可能是補記
+    # 依日期排到這一筆為止的趨勢統計，存檔時由pets/weight_trends.py算好
+    trend_kg = models.FloatField(null=True, blank=True, editable=False)  # 指數加權平均
+    trend_variance = models.FloatField(null=True, blank=True, editable=False)
+    rate_kg_per_week = models.FloatField(null=True, blank=True, editable=False)
+    reading_count = models.PositiveIntegerField(default=0, editable=False)
+    anomaly = models.CharField(max_length=10, choices=WeightAnomaly.choices, blank=True, default='', editable=False)
+    # 跟前一筆趨勢差幾個標準差
+    anomaly_score = models.FloatField(null=True, blank=True, editable=False)
 
     class Meta:
         # 新的紀錄在最前面
         ordering = ['-recorded_at']
+        indexes = [
+            models.Index(fields=['pet', 'recorded_at', 'id'], name='weightlog_pet_recorded_idx'),
+            models.Index(fields=['pet', 'change_seq', 'id'], name='weightlog_pet_change_idx'),
+        ]
 
     def __str__(self):
         return f"{self.pet.name} - {self.weight_kg}kg on {self.recorded_at}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # 記住原本的日期，改日期時趨勢要從比較早的那一天開始重算
+        instance = super().from_db(db, field_names, values)
+        if 'recorded_at' in field_names:
+            instance._loaded_recorded_at = instance.recorded_at
+        return instance
+
+
+# 冷資料封存：太舊的日誌壓縮成一包存這裡，原本的資料表只留常用的
+# payload是zlib壓縮的JSON lines(一行一筆，欄位跟原本的資料表一樣)，checksum是壓縮前的sha256
+# 由 manage.py archive_logs 產生/還原/檢查，巢狀日誌API會一起讀(pets/archive.py)
+class LogArchive(models.Model):
+    KIND_CHOICES = [('weight', '體重'), ('health', '健康日誌'), ('injection', '施打紀錄')]
+
+    pet = models.ForeignKey(Pet, on_delete=models.CASCADE, related_name='log_archives')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    # 這一包日誌的日期範圍(健康日誌用UTC日期)與id範圍，讀取時用來跳過不需要解壓的包
+    first_date = models.DateField()
+    last_date = models.DateField()
+    min_log_id = models.BigIntegerField()
+    max_log_id = models.BigIntegerField()
+    row_count = models.PositiveIntegerField()
+    payload = models.BinaryField()
+    checksum = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['pet', 'kind', 'last_date'], name='logarchive_pet_kind_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.pet_id} {self.kind} {self.first_date}~{self.last_date} ({self.row_count})"
+
+
+# 刪除紀錄留下的墓碑，同步API告訴App哪些要刪掉
+# 寵物被刪時只留寵物的墓碑(App自己刪掉底下的日誌)，刪帳號時不留
+class Tombstone(models.Model):
+    KIND_CHOICES = [('pet', '寵物'), ('weight', '體重'), ('health', '健康日誌'), ('injection', '施打紀錄')]
+
+    owner_id = models.BigIntegerField()
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    pet_id = models.BigIntegerField()
+    change_seq = models.PositiveBigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['owner_id', 'change_seq', 'id'], name='tombstone_owner_change_idx'),
+            models.Index(fields=['deleted_at'], name='tombstone_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id} (seq {self.change_seq})"
+
+
+# 內容定址存放的照片檔(pets/storage.py)，一個sha256一個檔案
+# ref_count是有幾筆寵物/健康日誌(含封存的)用到它；0而且一段時間沒動的由 manage.py gc_media_blobs 刪掉
+class MediaBlob(models.Model):
+    digest = models.CharField(max_length=64, primary_key=True)
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # 只索引沒人用的，清理時不用掃全部
+            models.Index(fields=['updated_at'], condition=models.Q(ref_count__lte=0), name='mediablob_unused_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count})"
+
+    @classmethod
+    def retain(cls, name):
+        # 舊的檔案(不是blob)沒有這一列，不會更新到
+        if name:
+            cls.objects.filter(name=name).update(ref_count=F('ref_count') + 1, updated_at=timezone.now())
+
+    @classmethod
+    def release(cls, name):
+        if name:
+            cls.objects.filter(name=name).update(ref_count=F('ref_count') - 1, updated_at=timezone.now())
+
+
+# 各品種各年齡區間的體重百分位(pets/growth.py)，由 manage.py compute_growth_curves 批次算好
+# 年齡區間：未滿一歲每個月一區，之後每年一區；quantiles是第0~100百分位的體重(kg)，共101個
+class GrowthCurve(models.Model):
+    species = models.ForeignKey(PetSpecies, on_delete=models.CASCADE, related_name='growth_curves')
+    age_months = models.PositiveSmallIntegerField()  # 區間起點
+    pet_count = models.PositiveIntegerField()  # 幾隻寵物的樣本
+    quantiles = models.JSONField()
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            # API查寵物的百分位只讀這一列
+            models.UniqueConstraint(fields=['species', 'age_months'], name='growthcurve_species_age_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.species_id} {self.age_months}m ({self.pet_count})"
+
+
+# 有新的體重資料、要重算百分位曲線的品種；compute_growth_curves算完就刪掉
+class StaleGrowthCurve(models.Model):
+    species = models.OneToOneField(PetSpecies, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    marked_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.species_id} (since {self.marked_at})"
@@ -0,0 +1,97 @@
+# pets/pagination.py
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+# 日誌類的分頁，用cursor(keyset)而不是offset，翻到第N頁的成本跟第1頁一樣
+# 排序欄位要跟models.py裡的複合索引對得上
+# DRF的cursor只記ordering第一個欄位，同一天的紀錄靠offset跳過，翻頁中間有新增/刪除就會漏掉或重複；
+# 這裡位置記成'日期|id'(跟pets/archive.py封存資料的分頁一樣)，ordering必須是(日期, id)同方向
+class LogCursorPagination(CursorPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def _get_position_from_instance(self, instance, ordering):
+        value = getattr(instance, ordering[0].lstrip('-'))
+        return f'{value.isoformat()}|{instance.pk}'
+
+    def _after_position(self, queryset, position, descending):
+        # 排序在position後面的紀錄(descending: 比它舊)
+        field = queryset.model._meta.get_field(self.ordering[0].lstrip('-'))
+        try:
+            value, pk = position.rsplit('|', 1)
+            value, pk = field.to_python(value), int(pk)
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+        lookup = 'lt' if descending else 'gt'
+        return queryset.filter(Q(**{f'{field.name}__{lookup}': value}) | Q(**{field.name: value, f'id__{lookup}': pk}))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # 跟CursorPagination.paginate_queryset一樣，只有用位置過濾的地方改成(日期, id)
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            offset, reverse, current_position = 0, False, None
+        else:
+            offset, reverse, current_position = self.cursor
+
+        if reverse:
+            queryset = queryset.order_by(*[field[1:] if field.startswith('-') else f'-{field}'
+                                           for field in self.ordering])
+        else:
+            queryset = queryset.order_by(*self.ordering)
+        if current_position is not None:
+            descending = self.ordering[0].startswith('-')
+            queryset = self._after_position(queryset, current_position, descending != reverse)
+
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.page = results[:self.page_size]
+        following_position = None
+        if len(results) > len(self.page):
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = current_position is not None or offset > 0
+            self.has_previous = following_position is not None
+            self.next_position = current_position
+            self.previous_position = following_position
+        else:
+            self.has_next = following_position is not None
+            self.has_previous = current_position is not None or offset > 0
+            self.next_position = following_position
+            self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+
+class WeightLogPagination(LogCursorPagination):
+    ordering = ('-recorded_at', '-id')
+
+
+class HealthLogPagination(LogCursorPagination):
+    ordering = ('-created_at', '-id')
+
+
+class InjectionLogPagination(LogCursorPagination):
+    ordering = ('-injection_date', '-id')
+
+
+# 寵物列表預設不分頁(舊版App直接拿陣列)，帶 ?page_size= 才分頁
+# 排序可以用 ?ordering= 任意指定(pets/filters.py)，所以用頁碼而不是cursor
+class PetPagination(PageNumberPagination):
+    page_size = None
+    page_size_query_param = 'page_size'
+    max_page_size = 500
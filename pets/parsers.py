@@ -0,0 +1,47 @@
+# pets/parsers.py
+
+import csv
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+def iter_lines(stream, encoding):
+    # 從request一行一行讀，不把整個body讀進記憶體
+    first = True
+    for raw in iter(stream.readline, b''):
+        line = raw.decode(encoding, errors='replace')
+        if first:
+            line = line.lstrip('\ufeff')  # Excel匯出的CSV會帶BOM
+            first = False
+        yield line
+
+
+class NDJSONParser(BaseParser):
+    # 每行一筆JSON，回傳的是generator，讀到哪解析到哪
+    # 壞掉的那行會給ParseError，交給呼叫端記錄成該筆的錯誤
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        return self._iter_rows(stream, encoding)
+
+    def _iter_rows(self, stream, encoding):
+        for line in iter_lines(stream, encoding):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as exc:
+                yield ParseError(f'JSON格式錯誤: {exc}')
+
+
+class CSVParser(BaseParser):
+    # 第一行是欄位名稱(例如 weight_kg,recorded_at)，之後每行轉成dict
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        return csv.DictReader(iter_lines(stream, encoding))
@@ -0,0 +1,75 @@
+# pets/reminders.py
+# 施打提醒：找出「同類型最新一筆」的建議施打日已到期(或即將到期)的紀錄
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+
+from .models import ChangeCounter, Pet, InjectionLog, InjectionInterval, InjectionReminder
+from .summaries import refresh_latest_injection, touch
+
+UPDATE_BATCH_SIZE = 2000
+
+
+def due_injection_logs(horizon):
+    # 已經有更新的同類型紀錄(補打過了)就不算到期
+    newer = InjectionLog.objects.filter(
+        Q(injection_date__gt=OuterRef('injection_date'))
+        | Q(injection_date=OuterRef('injection_date'), pk__gt=OuterRef('pk')),
+        pet=OuterRef('pet'),
+        injection_type=OuterRef('injection_type'),
+    )
+    return (InjectionLog.objects
+            .filter(next_date__lte=horizon)
+            .exclude(Exists(newer)))
+
+
+def run_reminders(run, chunk_size, max_chunks=None):
+    # 依寵物pk分批往後走，每批做完就記下進度，中斷後從run.last_pet_id接著跑
+    # 提醒對施打紀錄是一對一，重跑只會略過已經建立的
+    chunks = 0
+    while max_chunks is None or chunks < max_chunks:
+        pet_ids = list(Pet.objects.filter(pk__gt=run.last_pet_id)
+                       .order_by('pk').values_list('pk', flat=True)[:chunk_size])
+        if not pet_ids:
+            return True
+
+        logs = (due_injection_logs(run.horizon)
+                .filter(pet_id__in=pet_ids, reminder__isnull=True)
+                .values_list('pk', 'pet_id', 'next_date'))
+        reminders = [InjectionReminder(injection_log_id=pk, pet_id=pet_id, due_date=next_date)
+                     for pk, pet_id, next_date in logs]
+        with transaction.atomic():
+            if reminders:
+                # ignore_conflicts時bulk_create回傳的是傳進去的全部物件，略過的也在裡面；
+                # 用前後的筆數算實際建立幾筆(同時跑的排程先建了就不算)
+                batch = InjectionReminder.objects.filter(injection_log_id__in=[r.injection_log_id for r in reminders])
+                before = batch.count()
+                InjectionReminder.objects.bulk_create(reminders, ignore_conflicts=True)
+                run.reminders_created += batch.count() - before
+            run.last_pet_id = pet_ids[-1]
+            run.save(update_fields=['last_pet_id', 'reminders_created'])
+        chunks += 1
+    return False
+
+
+def apply_injection_interval(injection_type):
+    # 間隔設定改了，重算這個類型所有紀錄的建議施打日，再更新受影響寵物的主頁統計
+    interval_days = InjectionInterval.days_for(injection_type)
+    logs = InjectionLog.objects.filter(injection_type=injection_type).only('pk', 'pet_id', 'injection_date')
+    batch = []
+    pet_ids = set()
+    for log in logs.iterator(chunk_size=UPDATE_BATCH_SIZE):
+        log.next_date = log.compute_next_date(interval_days)
+        batch.append(log)
+        pet_ids.add(log.pet_id)
+        if len(batch) >= UPDATE_BATCH_SIZE:
+            InjectionLog.objects.bulk_update(batch, ['next_date'])
+            batch = []
+    if batch:
+        InjectionLog.objects.bulk_update(batch, ['next_date'])
+    for pet_id in pet_ids:
+        refresh_latest_injection(pet_id)
+    if pet_ids:
+        # next_date在API回應裡，這些紀錄的同步序號也要換
+        ChangeCounter.bump(InjectionLog.objects.filter(injection_type=injection_type))
+        touch(*pet_ids)
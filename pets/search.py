@@ -0,0 +1,164 @@
+# pets/search.py
+# 健康日誌全文搜尋
+# 中文沒有空白斷詞，所以把中日韓文字切成bigram(嘔吐物 -> 嘔吐 吐物)，英數字照單字切，
+# 切好的詞存在HealthLog.search_tokens，再交給資料庫的全文索引：
+#   SQLite: FTS5虛擬表 pets_healthlog_fts(rowid = HealthLog.id)，由signals在存檔/刪除時維護
+#   PostgreSQL: to_tsvector('simple', search_tokens) 的GIN索引，欄位更新索引就跟著更新
+#   其他資料庫: 退回 LIKE 比對
+
+import re
+
+from django.db import connection
+from django.utils.html import escape
+
+FTS_TABLE = 'pets_healthlog_fts'
+SNIPPET_RADIUS = 40
+
+_CJK = r'\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af'
+_CJK_RUN = re.compile(rf'[{_CJK}]+')
+_TOKEN_RUN = re.compile(rf'[{_CJK}]+|[0-9a-z\u00c0-\u024f]+')
+
+
+def _runs(text):
+    return _TOKEN_RUN.findall((text or '').lower())
+
+
+def index_tokens(*texts):
+    # 存進索引的詞：中文的bigram再加上單字，單一個字的查詢也找得到
+    tokens = []
+    for text in texts:
+        for run in _runs(text):
+            if _CJK_RUN.fullmatch(run):
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+                tokens.extend(run)
+            else:
+                tokens.append(run)
+    return ' '.join(dict.fromkeys(tokens))
+
+
+def query_tokens(query):
+    # 查詢只用bigram(一個字的才用單字)，所有詞都要出現
+    tokens = []
+    for run in _runs(query):
+        if _CJK_RUN.fullmatch(run) and len(run) > 1:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return list(dict.fromkeys(tokens))
+
+
+def fts_available():
+    # 查到有索引表就記在這條連線上，之後存檔/刪除/搜尋不用每次都列一次資料表
+    # 沒有的話不記(migrate建表之前查過也不會一直以為沒有)
+    if connection.vendor != 'sqlite':
+        return False
+    connection.ensure_connection()
+    if getattr(connection, '_fts_connection', None) is not connection.connection:
+        if FTS_TABLE not in connection.introspection.table_names():
+            return False
+        connection._fts_connection = connection.connection
+    return True
+
+
+def index_health_log(log):
+    if fts_available():
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [log.pk])
+            cursor.execute(f'INSERT INTO {FTS_TABLE}(rowid, search_tokens) VALUES (%s, %s)',
+                           [log.pk, log.search_tokens])
+
+
+def unindex_health_log(pk):
+    if fts_available():
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [pk])
+
+
+def search_health_logs(pet_id, query, limit):
+    # 回傳依相關度排序的HealthLog list，每筆多一個rank(越大越相關)
+    # 封存的健康日誌不在索引裡，排在索引查到的後面(新的在前，rank是0)
+    tokens = query_tokens(query)
+    if not tokens:
+        return []
+    logs = _search_index(pet_id, tokens, limit)
+    if len(logs) < limit:
+        logs += _search_archived(pet_id, tokens, limit - len(logs))
+    return logs
+
+
+def _search_archived(pet_id, tokens, limit):
+    # archive.py也import這個檔案，這裡用到才import
+    from .archive import archived_logs
+    from .models import LogArchive
+
+    if not LogArchive.objects.filter(pet_id=pet_id, kind='health').exists():
+        return []
+    logs = []
+    for log in archived_logs(pet_id, 'health'):
+        if set(tokens) <= set(log.search_tokens.split()):
+            log.rank = 0
+            logs.append(log)
+            if len(logs) >= limit:
+                break
+    return logs
+
+
+def _search_index(pet_id, tokens, limit):
+    from .models import HealthLog
+
+    if fts_available():
+        match = ' '.join(f'"{token}"' for token in tokens)
+        # bm25越小越相關，轉成負數讓rank越大越好
+        logs = HealthLog.objects.raw(
+            f'SELECT h.*, -bm25({FTS_TABLE}) AS rank FROM {FTS_TABLE} '
+            f'JOIN pets_healthlog h ON h.id = {FTS_TABLE}.rowid '
+            f'WHERE {FTS_TABLE} MATCH %s AND h.pet_id = %s '
+            f'ORDER BY rank DESC, h.created_at DESC LIMIT %s',
+            [match, pet_id, limit])
+        return list(logs)
+
+    if connection.vendor == 'postgresql':
+        logs = HealthLog.objects.raw(
+            "SELECT h.*, ts_rank(to_tsvector('simple', h.search_tokens), q) AS rank "
+            "FROM pets_healthlog h, plainto_tsquery('simple', %s) q "
+            "WHERE h.pet_id = %s AND to_tsvector('simple', h.search_tokens) @@ q "
+            "ORDER BY rank DESC, h.created_at DESC LIMIT %s",
+            [' '.join(tokens), pet_id, limit])
+        return list(logs)
+
+    logs = HealthLog.objects.filter(pet_id=pet_id)
+    for token in tokens:
+        logs = logs.filter(search_tokens__contains=token)
+    logs = list(logs.order_by('-created_at')[:limit])
+    for log in logs:
+        log.rank = 0
+    return logs
+
+
+def highlight(text, query, snippet=False):
+    # 把查詢字串出現的地方用<mark>標起來(其餘文字會escape)
+    # snippet=True時只取第一個命中附近的一段
+    text = text or ''
+    terms = sorted(set(_runs(query)), key=len, reverse=True)
+    if not terms:
+        return escape(text)
+    pattern = re.compile('|'.join(re.escape(term) for term in terms), re.IGNORECASE)
+
+    if snippet:
+        first = pattern.search(text)
+        start = max((first.start() if first else 0) - SNIPPET_RADIUS, 0)
+        end = (first.end() if first else 0) + SNIPPET_RADIUS
+        prefix = '…' if start > 0 else ''
+        suffix = '…' if end < len(text) else ''
+        text = text[start:end]
+    else:
+        prefix = suffix = ''
+
+    parts = []
+    last = 0
+    for match in pattern.finditer(text):
+        parts.append(escape(text[last:match.start()]))
+        parts.append(f'<mark>{escape(match.group())}</mark>')
+        last = match.end()
+    parts.append(escape(text[last:]))
+    return prefix + ''.join(parts) + suffix
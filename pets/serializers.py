@@ -1,14 +1,42 @@
 # pets/serializers.py
-from rest_framework import serializers
-from .models import Pet, PetType, PetSpecies, WeightLog, HealthLog, InjectionLog
+from django.conf import settings
+from rest_framework import permissions, serializers
+import os
+
+from .models import Pet, PetType, PetSpecies, PetSummary, WeightLog, HealthLog, InjectionLog, UploadSession
+from .search import highlight
+from .summaries import rebuild_summary
+from .uploads import received_chunks
+from health_cats.metrics import TimedSerializerMixin
+
+class SparseFieldsMixin:
+    # GET時 ?fields=id,name 只回傳指定欄位、?omit=memo 拿掉指定欄位、?compact=1 拿掉只給畫面顯示用的欄位
+    # 在__init__就把欄位拿掉，沒被要求的SerializerMethodField根本不會被呼叫
+    compact_omit = ()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method not in permissions.SAFE_METHODS:
+            return
+        # async view傳進來的是Django的HttpRequest，沒有query_params
+        params = getattr(request, 'query_params', request.GET)
+        only = {name for name in params.get('fields', '').split(',') if name}
+        omit = {name for name in params.get('omit', '').split(',') if name}
+        if params.get('compact') in ('1', 'true'):
+            omit.update(self.compact_omit)
+        for name in list(self.fields):
+            if (only and name not in only) or name in omit:
+                self.fields.pop(name)
+
 
 # 物種 / 品種下拉選單
-class PetSpeciesSerializer(serializers.ModelSerializer):
+class PetSpeciesSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = PetSpecies
         fields = ['id', 'name']
 
-class PetTypeSerializer(serializers.ModelSerializer):
+class PetTypeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     species = PetSpeciesSerializer(many=True, read_only=True)
 
     class Meta:
@@ -17,7 +45,7 @@ class PetTypeSerializer(serializers.ModelSerializer):
 
 
 # 主頁區塊
-class PetSerializer(serializers.ModelSerializer):
+class PetSerializer(TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
     owner = serializers.ReadOnlyField(source='owner.username')
     pet_type = serializers.CharField(source='pet_type.name', read_only=True)
     pet_species = serializers.CharField(source='pet_species.name', read_only=True)
@@ -35,70 +63,137 @@ class PetSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'name', 'owner', 'age',
             'pet_type', 'pet_species', 'gender', 'birth_day',
-            'photo', 'created_at', 'updated_at', 'memo', 'favorite_food', 'favorite_food_display',
+            'photo', 'photo_thumbnail', 'photo_medium', 'created_at', 'updated_at', 'memo', 'favorite_food', 'favorite_food_display',
             'pet_type_id', 'pet_species_id',
             'tracking_log_count',
             'next_injection_date',
             'last_weight',
+            'weight_trend',
             'sterilised',
             'sterilised_display',
         ]
 
+    # ?compact=1 時不回傳(前端可以自己用favorite_food、sterilised轉文字)
+    compact_omit = ('favorite_food_display', 'sterilised_display')
+
     # 給前端的各項計算參數
     tracking_log_count = serializers.SerializerMethodField()
     next_injection_date = serializers.SerializerMethodField()
     last_weight = serializers.SerializerMethodField()
+    weight_trend = serializers.SerializerMethodField()
     sterilised_display = serializers.SerializerMethodField()
 
+    # 主頁統計都從PetSummary讀(PetViewSet.get_queryset已select_related)，不再查日誌表
+
+    def _summary(self, obj):
+        try:
+            return obj.summary
+        except PetSummary.DoesNotExist:
+            # 舊資料還沒有統計列，補建一次
+            return rebuild_summary(obj.pk)
+
     # 計算待追蹤的健康日誌
     def get_tracking_log_count(self, obj):
-        # 計算這隻寵物有多少筆health_logs的case_closed是False
-        return obj.health_logs.filter(case_closed=False).count()
+        # 這隻寵物有多少筆health_logs的case_closed是False
+        return self._summary(obj).open_case_count
 
     # 計算next_injection_date
     def get_next_injection_date(self, obj):
-        # 找寵物最近的一筆驅蟲紀錄
-        latest_injection = obj.injection_logs.order_by('-injection_date').first()
-        if latest_injection and latest_injection.next_date:
-            return latest_injection.next_date.strftime('%Y-%m-%d')
+        # 寵物最近一筆驅蟲紀錄的建議下次施打日
+        next_date = self._summary(obj).next_injection_date
+        if next_date:
+            return next_date.strftime('%Y-%m-%d')
         return None
 
     # 找寵物最近的一筆量體重紀錄
     def get_last_weight(self, obj):
-        latest = obj.weight_logs.order_by('-recorded_at').first()
-        if latest:
+        summary = self._summary(obj)
+        if summary.last_weight_recorded_at:
             return {
-                'weight_kg': float(latest.weight_kg),
-                'recorded_at': latest.recorded_at.strftime('%Y-%m-%d')
+                'weight_kg': float(summary.last_weight_kg),
+                'recorded_at': summary.last_weight_recorded_at.strftime('%Y-%m-%d')
             }
         return None
 
+    # 體重趨勢與異常標記(最新一筆體重紀錄的統計)
+    def get_weight_trend(self, obj):
+        summary = self._summary(obj)
+        if summary.weight_trend_kg is None:
+            return None
+        return {
+            'trend_kg': round(summary.weight_trend_kg, 2),
+            'rate_kg_per_week': round(summary.weight_rate_kg_per_week, 3),
+            'anomaly': summary.weight_anomaly,
+        }
+
     def get_sterilised_display(self, obj):
         return "已絕育" if obj.sterilised else "未絕育"
 
 # 體重日誌區塊
-class WeightLogSerializer(serializers.ModelSerializer):
+class WeightLogSerializer(TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = WeightLog
-        fields = ['id', 'weight_kg', 'recorded_at']
+        # 趨勢跟異常標記由pets/weight_trends.py在存檔時算好，唯讀
+        fields = ['id', 'weight_kg', 'recorded_at', 'trend_kg', 'rate_kg_per_week', 'anomaly', 'anomaly_score']
+
+    def validate_weight_kg(self, value):
+        if value <= 0:
+            raise serializers.ValidationError('體重要大於0')
+        return value
 
 # 健康日誌區塊
-class HealthLogSerializer(serializers.ModelSerializer):
+class HealthLogSerializer(TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
     action = serializers.CharField(source='get_action_display', read_only=True)
     # 讓前端寫入時可以傳 'SEE_DOCTOR'
     action_write = serializers.CharField(write_only=True, source='action')
 
     class Meta:
         model = HealthLog
-        fields = ['id', 'topic', 'content', 'photo_records', 'action', 'action_write', 'case_closed', 'created_at', ]
-        read_only_fields = ['photo_records']
+        fields = ['id', 'topic', 'content', 'photo_records', 'photo_thumbnail', 'photo_medium',
+                  'action', 'action_write', 'case_closed', 'created_at', ]
+        read_only_fields = ['photo_records', 'photo_thumbnail', 'photo_medium']
 
-# 驅蟲記錄區塊
-class InjectionLogSerializer(serializers.ModelSerializer):
-    # 下次注射日是唯獨資料
-    next_date = serializers.ReadOnlyField()
+# 健康日誌搜尋結果：多了相關度跟標記過的標題/內容片段
+class HealthLogSearchSerializer(HealthLogSerializer):
+    rank = serializers.FloatField(read_only=True)
+    highlight = serializers.SerializerMethodField()
+
+    class Meta(HealthLogSerializer.Meta):
+        fields = HealthLogSerializer.Meta.fields + ['rank', 'highlight']
 
+    def get_highlight(self, obj):
+        query = self.context.get('query', '')
+        return {
+            'topic': highlight(obj.topic, query),
+            'content': highlight(obj.content, query, snippet=True),
+        }
+
+# 健康日誌照片分段上傳
+class UploadSessionSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    received_chunks = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'filename', 'total_chunks', 'received_chunks', 'created_at']
+
+    def validate_filename(self, value):
+        # 只留檔名，不接受路徑
+        return os.path.basename(value)
+
+    def validate_total_chunks(self, value):
+        if value < 1:
+            raise serializers.ValidationError('至少要有一段')
+        if value > settings.CHUNKED_UPLOAD_MAX_CHUNKS:
+            raise serializers.ValidationError(f'最多{settings.CHUNKED_UPLOAD_MAX_CHUNKS}段')
+        return value
+
+    def get_received_chunks(self, obj):
+        return received_chunks(obj)
+
+# 驅蟲記錄區塊
+class InjectionLogSerializer(TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = InjectionLog
         fields = ['id', 'injection_type', 'note', 'injection_date', 'created_at', 'next_date']
-        read_only_fields = ['created_at']
\ No newline at end of file
+        # 下次注射日是唯讀資料，存檔時自動計算
+        read_only_fields = ['created_at', 'next_date']
\ No newline at end of file
@@ -0,0 +1,121 @@
+# pets/series.py
+# 體重圖表用的時間序列：分桶統計在資料庫算，結果依(寵物, 解析度)快取
+# 封存(pets/archive.py)的舊體重在Python分桶再併進去，封存/還原時清快取
+
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+
+from .models import LogArchive, WeightLog
+
+RESOLUTIONS = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+# 跟資料庫的Trunc一樣的分桶(週從星期一開始)
+_ARCHIVE_BUCKETS = {
+    'day': lambda day: day,
+    'week': lambda day: day - timedelta(days=day.weekday()),
+    'month': lambda day: day.replace(day=1),
+}
+SERIES_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def _cache_key(pet_id, resolution):
+    return f'weight-series:{pet_id}:{resolution}'
+
+
+def invalidate_weight_series(pet_id):
+    # 體重紀錄有新增/修改/刪除就清掉這隻寵物所有解析度的快取
+    cache.delete_many([_cache_key(pet_id, resolution) for resolution in RESOLUTIONS])
+
+
+def weight_buckets(pet_id, resolution):
+    # 每個時間桶的 min/max/mean/count，依日期由舊到新
+    key = _cache_key(pet_id, resolution)
+    buckets = cache.get(key)
+    if buckets is None:
+        trunc = RESOLUTIONS[resolution]
+        rows = (WeightLog.objects
+                .filter(pet_id=pet_id)
+                .annotate(bucket=trunc('recorded_at'))
+                .values('bucket')
+                .annotate(min=Min('weight_kg'), max=Max('weight_kg'), total=Sum('weight_kg'), count=Count('id'))
+                .order_by('bucket'))
+        totals = {row['bucket']: row for row in rows}
+        if LogArchive.objects.filter(pet_id=pet_id, kind='weight').exists():
+            _add_archived(totals, pet_id, _ARCHIVE_BUCKETS[resolution])
+        buckets = [{
+            'date': bucket.strftime('%Y-%m-%d'),
+            'min': float(row['min']),
+            'max': float(row['max']),
+            'mean': round(float(row['total']) / row['count'], 3),
+            'count': row['count'],
+        } for bucket, row in sorted(totals.items())]
+        cache.set(key, buckets, SERIES_CACHE_TIMEOUT)
+    return buckets
+
+
+def _add_archived(totals, pet_id, to_bucket):
+    # archive.py也import這個檔案(清快取)，這裡用到才import
+    from .archive import archived_values
+
+    for row in archived_values(pet_id, 'weight', ['recorded_at', 'weight_kg']):
+        bucket = to_bucket(row['recorded_at'])
+        weight = row['weight_kg']
+        current = totals.get(bucket)
+        if current is None:
+            totals[bucket] = {'min': weight, 'max': weight, 'total': weight, 'count': 1}
+        else:
+            current.update(min=min(current['min'], weight), max=max(current['max'], weight),
+                           total=current['total'] + weight, count=current['count'] + 1)
+
+
+def add_moving_average(buckets, window):
+    # 以各桶平均值算往前window桶的移動平均(開頭不足window桶就用現有的)
+    total = 0.0
+    result = []
+    for index, bucket in enumerate(buckets):
+        total += bucket['mean']
+        if index >= window:
+            total -= buckets[index - window]['mean']
+        result.append({**bucket, 'moving_average': round(total / min(index + 1, window), 3)})
+    return result
+
+
+def downsample_lttb(buckets, threshold):
+    # Largest-Triangle-Three-Buckets：保留曲線形狀，把點數降到threshold
+    length = len(buckets)
+    if threshold >= length or threshold < 3:
+        return buckets
+
+    sampled = [buckets[0]]
+    every = (length - 2) / (threshold - 2)
+    selected = 0
+    for i in range(threshold - 2):
+        # 下一段的平均點
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, length)
+        avg_range = range(avg_start, avg_end)
+        avg_x = sum(avg_range) / len(avg_range)
+        avg_y = sum(buckets[j]['mean'] for j in avg_range) / len(avg_range)
+
+        # 這一段裡跟前一個選中點、下一段平均點圍出最大三角形的點
+        range_start = int(i * every) + 1
+        range_end = int((i + 1) * every) + 1
+        point_x, point_y = selected, buckets[selected]['mean']
+        max_area = -1
+        for j in range(range_start, range_end):
+            area = abs((point_x - avg_x) * (buckets[j]['mean'] - point_y)
+                       - (point_x - j) * (avg_y - point_y))
+            if area > max_area:
+                max_area = area
+                next_selected = j
+        sampled.append(buckets[next_selected])
+        selected = next_selected
+
+    sampled.append(buckets[-1])
+    return sampled
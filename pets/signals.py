@@ -0,0 +1,154 @@
+# pets/signals.py
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import summaries, weight_trends
+from .growth import mark_stale
+from .archive import unpack
+from .catalog import bump_version
+from .images import schedule_variants
+from .models import Pet, PetType, PetSpecies, PetSummary, HealthLog, WeightLog, InjectionLog, InjectionInterval, \
+    ChangeCounter, Tombstone, MediaBlob, LogArchive
+from .reminders import apply_injection_interval
+from .search import index_health_log, unindex_health_log
+from .series import invalidate_weight_series
+
+
+def _deleted_with(origin, *models):
+    # origin是呼叫delete()的那個物件或QuerySet
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return issubclass(model, models)
+
+
+def record_tombstone(kind, owner_id, object_id, pet_id):
+    # 留下同步用的墓碑，回傳用掉的序號(post_delete在刪除的transaction裡，序號鎖到commit)
+    with transaction.atomic():
+        change_seq = ChangeCounter.next(owner_id)
+        Tombstone.objects.create(owner_id=owner_id, kind=kind, object_id=object_id, pet_id=pet_id,
+                                 change_seq=change_seq)
+    return change_seq
+
+
+def swap_blob(instance, field):
+    # 照片換了：新的blob引用數+1、讀出來時的舊blob-1
+    current = getattr(instance, field).name or None
+    previous = getattr(instance, '_loaded_photo', None)
+    if current != previous:
+        MediaBlob.retain(current)
+        MediaBlob.release(previous)
+        instance._loaded_photo = current
+
+
+def log_deleted(kind, instance):
+    # 單獨刪一筆日誌：留墓碑、寵物的版本跟同步序號跟著變，回傳用掉的序號
+    change_seq = record_tombstone(kind, instance.pet.owner_id, instance.pk, instance.pet_id)
+    summaries.touch(instance.pet_id, change_seq=change_seq)
+    return change_seq
+
+
+@receiver([post_save, post_delete], sender=PetType)
+@receiver([post_save, post_delete], sender=PetSpecies)
+def catalog_changed(sender, instance, **kwargs):
+    bump_version()
+    # 寵物資料裡有物種/品種名稱
+    related = 'pet_type' if sender is PetType else 'pet_species'
+    summaries.touch(*Pet.objects.filter(**{related: instance.pk}).values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=WeightLog)
+def weight_log_saved(sender, instance, created, **kwargs):
+    invalidate_weight_series(instance.pet_id)
+    weight_trends.weight_log_saved(instance, created)
+    summaries.weight_log_saved(instance, created)
+    summaries.touch(instance.pet_id, change_seq=instance.change_seq)
+    mark_stale(instance.pet.pet_species_id)
+
+
+@receiver(post_delete, sender=WeightLog)
+def weight_log_deleted(sender, instance, origin=None, **kwargs):
+    invalidate_weight_series(instance.pet_id)
+    # 寵物(或帳號)整個刪掉時PetSummary也一起刪了，不用逐筆維護，也不留日誌的墓碑
+    if _deleted_with(origin, Pet, User):
+        return
+    summaries.weight_log_deleted(instance)
+    weight_trends.weight_log_deleted(instance, log_deleted('weight', instance))
+    mark_stale(instance.pet.pet_species_id)
+
+
+@receiver(post_save, sender=Pet)
+def pet_saved(sender, instance, created, **kwargs):
+    if created:
+        PetSummary.objects.create(pet=instance)
+    else:
+        summaries.touch(instance.pk, change_seq=instance.change_seq)
+    swap_blob(instance, 'photo')
+    schedule_variants(instance, 'photo', 'photo_thumbnail', 'photo_medium')
+    loaded = getattr(instance, '_loaded_growth', None)
+    if loaded and loaded != (instance.pet_species_id, instance.birth_day):
+        mark_stale(loaded[0], instance.pet_species_id)
+    instance._loaded_growth = (instance.pet_species_id, instance.birth_day)
+
+
+@receiver(post_delete, sender=Pet)
+def pet_deleted(sender, instance, origin=None, **kwargs):
+    MediaBlob.release(instance.photo.name)
+    mark_stale(instance.pet_species_id)
+    # 寵物的墓碑就夠了，App自己刪掉底下的日誌；刪帳號不用留
+    if not _deleted_with(origin, User):
+        record_tombstone('pet', instance.owner_id, instance.pk, instance.pk)
+
+
+@receiver(post_delete, sender=LogArchive)
+def log_archive_deleted(sender, instance, origin=None, **kwargs):
+    # 寵物刪掉時封存的健康日誌也沒了，照片的引用要還回去；還原(archive_logs --restore)時引用轉給熱資料表
+    if instance.kind == 'health' and _deleted_with(origin, Pet, User):
+        for log in unpack(instance):
+            MediaBlob.release(log.photo_records.name)
+
+
+@receiver(post_save, sender=HealthLog)
+def health_log_saved(sender, instance, created, **kwargs):
+    # 換了寵物的話兩邊都要更新版本
+    previous = getattr(instance, '_loaded_state', None)
+    summaries.health_log_saved(instance, created)
+    summaries.touch(instance.pet_id, *([previous[0]] if previous else []), change_seq=instance.change_seq)
+    index_health_log(instance)
+    swap_blob(instance, 'photo_records')
+    schedule_variants(instance, 'photo_records', 'photo_thumbnail', 'photo_medium')
+
+
+@receiver(post_delete, sender=HealthLog)
+def health_log_deleted(sender, instance, origin=None, **kwargs):
+    unindex_health_log(instance.pk)
+    MediaBlob.release(instance.photo_records.name)
+    if _deleted_with(origin, Pet, User):
+        return
+    summaries.health_log_deleted(instance)
+    log_deleted('health', instance)
+
+
+@receiver(post_save, sender=InjectionLog)
+def injection_log_saved(sender, instance, created, **kwargs):
+    summaries.injection_log_saved(instance, created)
+    summaries.touch(instance.pet_id, change_seq=instance.change_seq)
+
+
+@receiver(post_delete, sender=InjectionLog)
+def injection_log_deleted(sender, instance, origin=None, **kwargs):
+    if _deleted_with(origin, Pet, User):
+        return
+    summaries.injection_log_deleted(instance)
+    log_deleted('injection', instance)
+
+
+@receiver([post_save, post_delete], sender=InjectionInterval)
+def injection_interval_changed(sender, instance, **kwargs):
+    apply_injection_interval(instance.injection_type)
+    loaded = getattr(instance, '_loaded_injection_type', None)
+    if loaded is not None and loaded != instance.injection_type:
+        apply_injection_interval(loaded)
+    instance._loaded_injection_type = instance.injection_type
@@ -0,0 +1,105 @@
+# pets/storage.py
+# 照片用內容定址存放：上傳時一邊寫暫存檔一邊算sha256，存成 blobs/ab/cd/<sha256>.jpg
+# 同一張照片不管上傳幾次、用在寵物還是健康日誌，硬碟上只有一份(models.MediaBlob記錄引用數)
+# 檔名就是內容的hash，網址永遠不會指到別的內容，前面的nginx/CDN可以設成永久快取(immutable)
+# 引用數由pets/signals.py在存檔/刪除時維護，沒有人用的由 manage.py gc_media_blobs 清掉
+
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.apps import apps
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+
+BLOB_DIR = 'blobs'
+HASH_BUFFER_SIZE = 64 * 1024
+
+
+def blob_name(digest, extension):
+    return posixpath.join(BLOB_DIR, digest[:2], digest[2:4], f'{digest}{extension}')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    # 網址裡有內容的hash，可以永久快取
+    immutable = True
+
+    def get_available_name(self, name, max_length=None):
+        # 原圖的檔名只用來取副檔名，不用找沒人用過的名字
+        if name.startswith(f'{BLOB_DIR}/'):
+            return super().get_available_name(name, max_length)
+        return name
+
+    def _save(self, name, content):
+        if name.startswith(f'{BLOB_DIR}/'):
+            # 縮圖這類衍生檔案本來就放在blob旁邊，照原本的名字存
+            return super()._save(name, content)
+
+        MediaBlob = apps.get_model('pets', 'MediaBlob')
+        temporary_path = getattr(content, 'temporary_file_path', None)
+        if temporary_path:
+            # 已經在硬碟上(大檔上傳、分段上傳接好的檔)：讀一次算hash，再直接搬過去
+            source = temporary_path()
+            digest, size = self._hash_file(source)
+        else:
+            source, digest, size = self._write_temporary(content)
+
+        extension = os.path.splitext(name)[1].lower()
+        with transaction.atomic():
+            # 鎖住這一列：gc_media_blobs同時在刪同一個blob時，等它刪完再重新建立
+            blob, created = MediaBlob.objects.select_for_update().get_or_create(
+                digest=digest, defaults={'name': blob_name(digest, extension), 'size': size})
+            if not created:
+                # 更新時間往後延，剛上傳還沒存進資料的blob不會被清掉
+                blob.save(update_fields=['updated_at'])
+            path = self.path(blob.name)
+            if os.path.exists(path):
+                if not temporary_path:
+                    os.remove(source)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if temporary_path:
+                    file_move_safe(source, path)
+                else:
+                    os.replace(source, path)
+                if self.file_permissions_mode is not None:
+                    os.chmod(path, self.file_permissions_mode)
+        return blob.name
+
+    def _write_temporary(self, content):
+        # 寫到blob目錄裡的暫存檔(同一個磁碟，之後rename就好)，一邊寫一邊算hash
+        directory = self.path(BLOB_DIR)
+        os.makedirs(directory, exist_ok=True)
+        handle, path = tempfile.mkstemp(dir=directory, suffix='.part')
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(handle, 'wb') as destination:
+                for chunk in content.chunks(HASH_BUFFER_SIZE):
+                    digest.update(chunk)
+                    size += len(chunk)
+                    destination.write(chunk)
+        except BaseException:
+            os.remove(path)
+            raise
+        return path, digest.hexdigest(), size
+
+    @staticmethod
+    def _hash_file(path):
+        digest = hashlib.sha256()
+        size = 0
+        with open(path, 'rb') as source:
+            while block := source.read(HASH_BUFFER_SIZE):
+                digest.update(block)
+                size += len(block)
+        return digest.hexdigest(), size
+
+
+_blob_storage = ContentAddressedStorage()
+
+
+def blob_storage():
+    # 給ImageField(storage=...)用，migration裡只記這個函式
+    return _blob_storage
@@ -0,0 +1,118 @@
+# pets/summaries.py
+# 維護PetSummary：新增時用條件式UPDATE/F()直接改，不用重算
+# 最新一筆被修改或刪除時才重新找最新一筆(走(pet, 日期, id)索引，只讀一筆)
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import ChangeCounter, Pet, PetSummary, WeightLog, HealthLog, InjectionLog
+
+
+def rebuild_summary(pet_id):
+    # 從日誌重算一隻寵物的統計，回傳PetSummary
+    summary = PetSummary(pet_id=pet_id)
+    _fill_latest_weight(summary)
+    _fill_latest_injection(summary)
+    summary.open_case_count = HealthLog.objects.filter(pet_id=pet_id, case_closed=False).count()
+    summary.save()
+    return summary
+
+
+def _fill_latest_weight(summary):
+    latest = (WeightLog.objects.filter(pet_id=summary.pet_id).order_by('-recorded_at', '-pk')
+              .values('weight_kg', 'recorded_at', 'trend_kg', 'rate_kg_per_week', 'anomaly').first())
+    summary.last_weight_kg = latest['weight_kg'] if latest else None
+    summary.last_weight_recorded_at = latest['recorded_at'] if latest else None
+    summary.weight_trend_kg = latest['trend_kg'] if latest else None
+    summary.weight_rate_kg_per_week = latest['rate_kg_per_week'] if latest else None
+    summary.weight_anomaly = latest['anomaly'] if latest else ''
+
+
+def _fill_latest_injection(summary):
+    latest = (InjectionLog.objects.filter(pet_id=summary.pet_id)
+              .order_by('-injection_date', '-pk').first())
+    summary.last_injection_date = latest.injection_date if latest else None
+    summary.next_injection_date = latest.next_date if latest else None
+
+
+def refresh_latest_weight(pet_id):
+    summary = PetSummary(pet_id=pet_id)
+    _fill_latest_weight(summary)
+    _update(pet_id, last_weight_kg=summary.last_weight_kg,
+            last_weight_recorded_at=summary.last_weight_recorded_at)
+
+
+def refresh_latest_injection(pet_id):
+    summary = PetSummary(pet_id=pet_id)
+    _fill_latest_injection(summary)
+    _update(pet_id, last_injection_date=summary.last_injection_date,
+            next_injection_date=summary.next_injection_date)
+
+
+def touch(*pet_ids, change_seq=None):
+    # 寵物或日誌有變動：版本+1、更新時間設成現在，API的ETag/Last-Modified跟著變
+    # 寵物的同步序號也要換(主頁統計在寵物資料裡)；change_seq是呼叫端在同一個transaction裡剛拿到的序號
+    with transaction.atomic():
+        PetSummary.objects.filter(pet_id__in=pet_ids).update(version=F('version') + 1, updated_at=timezone.now())
+        if change_seq is None:
+            ChangeCounter.bump(Pet.objects.filter(pk__in=pet_ids))
+        else:
+            Pet.objects.filter(pk__in=pet_ids).update(change_seq=change_seq)
+
+
+def _update(pet_id, condition=Q(), **values):
+    # 回傳是否有更新到；還沒有統計列的寵物就整個重建
+    if not PetSummary.objects.filter(pet_id=pet_id).exists():
+        rebuild_summary(pet_id)
+        return True
+    return bool(PetSummary.objects.filter(condition, pet_id=pet_id).update(**values))
+
+
+def weight_log_saved(log, created):
+    if created:
+        # 新的一筆只要日期不比目前最新的舊，就是新的最新一筆
+        newer = Q(last_weight_recorded_at__isnull=True) | Q(last_weight_recorded_at__lte=log.recorded_at)
+        _update(log.pet_id, newer, last_weight_kg=log.weight_kg, last_weight_recorded_at=log.recorded_at)
+    else:
+        refresh_latest_weight(log.pet_id)
+
+
+def weight_log_deleted(log):
+    refresh_latest_weight(log.pet_id)
+
+
+def injection_log_saved(log, created):
+    if created:
+        newer = Q(last_injection_date__isnull=True) | Q(last_injection_date__lte=log.injection_date)
+        _update(log.pet_id, newer, last_injection_date=log.injection_date, next_injection_date=log.next_date)
+    else:
+        refresh_latest_injection(log.pet_id)
+
+
+def injection_log_deleted(log):
+    refresh_latest_injection(log.pet_id)
+
+
+def health_log_saved(log, created):
+    previous = None if created else getattr(log, '_loaded_state', None)
+    if not created and previous is None:
+        # 不知道存檔前的狀態(例如沒有從資料庫讀出來)，直接重算
+        rebuild_summary(log.pet_id)
+    else:
+        was_open = previous is not None and not previous[1]
+        if previous is not None and previous[0] != log.pet_id:
+            # 換了寵物，兩邊都重算
+            rebuild_summary(previous[0])
+            rebuild_summary(log.pet_id)
+        else:
+            delta = int(not log.case_closed) - int(was_open)
+            if delta:
+                _update(log.pet_id, open_case_count=F('open_case_count') + delta)
+    log._loaded_state = (log.pet_id, log.case_closed)
+
+
+def health_log_deleted(log):
+    if not log.case_closed:
+        PetSummary.objects.filter(pet_id=log.pet_id, open_case_count__gt=0).update(
+            open_case_count=F('open_case_count') - 1)
@@ -0,0 +1,108 @@
+# pets/sync.py
+# 離線同步：App記住上次拿到的cursor，/api/sync/?since=<cursor> 只回傳這之後新增/修改/刪除的資料
+# 寵物跟三種日誌每次寫入都換上主人的下一個序號(models.ChangeCounter)，刪除留下墓碑(Tombstone)
+# 五個來源各自照(寵物或主人, change_seq, id)索引讀limit+1筆，再用(序號, 來源, id)合併，跟時間軸一樣
+# 一開始先讀計數器目前的值，只回傳序號不超過它的資料：序號照commit順序，比它小的都已經commit了，不會漏掉
+
+import base64
+import heapq
+import json
+from itertools import islice
+
+from django.db import router
+from django.db.models import Q
+from rest_framework.exceptions import APIException, ParseError
+
+from .models import ChangeCounter, Pet, WeightLog, HealthLog, InjectionLog, Tombstone
+from .serializers import PetSerializer, WeightLogSerializer, HealthLogSerializer, InjectionLogSerializer
+
+SYNC_PAGE_SIZE = 200
+SYNC_MAX_PAGE_SIZE = 1000
+
+# (類型, model, serializer, 主人欄位)，順序也是同一個序號時的順序(先寵物再日誌，刪除最後)
+SYNC_SOURCES = [
+    ('pet', Pet, PetSerializer, 'owner_id'),
+    ('health', HealthLog, HealthLogSerializer, 'pet__owner_id'),
+    ('injection', InjectionLog, InjectionLogSerializer, 'pet__owner_id'),
+    ('weight', WeightLog, WeightLogSerializer, 'pet__owner_id'),
+    ('deleted', Tombstone, None, 'owner_id'),
+]
+
+
+class CursorExpired(APIException):
+    status_code = 410
+    default_detail = 'cursor太舊，刪除紀錄已經清掉了，請不帶since重新完整同步'
+    default_code = 'cursor_expired'
+
+
+def encode_cursor(position):
+    return base64.urlsafe_b64encode(json.dumps(position, separators=(',', ':')).encode()).decode()
+
+
+def decode_cursor(cursor):
+    # 回傳(序號, 來源, id)
+    try:
+        change_seq, rank, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return int(change_seq), int(rank), int(pk)
+    except Exception:
+        raise ParseError('cursor格式錯誤')
+
+
+def _after(position, rank):
+    # 合併順序在position之後的紀錄
+    change_seq, after_rank, pk = position
+    if rank < after_rank:
+        return Q(change_seq__gt=change_seq)
+    if rank == after_rank:
+        return Q(change_seq__gt=change_seq) | Q(change_seq=change_seq, id__gt=pk)
+    return Q(change_seq__gte=change_seq)
+
+
+def sync_page(user, since=None, limit=SYNC_PAGE_SIZE, context=None):
+    # 同一次同步的查詢都在同一個資料庫：每個副本的延遲不一樣，計數器跟資料要是同一份
+    using = router.db_for_read(ChangeCounter)
+    high, pruned = (ChangeCounter.objects.using(using).filter(owner_id=user.pk)
+                    .values_list('value', 'pruned_seq').first() or (0, 0))
+    position = decode_cursor(since) if since else None
+    done = (high, len(SYNC_SOURCES), 0)
+    if position is not None and position < (pruned, len(SYNC_SOURCES), 0):
+        raise CursorExpired()
+
+    streams = []
+    for rank, (kind, model, _, owner_field) in enumerate(SYNC_SOURCES):
+        rows = model.objects.using(using).filter(**{owner_field: user.pk}, change_seq__lte=high)
+        if position is not None:
+            rows = rows.filter(_after(position, rank))
+        if kind == 'pet':
+            rows = rows.select_related('owner', 'pet_type', 'pet_species', 'summary')
+        rows = rows.order_by('change_seq', 'id')[:limit + 1]
+        streams.append([((row.change_seq, rank, row.pk), kind, row) for row in rows])
+
+    merged = list(islice(heapq.merge(*streams, key=lambda item: item[0]), limit + 1))
+    has_more = len(merged) > limit
+    page = merged[:limit]
+    if has_more:
+        next_position = page[-1][0]
+    else:
+        # 都讀完了就記到計數器目前的值；副本比App上次讀的主庫舊時不要往回退
+        next_position = max(done, position) if position else done
+
+    # 同一種一起序列化，再照合併的順序放回去
+    serialized = {}
+    for kind, _, serializer_class, _ in SYNC_SOURCES[:-1]:
+        rows = [row for _, row_kind, row in page if row_kind == kind]
+        serialized[kind] = iter(serializer_class(rows, many=True, context=context).data)
+    changes = []
+    deleted = []
+    for _, kind, row in page:
+        if kind == 'deleted':
+            deleted.append({'type': row.kind, 'id': row.object_id, 'pet': row.pet_id})
+        else:
+            changes.append({'type': kind, 'pet': row.pk if kind == 'pet' else row.pet_id,
+                            'data': next(serialized[kind])})
+    return {
+        'changes': changes,
+        'deleted': deleted,
+        'cursor': encode_cursor(next_position),
+        'has_more': has_more,
+    }
@@ -0,0 +1,105 @@
+# pets/timeline.py
+# 寵物詳細頁的時間軸：體重、健康日誌、施打紀錄合成一條，新的在前
+# 三種日誌各自照索引順序(pet, 日期, id)讀最多page_size+1筆，再用heapq.merge做k-way merge
+# cursor記住每種日誌各自讀到哪一筆，翻到第N頁每種日誌也只讀page_size+1筆
+# 有封存資料的類型，熱資料跟封存的資料(pets/archive.py)先各讀page_size+1筆合併
+
+import base64
+import heapq
+import json
+from datetime import datetime, time
+from itertools import islice
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .archive import archived_logs
+from .models import LogArchive, WeightLog, HealthLog, InjectionLog
+from .serializers import WeightLogSerializer, HealthLogSerializer, InjectionLogSerializer
+
+# (類型, model, serializer, 排序欄位)，順序也是同一時間點時的排序
+TIMELINE_SOURCES = [
+    ('health', HealthLog, HealthLogSerializer, 'created_at'),
+    ('injection', InjectionLog, InjectionLogSerializer, 'injection_date'),
+    ('weight', WeightLog, WeightLogSerializer, 'recorded_at'),
+]
+SOURCES_BY_KIND = {source[0]: source for source in TIMELINE_SOURCES}
+
+
+def _sort_key(rank, value, pk):
+    # 日期跟時間混在一起比：只有日期的紀錄當成當天00:00
+    if isinstance(value, datetime):
+        value = timezone.localtime(value)
+        return value.date(), value.time(), rank, pk
+    return value, time.min, rank, pk
+
+
+def encode_cursor(positions):
+    # positions: {類型: [日期字串, id] 或 None(已經讀完)}，沒出現的類型表示從頭開始
+    return base64.urlsafe_b64encode(json.dumps(positions, separators=(',', ':')).encode()).decode()
+
+
+def decode_cursor(cursor):
+    # 回傳 {類型: (日期, id) 或 None}；格式不對丟ValueError，view轉成400
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        positions = {}
+        for kind, position in raw.items():
+            _, model, _, date_field = SOURCES_BY_KIND[kind]
+            if position is None:
+                positions[kind] = None
+            else:
+                value, pk = position
+                positions[kind] = (model._meta.get_field(date_field).to_python(value), int(pk))
+    except Exception:
+        raise ValueError('invalid cursor')
+    return positions
+
+
+def timeline_page(pet, page_size, cursor=None, context=None):
+    # 回傳 (這一頁的事件list, 下一頁的cursor或None)
+    positions = decode_cursor(cursor) if cursor else {}
+    streams = []
+    fetched = {}
+    archived_kinds = set(LogArchive.objects.filter(pet=pet).order_by().values_list('kind', flat=True).distinct())
+    for rank, (kind, model, _, date_field) in enumerate(TIMELINE_SOURCES):
+        if kind in positions and positions[kind] is None:
+            continue
+        logs = model.objects.filter(pet=pet).order_by(f'-{date_field}', '-id')
+        if positions.get(kind):
+            value, pk = positions[kind]
+            logs = logs.filter(Q(**{f'{date_field}__lt': value}) | Q(**{date_field: value, 'id__lt': pk}))
+        rows = list(logs[:page_size + 1])
+        if kind in archived_kinds:
+            cold = islice(archived_logs(pet.pk, kind, positions.get(kind)), page_size + 1)
+            rows = list(islice(heapq.merge(rows, cold, key=lambda log: (getattr(log, date_field), log.pk),
+                                           reverse=True), page_size + 1))
+        fetched[kind] = len(rows)
+        streams.append([(_sort_key(rank, getattr(row, date_field), row.pk), kind, row) for row in rows])
+
+    page = [(kind, row) for _, kind, row in
+            islice(heapq.merge(*streams, key=lambda item: item[0], reverse=True), page_size)]
+
+    # 每種日誌的新位置 = 這一頁用到的最後一筆；讀到的全用完又沒有第page_size+1筆就是讀完了
+    next_positions = {kind: None if position is None else [position[0].isoformat(), position[1]]
+                      for kind, position in positions.items()}
+    for kind, count in fetched.items():
+        date_field = SOURCES_BY_KIND[kind][3]
+        rows = [row for row_kind, row in page if row_kind == kind]
+        if len(rows) == count <= page_size:
+            next_positions[kind] = None
+        elif rows:
+            next_positions[kind] = [getattr(rows[-1], date_field).isoformat(), rows[-1].pk]
+
+    events = []
+    for kind, row in page:
+        _, _, serializer_class, date_field = SOURCES_BY_KIND[kind]
+        events.append({
+            'type': kind,
+            'date': getattr(row, date_field),
+            'data': serializer_class(row, context=context).data,
+        })
+
+    if all(next_positions.get(kind, '') is None for kind in SOURCES_BY_KIND):
+        return events, None
+    return events, encode_cursor(next_positions)
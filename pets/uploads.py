@@ -0,0 +1,118 @@
+# pets/uploads.py
+# 健康日誌照片的分段上傳：每段直接寫進硬碟，完成時接成一個檔再搬到MEDIA_ROOT
+# 網路斷掉只要重傳缺的那幾段
+
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+from PIL import Image
+
+COPY_BUFFER_SIZE = 64 * 1024
+
+
+class AssembledFile(File):
+    # 有temporary_file_path()的話FileSystemStorage會直接搬檔(rename)，不會再讀進記憶體
+    def __init__(self, path, name):
+        super().__init__(open(path, 'rb'), name=name)
+        self._path = path
+
+    def temporary_file_path(self):
+        return self._path
+
+
+def session_dir(session):
+    return os.path.join(settings.CHUNKED_UPLOAD_DIR, str(session.pk))
+
+
+def received_chunks(session):
+    directory = session_dir(session)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(int(name) for name in os.listdir(directory) if name.isdigit())
+
+
+def _received_size(directory, skip):
+    # 已經收到的其他分段加起來多大(重傳同一段不算舊的)
+    total = 0
+    for name in os.listdir(directory):
+        if name.isdigit() and name != str(skip):
+            total += os.path.getsize(os.path.join(directory, name))
+    return total
+
+
+def write_chunk(session, index, stream):
+    # 先寫到獨一無二的暫存檔再改名：重傳同一段、同一段同時傳兩次、中途斷線都不會留下寫一半或混在一起的檔案
+    directory = session_dir(session)
+    os.makedirs(directory, exist_ok=True)
+    limit = min(settings.CHUNKED_UPLOAD_MAX_CHUNK_SIZE,
+                settings.CHUNKED_UPLOAD_MAX_TOTAL_SIZE - _received_size(directory, index))
+    fd, partial_path = tempfile.mkstemp(suffix='.part', dir=directory)
+    size = 0
+    try:
+        with os.fdopen(fd, 'wb') as destination:
+            while True:
+                block = stream.read(COPY_BUFFER_SIZE)
+                if not block:
+                    break
+                size += len(block)
+                if size > limit:
+                    raise ValueError('分段超過大小上限' if size > settings.CHUNKED_UPLOAD_MAX_CHUNK_SIZE
+                                     else '上傳的檔案超過大小上限')
+                destination.write(block)
+        os.replace(partial_path, os.path.join(directory, str(index)))
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    session.save(update_fields=['updated_at'])
+    return size
+
+
+def assemble(session):
+    # 依序把每段接到同一個檔案，回傳路徑；缺段或不是圖片就丟ValueError
+    received = set(received_chunks(session))
+    missing = [index for index in range(session.total_chunks) if index not in received]
+    if missing:
+        raise ValueError(f'缺少分段: {missing}')
+
+    directory = session_dir(session)
+    assembled_path = os.path.join(directory, 'assembled')
+    with open(assembled_path, 'wb') as destination:
+        for index in range(session.total_chunks):
+            with open(os.path.join(directory, str(index)), 'rb') as chunk:
+                shutil.copyfileobj(chunk, destination, COPY_BUFFER_SIZE)
+
+    try:
+        with Image.open(assembled_path) as image:
+            image.verify()
+    except Exception:
+        raise ValueError('上傳的檔案不是圖片')
+    return assembled_path
+
+
+def attach_to_health_log(session):
+    health_log = session.health_log
+    assembled_path = assemble(session)
+    upload = AssembledFile(assembled_path, session.filename)
+    try:
+        health_log.photo_records.save(session.filename, upload, save=True)
+    finally:
+        upload.close()
+    discard(session)
+    return health_log
+
+
+def discard(session):
+    shutil.rmtree(session_dir(session), ignore_errors=True)
+    session.delete()
+
+
+def expired_sessions():
+    from .models import UploadSession
+    cutoff = timezone.now() - timedelta(seconds=settings.CHUNKED_UPLOAD_EXPIRY)
+    return UploadSession.objects.filter(updated_at__lt=cutoff)
@@ -1,7 +1,8 @@
 # pets/urls.py
 from django.urls import path, include
 from rest_framework_nested import routers
-from .views import PetViewSet, PetTypeViewSet, PetSpeciesViewSet, WeightLogViewSet, HealthLogViewSet, InjectionLogViewSet
+from .views import PetViewSet, PetTypeViewSet, PetSpeciesViewSet, WeightLogViewSet, HealthLogViewSet, InjectionLogViewSet, \
+    SyncView
 
 router = routers.DefaultRouter()
 router.register(r'pets', PetViewSet, basename='pet')
@@ -19,6 +20,8 @@ pets_router.register(r'health-logs', HealthLogViewSet, basename='pet-health-logs
 pets_router.register(r'injection-logs', InjectionLogViewSet, basename='pet-injection-logs')
 
 urlpatterns = [
+    # 離線同步: /api/sync/?since=<cursor>
+    path('sync/', SyncView.as_view(), name='sync'),
     path('', include(router.urls)),
     path('', include(pet_types_router.urls)),
     path('', include(pets_router.urls)),
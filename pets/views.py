@@ -1,36 +1,129 @@
 # pets/views.py
-from rest_framework import viewsets, permissions
-from .models import Pet, PetType, PetSpecies, WeightLog, HealthLog, InjectionLog
-from .serializers import PetSerializer, PetTypeSerializer, PetSpeciesSerializer, WeightLogSerializer, HealthLogSerializer, InjectionLogSerializer
+from collections.abc import Iterator
+
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from .models import Pet, PetType, PetSpecies, WeightLog, HealthLog, InjectionLog, UploadSession
+from .serializers import PetSerializer, PetTypeSerializer, PetSpeciesSerializer, WeightLogSerializer, HealthLogSerializer, InjectionLogSerializer, UploadSessionSerializer, HealthLogSearchSerializer
+from .pagination import PetPagination, LogCursorPagination, WeightLogPagination, HealthLogPagination, InjectionLogPagination
+from .parsers import NDJSONParser, CSVParser
+from .ingest import ingest_weight_logs
+from .export import iter_history, iter_ndjson, iter_csv
+from .series import RESOLUTIONS, weight_buckets, add_moving_average, downsample_lttb
+from .uploads import write_chunk, attach_to_health_log, discard
+from .catalog import catalog_response
+from .search import search_health_logs
+from .timeline import timeline_page
+from .conditional import ConditionalGetMixin
+from .filters import PetFilterBackend, PetOrderingBackend
+from .archive import ArchiveReadMixin
+from .sync import SYNC_PAGE_SIZE, SYNC_MAX_PAGE_SIZE, sync_page
+from .growth import pet_percentile
 
 # 確保只有主人才能修改
 class IsOwner(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         return obj.owner == request.user
 
-class PetViewSet(viewsets.ModelViewSet):
+class PetViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     # 對寵物資料的CRUD API
+    # GET會帶ETag/Last-Modified，沒變就回304(pets/conditional.py)
+    change_pet_kwarg = 'pk'
 
     queryset = Pet.objects.all()
     serializer_class = PetSerializer
     # 權限設定
     permission_classes = [permissions.IsAuthenticated, IsOwner]
+    # 篩選、排序、分頁都在資料庫做(pets/filters.py)
+    filter_backends = [PetFilterBackend, PetOrderingBackend]
+    pagination_class = PetPagination
 
     def get_queryset(self):
         # 只回傳當前使用者的寵物
-        return self.request.user.pets.all()
+        # 關聯名稱、主頁統計(PetSummary)一次join進來，查詢數不隨寵物數量增加
+        return (self.request.user.pets
+                .select_related('owner', 'pet_type', 'pet_species', 'summary'))
 
     def perform_create(self, serializer):
         # 新增寵物時，自動將owner設為當前使用者
         serializer.save(owner=self.request.user)
 
+    @action(detail=True, methods=['get'])
+    def export(self, request, pk=None):
+        # 匯出單隻寵物的完整紀錄: /api/pets/{pk}/export/?fmt=csv
+        pet = get_object_or_404(request.user.pets, pk=pk)
+        return self._export_response(request, Pet.objects.filter(pk=pet.pk), f'pet_{pet.pk}')
+
+    @action(detail=False, methods=['get'], url_path='export')
+    def export_all(self, request):
+        # 匯出主人所有寵物的完整紀錄: /api/pets/export/?fmt=ndjson
+        return self._export_response(request, request.user.pets.all(), 'pets')
+
+    @action(detail=True, methods=['get'])
+    def timeline(self, request, pk=None):
+        # 三種日誌合成一條時間軸，新的在前: /api/pets/{pk}/timeline/?page_size=50
+        # 下一頁直接用回傳的next網址(cursor記住每種日誌各自讀到哪裡)
+        return self.conditional_response(request, lambda: self._timeline(request, pk))
+
+    @action(detail=True, methods=['get'], url_path='growth-percentile')
+    def growth_percentile(self, request, pk=None):
+        # 最新體重在同品種、同年齡區間裡的百分位: /api/pets/{pk}/growth-percentile/
+        # 曲線由 manage.py compute_growth_curves 算好，這裡只查一列；樣本不夠時percentile是null
+        pet = get_object_or_404(request.user.pets.select_related('pet_species', 'summary'), pk=pk)
+        return Response(pet_percentile(pet))
+
+    def _timeline(self, request, pk):
+        pet = get_object_or_404(request.user.pets, pk=pk)
+        try:
+            page_size = min(int(request.query_params.get(LogCursorPagination.page_size_query_param,
+                                                          LogCursorPagination.page_size)),
+                            LogCursorPagination.max_page_size)
+        except ValueError:
+            raise ParseError('page_size必須是整數')
+        if page_size < 1:
+            raise ParseError('page_size至少要是1')
+        try:
+            events, cursor = timeline_page(pet, page_size, request.query_params.get('cursor'),
+                                           self.get_serializer_context())
+        except ValueError:
+            raise ParseError('cursor格式錯誤')
+        next_url = None
+        if cursor:
+            params = request.query_params.copy()
+            params['cursor'] = cursor
+            next_url = request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+        return Response({'next': next_url, 'results': events})
+
+    def _export_response(self, request, pets, filename):
+        # 不用DRF的Response，直接串流，資料再多記憶體也不會跟著長
+        # 參數名稱不用format，避免跟DRF的format suffix衝突
+        fmt = request.query_params.get('fmt', 'ndjson')
+        if fmt == 'csv':
+            response = StreamingHttpResponse(iter_csv(iter_history(pets)), content_type='text/csv; charset=utf-8')
+        elif fmt == 'ndjson':
+            response = StreamingHttpResponse(iter_ndjson(iter_history(pets)), content_type='application/x-ndjson')
+        else:
+            raise ParseError('fmt只支援ndjson或csv')
+        response['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+        return response
+
 class PetTypeViewSet(viewsets.ReadOnlyModelViewSet):
     # 提供寵物類型列表
 
-    queryset = PetType.objects.all()
+    queryset = PetType.objects.prefetch_related('species')
     serializer_class = PetTypeSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def list(self, request, *args, **kwargs):
+        # 走快取，支援If-None-Match -> 304
+        return catalog_response(request, 'types')
+
 class PetSpeciesViewSet(viewsets.ReadOnlyModelViewSet):
     # 提供品種列表，連動式選單
 
@@ -45,13 +138,19 @@ class PetSpeciesViewSet(viewsets.ReadOnlyModelViewSet):
             return PetSpecies.objects.filter(pet_type_id=pet_type_pk)
         return PetSpecies.objects.none() # 如果還沒選type，不提供值
 
+    def list(self, request, *args, **kwargs):
+        return catalog_response(request, f"species:{self.kwargs.get('pet_type_pk')}")
+
 # 體重日誌區
-class WeightLogViewSet(viewsets.ModelViewSet):
+class WeightLogViewSet(ConditionalGetMixin, ArchiveReadMixin, viewsets.ModelViewSet):
     # 提供寵物的體重紀錄的 CRUD API
 
     queryset = WeightLog.objects.all()
     serializer_class = WeightLogSerializer
     permission_classes = [permissions.IsAuthenticated] # 權限：必須登入
+    pagination_class = WeightLogPagination
+    # 封存到LogArchive的舊紀錄也讀得到(pets/archive.py)
+    archive_kind = 'weight'
 
     def get_queryset(self):
         # 回傳指定pet_pk的體重紀錄。
@@ -70,15 +169,51 @@ class WeightLogViewSet(viewsets.ModelViewSet):
         pet = Pet.objects.get(pk=pet_pk, owner=self.request.user)
         serializer.save(pet=pet)
 
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser, NDJSONParser, CSVParser])
+    def bulk(self, request, *args, **kwargs):
+        # 體重計一次上傳多筆：JSON陣列、NDJSON或CSV都可以
+        # URL: /api/pets/{pet_pk}/weight-logs/bulk/
+        pet = get_object_or_404(Pet, pk=self.kwargs.get('pet_pk'), owner=request.user)
+        rows = request.data
+        # JSON陣列是list，NDJSON/CSV是一筆一筆讀的iterator；物件、數字、字串都不收
+        if not isinstance(rows, (list, Iterator)):
+            raise ParseError('需要JSON陣列、NDJSON或CSV格式')
+        result = ingest_weight_logs(pet, rows)
+        return Response(result, status=status.HTTP_201_CREATED if result['created'] else status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'])
+    def series(self, request, *args, **kwargs):
+        # 體重圖表: /api/pets/{pet_pk}/weight-logs/series/?resolution=week&window=4&points=100
+        # resolution: day/week/month，window: 移動平均的桶數，points: 降採樣後最多幾個點
+        pet = get_object_or_404(Pet, pk=self.kwargs.get('pet_pk'), owner=request.user)
+        resolution = request.query_params.get('resolution', 'day')
+        if resolution not in RESOLUTIONS:
+            raise ParseError('resolution只支援day、week、month')
+        try:
+            window = int(request.query_params.get('window', 7))
+            points = int(request.query_params.get('points', 0))
+        except ValueError:
+            raise ParseError('window、points必須是整數')
+        if window < 1:
+            raise ParseError('window至少要是1')
+
+        buckets = add_moving_average(weight_buckets(pet.pk, resolution), window)
+        if points:
+            buckets = downsample_lttb(buckets, points)
+        return Response({'resolution': resolution, 'window': window, 'buckets': buckets})
+
 
 # 健康日誌區
-class HealthLogViewSet(viewsets.ModelViewSet):
+class HealthLogViewSet(ConditionalGetMixin, ArchiveReadMixin, viewsets.ModelViewSet):
     # 提供寵物的健康日誌的 CRUD API
     # 邏輯基本上與體重區相同，多一個圖片上傳
 
     queryset = HealthLog.objects.all()
     serializer_class = HealthLogSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = HealthLogPagination
+    # 封存到LogArchive的舊紀錄也讀得到(pets/archive.py)
+    archive_kind = 'health'
 
     def get_queryset(self):
 
@@ -95,13 +230,80 @@ class HealthLogViewSet(viewsets.ModelViewSet):
         photo = self.request.FILES.get('photo_records')
         serializer.save(pet=pet, photo_records=photo)
 
+    @action(detail=False, methods=['get'])
+    def search(self, request, *args, **kwargs):
+        # 全文搜尋健康日誌: /api/pets/{pet_pk}/health-logs/search/?q=嘔吐&limit=20
+        pet = get_object_or_404(Pet, pk=self.kwargs.get('pet_pk'), owner=request.user)
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            raise ParseError('請輸入搜尋關鍵字q')
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 20)), 100))
+        except ValueError:
+            raise ParseError('limit必須是整數')
+        logs = search_health_logs(pet.pk, query, limit)
+        context = {**self.get_serializer_context(), 'query': query}
+        return Response({'results': HealthLogSearchSerializer(logs, many=True, context=context).data})
+
+    # 照片分段上傳，網路不穩時只要補傳缺的分段
+    # 1. POST   .../health-logs/{pk}/photo-upload/                  {"filename": "a.jpg", "total_chunks": 4}
+    # 2. PUT    .../health-logs/{pk}/photo-upload/{upload_id}/{n}/  body是第n段(從0開始)的原始bytes
+    # 3. POST   .../health-logs/{pk}/photo-upload/{upload_id}/complete/
+    # GET .../photo-upload/{upload_id}/ 可查已收到哪些分段，DELETE 取消上傳
+
+    def _get_upload_session(self, upload_id):
+        return get_object_or_404(UploadSession, pk=upload_id, health_log=self.get_object())
+
+    @action(detail=True, methods=['post'], url_path='photo-upload')
+    def start_photo_upload(self, request, *args, **kwargs):
+        serializer = UploadSessionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save(health_log=self.get_object())
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['get'], url_path=r'photo-upload/(?P<upload_id>[0-9a-f-]+)')
+    def photo_upload(self, request, upload_id, *args, **kwargs):
+        return Response(UploadSessionSerializer(self._get_upload_session(upload_id)).data)
+
+    @photo_upload.mapping.delete
+    def cancel_photo_upload(self, request, upload_id, *args, **kwargs):
+        discard(self._get_upload_session(upload_id))
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['put'], url_path=r'photo-upload/(?P<upload_id>[0-9a-f-]+)/(?P<index>\d+)')
+    def photo_upload_chunk(self, request, upload_id, index, *args, **kwargs):
+        # 不經過DRF的parser，直接從request串流寫進硬碟
+        session = self._get_upload_session(upload_id)
+        index = int(index)
+        if index >= session.total_chunks:
+            raise ParseError(f'分段編號要小於{session.total_chunks}')
+        if request.stream is None:
+            raise ParseError('分段內容是空的')
+        try:
+            size = write_chunk(session, index, request.stream)
+        except ValueError as exc:
+            raise ParseError(str(exc))
+        return Response({'index': index, 'size': size})
+
+    @action(detail=True, methods=['post'], url_path=r'photo-upload/(?P<upload_id>[0-9a-f-]+)/complete')
+    def complete_photo_upload(self, request, upload_id, *args, **kwargs):
+        session = self._get_upload_session(upload_id)
+        try:
+            health_log = attach_to_health_log(session)
+        except ValueError as exc:
+            raise ParseError(str(exc))
+        return Response(HealthLogSerializer(health_log, context=self.get_serializer_context()).data)
+
 # 驅蟲日誌區
-class InjectionLogViewSet(viewsets.ModelViewSet):
+class InjectionLogViewSet(ConditionalGetMixin, ArchiveReadMixin, viewsets.ModelViewSet):
     # 提供寵物的疫苗/驅蟲紀錄的 CRUD API
 
     queryset = InjectionLog.objects.all()
     serializer_class = InjectionLogSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = InjectionLogPagination
+    # 封存到LogArchive的舊紀錄也讀得到(pets/archive.py)
+    archive_kind = 'injection'
 
     def get_queryset(self):
 
@@ -114,4 +316,20 @@ class InjectionLogViewSet(viewsets.ModelViewSet):
 
         pet_pk = self.kwargs.get('pet_pk')
         pet = Pet.objects.get(pk=pet_pk, owner=self.request.user)
-        serializer.save(pet=pet)
\ No newline at end of file
+        serializer.save(pet=pet)
+
+# 離線同步
+class SyncView(APIView):
+    # /api/sync/?since=<上次回傳的cursor>&limit=200，只回傳這之後變動/刪除的寵物與日誌(pets/sync.py)
+    # 第一次不帶since就是完整同步；has_more為true時用回傳的cursor繼續拿
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        try:
+            limit = int(request.query_params.get('limit', SYNC_PAGE_SIZE))
+        except ValueError:
+            raise ParseError('limit必須是整數')
+        if not 1 <= limit <= SYNC_MAX_PAGE_SIZE:
+            raise ParseError(f'limit要在1到{SYNC_MAX_PAGE_SIZE}之間')
+        return Response(sync_page(request.user, request.query_params.get('since'), limit,
+                                  context={'request': request}))
@@ -0,0 +1,144 @@
+# pets/weight_trends.py
+# 體重異常偵測：每筆體重紀錄存著依日期排到這一筆為止的統計
+#   trend_kg            指數加權平均(EWMA)，間隔不固定，用半衰期換算權重：隔越久新的一筆佔越多
+#   trend_variance      指數加權變異數，判斷這一筆跟趨勢差幾個標準差
+#   rate_kg_per_week    每週變化量(前後兩筆的變化換算成每週，再做一次指數加權)
+# 新增日期最新的一筆：讀前一筆的統計算一步就好(O(1))
+# 補記/修改/刪除較早的日期：從那一筆往後重算(通常只有幾筆)；歷史資料用 manage.py recompute_weight_trends
+# 封存(pets/archive.py)的舊體重也算在序列裡：要從封存資料的範圍內開始算時，整隻寵物合併封存的紀錄從頭重算
+
+import heapq
+import math
+from types import SimpleNamespace
+
+from django.db.models import Max, Q
+
+from .archive import archived_values
+from .models import ChangeCounter, LogArchive, PetSummary, WeightAnomaly, WeightLog
+
+HALF_LIFE_DAYS = 14
+# 前幾筆資料太少，不判斷異常
+MIN_READINGS = 3
+OUTLIER_SCORE = 3.0
+# 每週變化超過趨勢體重的百分之幾
+RAPID_LOSS_PERCENT_PER_WEEK = 2.0
+RAPID_GAIN_PERCENT_PER_WEEK = 3.0
+# 體重計的誤差，標準差不會算得比這個小(變異數剛開始是0)
+NOISE_FLOOR_KG = 0.05
+
+TREND_FIELDS = ['trend_kg', 'trend_variance', 'rate_kg_per_week', 'reading_count', 'anomaly', 'anomaly_score']
+TREND_ONLY = ['pk', 'pet_id', 'weight_kg', 'recorded_at', *TREND_FIELDS]
+
+
+def step(previous, weight_kg, recorded_at):
+    # previous: 前一筆(已經有統計)或None；回傳這一筆的統計dict
+    weight = float(weight_kg)
+    if previous is None or previous.trend_kg is None:
+        return {'trend_kg': weight, 'trend_variance': 0.0, 'rate_kg_per_week': 0.0, 'reading_count': 1,
+                'anomaly': WeightAnomaly.NONE, 'anomaly_score': None}
+
+    days = (recorded_at - previous.recorded_at).days
+    # 同一天量好幾次當成隔一天
+    alpha = 1 - 0.5 ** (max(days, 1) / HALF_LIFE_DAYS)
+    deviation = weight - previous.trend_kg
+    score = deviation / math.sqrt(previous.trend_variance + NOISE_FLOOR_KG ** 2)
+    trend = previous.trend_kg + alpha * deviation
+    variance = (1 - alpha) * (previous.trend_variance + alpha * deviation ** 2)
+    rate = previous.rate_kg_per_week
+    if days > 0:
+        rate += alpha * ((weight - float(previous.weight_kg)) / days * 7 - rate)
+    count = previous.reading_count + 1
+
+    anomaly = WeightAnomaly.NONE
+    # 體重0(資料有誤)時不換算百分比
+    if count > MIN_READINGS and trend > 0:
+        weekly_percent = rate / trend * 100
+        # 體重下降最重要，先判斷
+        if weekly_percent <= -RAPID_LOSS_PERCENT_PER_WEEK:
+            anomaly = WeightAnomaly.RAPID_LOSS
+        elif abs(score) >= OUTLIER_SCORE:
+            anomaly = WeightAnomaly.OUTLIER
+        elif weekly_percent >= RAPID_GAIN_PERCENT_PER_WEEK:
+            anomaly = WeightAnomaly.RAPID_GAIN
+    return {'trend_kg': round(trend, 4), 'trend_variance': round(variance, 6), 'rate_kg_per_week': round(rate, 4),
+            'reading_count': count, 'anomaly': anomaly, 'anomaly_score': round(score, 2)}
+
+
+def update_trends(pet_id, since=None, change_seq=None, instance=None):
+    # 從since=(日期, id)這個位置(含)往後重算，None表示整隻寵物重算；回傳更新了幾筆
+    # change_seq: 呼叫端在同一個transaction裡拿到的同步序號；None就每個主人另外拿
+    # instance: 剛存檔的那一筆，算出來的統計也寫回去(API回應直接用它序列化)
+    logs = WeightLog.objects.filter(pet_id=pet_id).only(*TREND_ONLY)
+    archived_until = (LogArchive.objects.filter(pet_id=pet_id, kind='weight')
+                      .aggregate(last=Max('last_date'))['last'])
+    previous = None
+    if since is not None:
+        date, pk = since
+        before = Q(recorded_at__lt=date) | Q(recorded_at=date, id__lt=pk)
+        previous = logs.filter(before).order_by('-recorded_at', '-id').first()
+        if archived_until is None or (previous is not None and previous.recorded_at > archived_until):
+            logs = logs.exclude(before)
+        else:
+            # 前一筆在封存包裡(或前後夾著封存的紀錄)，從頭合併重算
+            previous = None
+            since = None
+
+    readings = logs.order_by('recorded_at', 'id').iterator(chunk_size=1000)
+    if since is None and archived_until is not None:
+        readings = heapq.merge(_archived_readings(pet_id), readings, key=lambda log: (log.recorded_at, log.pk))
+
+    changed = []
+    for log in readings:
+        stats = step(previous, log.weight_kg, log.recorded_at)
+        if isinstance(log, SimpleNamespace):
+            # 封存的紀錄只用來接續計算，不寫回
+            previous = SimpleNamespace(**stats, pk=log.pk, weight_kg=log.weight_kg, recorded_at=log.recorded_at)
+            continue
+        if any(getattr(log, name) != value for name, value in stats.items()):
+            for name, value in stats.items():
+                setattr(log, name, value)
+            changed.append(log)
+        if instance is not None and log.pk == instance.pk:
+            for name, value in stats.items():
+                setattr(instance, name, value)
+        previous = log
+
+    if changed:
+        if change_seq is None:
+            WeightLog.objects.bulk_update(changed, TREND_FIELDS, batch_size=1000)
+            ChangeCounter.bump(WeightLog.objects.filter(pk__in=[log.pk for log in changed]))
+        else:
+            for log in changed:
+                log.change_seq = change_seq
+            WeightLog.objects.bulk_update(changed, [*TREND_FIELDS, 'change_seq'], batch_size=1000)
+    # 最後一筆就是最新的體重
+    PetSummary.objects.filter(pet_id=pet_id).update(
+        weight_trend_kg=previous.trend_kg if previous else None,
+        weight_rate_kg_per_week=previous.rate_kg_per_week if previous else None,
+        weight_anomaly=previous.anomaly if previous else WeightAnomaly.NONE,
+    )
+    return len(changed)
+
+
+def _archived_readings(pet_id):
+    # 封存包的日期範圍可能重疊(不同時間封存的)，全部讀出來依(日期, id)排好
+    rows = archived_values(pet_id, 'weight', ['id', 'recorded_at', 'weight_kg'])
+    return sorted((SimpleNamespace(pk=row['id'], recorded_at=row['recorded_at'], weight_kg=row['weight_kg'])
+                   for row in rows), key=lambda log: (log.recorded_at, log.pk))
+
+
+def weight_log_saved(log, created):
+    position = (log.recorded_at, log.pk)
+    loaded = getattr(log, '_loaded_recorded_at', None)
+    if not created and loaded is None:
+        # 不知道原本的日期，整隻重算
+        position = None
+    elif not created and loaded < log.recorded_at:
+        # 日期往後改：原本位置之後的都要重算
+        position = (loaded, log.pk)
+    update_trends(log.pet_id, position, change_seq=log.change_seq, instance=log)
+    log._loaded_recorded_at = log.recorded_at
+
+
+def weight_log_deleted(log, change_seq):
+    update_trends(log.pet_id, (log.recorded_at, log.pk), change_seq=change_seq)